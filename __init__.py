@@ -10,17 +10,386 @@ bl_info = {
     "category": "Camera",
 }
 
+import time
 import bpy
-from bpy.props import BoolProperty
-from bpy.types import Panel, Operator
+import numpy as np
+from bpy.app.handlers import persistent
+from bpy.props import (BoolProperty, EnumProperty, FloatProperty, FloatVectorProperty, IntProperty,
+                       PointerProperty, StringProperty)
+from bpy.types import Panel, Operator, PropertyGroup
+from bpy_extras.io_utils import ExportHelper
 
 # Import our modules
 from . import websocket_server
 from . import camera_controller
+from . import coordinate_mapping
+from . import metrics
+from . import profiling
+from . import take_processing
+from . import viewport_preview
+from .change_detection import POSITION_EPSILON, ANGLE_EPSILON
+from .channel_schema import ChannelSchema
+from .freed import Calibration, FREED_PORT, ANY_CAMERA
+from .osc_input import parse_routes, DEFAULT_ROUTES, OSC_PORT
+from .imu_fusion import MADGWICK, MAHONY
+from .jitter_buffer import DEFAULT_LATENCY, MAX_DELAY
+from .replay_buffer import DEFAULT_SECONDS
+from .take_file import TakeFile, write_take
 
 # Global variable to track server state
 server_running = False
 
+# Why the last mapping settings could not be used, shown in the panel
+mapping_error = None
+
+# Why the FreeD listener could not start, shown in the panel
+freed_error = None
+
+# Why the OSC listener could not start, shown in the panel
+osc_error = None
+
+# Why the last custom channel list could not be used, shown in the panel
+channel_error = None
+
+# Take file the timeline is scrubbing through, if any
+scrub_take = None
+
+AXIS_ITEMS = [(axis, axis, f"Sender {axis} axis") for axis in coordinate_mapping.AXES]
+
+def update_viewport_preview(self, context):
+    """Commit the camera and restore camera views when preview mode is turned off"""
+    if not self.viewport_preview:
+        viewport_preview.stop_preview(context.scene.camera)
+    # The viewports need the next pose whether or not it moved
+    websocket_server.change_detector.forget()
+
+def mapping_profile(settings):
+    """Build the MappingProfile described by the panel settings"""
+    if settings.mapping_preset == 'CUSTOM':
+        return coordinate_mapping.MappingProfile(
+            (settings.world_x, settings.world_y, settings.world_z),
+            (settings.camera_x, settings.camera_y, settings.camera_z),
+            settings.mapping_scale,
+            settings.mapping_offset,
+        )
+    return coordinate_mapping.MappingProfile.preset(
+        settings.mapping_preset, settings.mapping_scale, settings.mapping_offset)
+
+def update_mapping(self, context):
+    """Recompile the coordinate mapping; invalid settings keep the previous mapping"""
+    global mapping_error
+    try:
+        websocket_server.mapper.set_profile(mapping_profile(self))
+        mapping_error = None
+    except ValueError as e:
+        mapping_error = str(e)
+        print(f"Invalid coordinate mapping: {e}")
+
+def update_channels(self, context):
+    """Recompile the channel schema; an invalid list keeps the previous schema"""
+    global channel_error
+    try:
+        websocket_server.set_channel_schema(ChannelSchema.with_custom(self.custom_channels))
+        channel_error = None
+    except ValueError as e:
+        channel_error = str(e)
+        print(f"Invalid custom channels: {e}")
+
+def update_jitter_buffer(self, context):
+    """Pass the jitter buffer settings to the receiving threads"""
+    websocket_server.jitter.configure(self.jitter_buffer, self.jitter_latency / 1000.0, self.jitter_adaptive)
+
+def update_dead_band(self, context):
+    """Pass the dead-band epsilons to the apply path"""
+    websocket_server.change_detector.configure(self.dead_band_position, self.dead_band_angle)
+
+def update_replay(self, context):
+    """Resize the replay buffer for a new window; this forgets what it held"""
+    if websocket_server.replay.seconds != self.replay_seconds:
+        websocket_server.replay.resize(self.replay_seconds)
+
+def update_imu_fusion(self, context):
+    """Pass the fusion filter settings to the receiving threads"""
+    websocket_server.fusion.configure(self.imu_filter, self.imu_gain or None, self.imu_position)
+
+def freed_calibration(counts, values):
+    """Calibration from a raw count range and the lens values at its ends, or None if unset"""
+    if counts[0] == counts[1]:
+        return None
+    return Calibration(counts[0], counts[1], values[0], values[1])
+
+def update_freed(self, context):
+    """Start, restart or stop the FreeD listener to match the settings while the server runs"""
+    global freed_error
+    if not (server_running and self.freed_enabled):
+        websocket_server.stop_freed_listener()
+        freed_error = None
+        return
+    try:
+        websocket_server.start_freed_listener(
+            self.freed_port, self.freed_camera_id,
+            freed_calibration(self.freed_zoom_counts, self.freed_lens_range),
+            freed_calibration(self.freed_focus_counts, self.freed_focus_range))
+        freed_error = None
+    except (OSError, ValueError) as e:
+        freed_error = str(e)
+        print(f"Could not start FreeD listener: {e}")
+
+def update_osc(self, context):
+    """Start, restart or stop the OSC listener to match the settings while the server runs"""
+    global osc_error
+    if not (server_running and self.osc_enabled):
+        websocket_server.stop_osc_listener()
+        osc_error = None
+        return
+    try:
+        websocket_server.start_osc_listener(self.osc_port, parse_routes(self.osc_routes))
+        osc_error = None
+    except (OSError, ValueError) as e:
+        osc_error = str(e)
+        print(f"Could not start OSC listener: {e}")
+
+def poll_mapping_anchor(self, obj):
+    """The camera can't be its own anchor"""
+    return obj is not self.id_data.camera
+
+@persistent
+def load_settings(dummy):
+    """Use the settings saved with a freshly loaded file"""
+    # Loading a file ends modal operators, so the app timer takes the apply loop back
+    if websocket_server.apply_loop == 'MODAL':
+        websocket_server.set_apply_loop('TIMER')
+    
+    # The scrub handler went with the old file; the take it read goes too
+    stop_scrubbing()
+    
+    settings = bpy.context.scene.camera_motion
+    update_mapping(settings, bpy.context)
+    update_channels(settings, bpy.context)
+    update_jitter_buffer(settings, bpy.context)
+    update_dead_band(settings, bpy.context)
+    update_replay(settings, bpy.context)
+    update_imu_fusion(settings, bpy.context)
+    update_freed(settings, bpy.context)
+    update_osc(settings, bpy.context)
+
+def axis_property(name, default):
+    return EnumProperty(name=name, items=AXIS_ITEMS, default=default, update=update_mapping)
+
+class CameraMotionSettings(PropertyGroup):
+    viewport_preview: BoolProperty(
+        name="Viewport Preview",
+        description="Move viewports that look through the camera directly, skipping the "
+                    "depsgraph update of the camera. Keeps monitoring smooth in heavy scenes",
+        default=False,
+        update=update_viewport_preview,
+    )
+    commit_rate: FloatProperty(
+        name="Commit Rate",
+        description="How often the scene camera is updated while previewing (0 = only on demand)",
+        default=2.0,
+        min=0.0,
+        max=60.0,
+    )
+    mapping_preset: EnumProperty(
+        name="Sender Axes",
+        description="Coordinate convention the sender uses",
+        items=[
+            ('BLENDER', "Blender (Z Up)", "Sender already uses Blender's axes"),
+            ('Y_UP', "Y Up (ARKit/WebXR)", "Y up, right-handed, camera looking down -Z"),
+            ('UNITY', "Unity", "Y up, left-handed, camera looking down +Z"),
+            ('CUSTOM', "Custom", "Pick the sender axis behind each Blender axis"),
+        ],
+        default='BLENDER',
+        update=update_mapping,
+    )
+    world_x: axis_property("World X", 'X')
+    world_y: axis_property("World Y", 'Y')
+    world_z: axis_property("World Z", 'Z')
+    camera_x: axis_property("Camera X", 'X')
+    camera_y: axis_property("Camera Y", 'Y')
+    camera_z: axis_property("Camera Z", 'Z')
+    mapping_scale: FloatProperty(
+        name="Scale",
+        description="Blender units per sender unit, e.g. 0.01 for centimeters",
+        default=1.0,
+        update=update_mapping,
+    )
+    mapping_offset: FloatVectorProperty(
+        name="Origin Offset",
+        description="Where the sender's origin sits in Blender, after scaling",
+        subtype='TRANSLATION',
+        size=3,
+        update=update_mapping,
+    )
+    mapping_anchor: PointerProperty(
+        name="Anchor",
+        description="Object the mapped poses are parented to, e.g. a dolly or crane rig",
+        type=bpy.types.Object,
+        poll=poll_mapping_anchor,
+    )
+    custom_channels: StringProperty(
+        name="Custom Channels",
+        description="Comma-separated custom properties senders may drive, e.g. \"shutter, iso\". "
+                    "LENS, FOCUS and APERTURE are always understood",
+        default="",
+        update=update_channels,
+    )
+    jitter_buffer: BoolProperty(
+        name="Jitter Buffer",
+        description="Hold poses for a short delay and play them out evenly, smoothing "
+                    "the clumps Wi-Fi delivers them in",
+        default=False,
+        update=update_jitter_buffer,
+    )
+    jitter_latency: FloatProperty(
+        name="Latency Target",
+        description="Playout delay in milliseconds; adaptive mode may raise it when "
+                    "arrivals get burstier",
+        default=DEFAULT_LATENCY * 1000.0,
+        min=0.0,
+        max=MAX_DELAY * 1000.0,
+        update=update_jitter_buffer,
+    )
+    jitter_adaptive: BoolProperty(
+        name="Adaptive",
+        description="Grow or shrink the delay with the observed arrival jitter",
+        default=True,
+        update=update_jitter_buffer,
+    )
+    dead_band_position: FloatProperty(
+        name="Position Dead-Band",
+        description="Skip writing poses that moved the camera less than this",
+        subtype='DISTANCE',
+        default=POSITION_EPSILON,
+        min=0.0,
+        precision=5,
+        update=update_dead_band,
+    )
+    dead_band_angle: FloatProperty(
+        name="Angle Dead-Band",
+        description="Skip writing poses that turned the camera less than this",
+        subtype='ANGLE',
+        default=ANGLE_EPSILON,
+        min=0.0,
+        precision=4,
+        update=update_dead_band,
+    )
+    replay_seconds: FloatProperty(
+        name="Replay Length",
+        description="Seconds of received poses always kept, so a move can be saved "
+                    "after the fact. Changing it clears what was kept",
+        subtype='TIME',
+        unit='TIME',
+        default=DEFAULT_SECONDS,
+        min=1.0,
+        max=600.0,
+        update=update_replay,
+    )
+    take_file: StringProperty(
+        name="Take File",
+        description="File each recorded take is also saved to, and that Scrub Take File plays back "
+                    "at the timeline's frame",
+        subtype='FILE_PATH',
+        default="",
+    )
+    imu_filter: EnumProperty(
+        name="IMU Filter",
+        description="Filter fusing raw IMU samples into the camera's orientation",
+        items=[
+            (MADGWICK, "Madgwick", "Gradient-descent filter; smooth and cheap"),
+            (MAHONY, "Mahony", "Complementary filter that also learns the gyroscope bias"),
+        ],
+        default=MADGWICK,
+        update=update_imu_fusion,
+    )
+    imu_gain: FloatProperty(
+        name="Gain",
+        description="How strongly gravity and the magnetometer pull gyroscope drift back; "
+                    "higher reacts faster but shakes more (0 = the filter's default)",
+        default=0.0,
+        min=0.0,
+        max=10.0,
+        update=update_imu_fusion,
+    )
+    imu_position: BoolProperty(
+        name="Track Position",
+        description="Also integrate acceleration into position. Only holds up for moves of a "
+                    "few seconds between pauses; otherwise the camera stays at the origin",
+        default=False,
+        update=update_imu_fusion,
+    )
+    freed_enabled: BoolProperty(
+        name="FreeD Input",
+        description="Also receive FreeD D1 packets from a camera tracking system while the server runs",
+        default=False,
+        update=update_freed,
+    )
+    freed_port: IntProperty(
+        name="UDP Port",
+        description="Port the tracking system sends FreeD packets to",
+        default=FREED_PORT,
+        min=1,
+        max=65535,
+        update=update_freed,
+    )
+    freed_camera_id: IntProperty(
+        name="Camera ID",
+        description="FreeD camera to follow (-1 = any)",
+        default=ANY_CAMERA,
+        min=ANY_CAMERA,
+        max=255,
+        update=update_freed,
+    )
+    freed_zoom_counts: FloatVectorProperty(
+        name="Zoom Counts",
+        description="Zoom encoder counts at the wide and tele ends; equal values leave the lens alone",
+        size=2,
+        update=update_freed,
+    )
+    freed_lens_range: FloatVectorProperty(
+        name="Focal Length",
+        description="Focal length in millimetres at the wide and tele ends",
+        size=2,
+        default=(24.0, 70.0),
+        update=update_freed,
+    )
+    freed_focus_counts: FloatVectorProperty(
+        name="Focus Counts",
+        description="Focus encoder counts at the near and far ends; equal values leave focus alone",
+        size=2,
+        update=update_freed,
+    )
+    freed_focus_range: FloatVectorProperty(
+        name="Focus Distance",
+        description="Focus distance at the near and far ends",
+        subtype='TRANSLATION',
+        size=2,
+        default=(0.5, 10.0),
+        update=update_freed,
+    )
+    osc_enabled: BoolProperty(
+        name="OSC Input",
+        description="Also receive OSC from control surfaces and other applications while the server runs",
+        default=False,
+        update=update_osc,
+    )
+    osc_port: IntProperty(
+        name="UDP Port",
+        description="Port OSC senders send to",
+        default=OSC_PORT,
+        min=1,
+        max=65535,
+        update=update_osc,
+    )
+    osc_routes: StringProperty(
+        name="Routes",
+        description="Which pose fields or channels each OSC address drives, as "
+                    "\"/address=FIELD FIELD; ...\", e.g. \"/fader1=LENS\"",
+        default=DEFAULT_ROUTES,
+        update=update_osc,
+    )
+
 class CAMERA_MOTION_PT_main_panel(Panel):
     bl_label = "Camera Motion Receiver"
     bl_idname = "CAMERA_MOTION_PT_main_panel"
@@ -47,6 +416,8 @@ class CAMERA_MOTION_PT_main_panel(Panel):
             row.operator("camera_motion.start_server", text="Start Server", icon='PLAY')
         else:
             row.operator("camera_motion.stop_server", text="Stop Server", icon='PAUSE')
+            modal = websocket_server.apply_loop == 'MODAL'
+            row.operator("camera_motion.apply_loop", text="Modal Apply", icon='TIME', depress=modal)
         
         # Camera info
         box = layout.box()
@@ -57,8 +428,178 @@ class CAMERA_MOTION_PT_main_panel(Panel):
             box.label(text=f"Name: {camera.name}")
             box.label(text=f"Location: ({camera.location.x:.2f}, {camera.location.y:.2f}, {camera.location.z:.2f})")
             box.label(text=f"Rotation: ({camera.rotation_euler.x:.2f}, {camera.rotation_euler.y:.2f}, {camera.rotation_euler.z:.2f})")
+            box.operator("camera_motion.process_take", text="Clean Up Take", icon='SMOOTHCURVE')
         else:
             box.label(text="No active camera", icon='ERROR')
+        
+        # Depsgraph-free preview
+        settings = scene.camera_motion
+        box = layout.box()
+        row = box.row()
+        row.prop(settings, "viewport_preview")
+        row.operator("camera_motion.commit_preview", text="", icon='CHECKMARK')
+        if settings.viewport_preview:
+            box.prop(settings, "commit_rate", text="Commit Rate (Hz)")
+        
+        # Sender coordinate convention
+        box = layout.box()
+        box.prop(settings, "mapping_preset")
+        if settings.mapping_preset == 'CUSTOM':
+            row = box.row(align=True)
+            row.label(text="World")
+            row.prop(settings, "world_x", text="")
+            row.prop(settings, "world_y", text="")
+            row.prop(settings, "world_z", text="")
+            row = box.row(align=True)
+            row.label(text="Camera")
+            row.prop(settings, "camera_x", text="")
+            row.prop(settings, "camera_y", text="")
+            row.prop(settings, "camera_z", text="")
+        box.prop(settings, "mapping_scale")
+        box.prop(settings, "mapping_offset")
+        box.prop(settings, "mapping_anchor")
+        if mapping_error:
+            box.label(text=mapping_error, icon='ERROR')
+        
+        # Channels besides the pose
+        box = layout.box()
+        box.prop(settings, "custom_channels")
+        if channel_error:
+            box.label(text=channel_error, icon='ERROR')
+        
+        # Steady playout at a known latency
+        box = layout.box()
+        box.prop(settings, "jitter_buffer")
+        if settings.jitter_buffer:
+            jitter = websocket_server.jitter
+            row = box.row()
+            row.prop(settings, "jitter_latency", text="Latency (ms)")
+            row.prop(settings, "jitter_adaptive")
+            box.label(text=f"Latency: {jitter.delay * 1000:.0f} ms   Jitter: {jitter.jitter * 1000:.1f} ms   "
+                           f"Held: {len(jitter)}")
+            box.label(text=f"Underruns: {jitter.underruns}   Overruns: {jitter.overruns}   Late: {jitter.late}")
+        
+        # Skip writes while the sender holds still
+        box = layout.box()
+        box.label(text="Dead-Band:")
+        row = box.row(align=True)
+        row.prop(settings, "dead_band_position", text="Position")
+        row.prop(settings, "dead_band_angle", text="Angle")
+        
+        # Fusion of raw IMU samples
+        box = layout.box()
+        box.label(text="IMU Fusion:")
+        row = box.row(align=True)
+        row.prop(settings, "imu_filter", text="")
+        row.prop(settings, "imu_gain")
+        box.prop(settings, "imu_position")
+        
+        # Studio camera tracking over FreeD
+        box = layout.box()
+        box.prop(settings, "freed_enabled")
+        if settings.freed_enabled:
+            row = box.row(align=True)
+            row.prop(settings, "freed_port")
+            row.prop(settings, "freed_camera_id")
+            box.prop(settings, "freed_zoom_counts")
+            box.prop(settings, "freed_lens_range")
+            box.prop(settings, "freed_focus_counts")
+            box.prop(settings, "freed_focus_range")
+            listener = websocket_server.freed_listener
+            if listener:
+                box.label(text=f"Packets: {listener.received}   Bad: {listener.errors}   "
+                               f"Other cameras: {listener.ignored}")
+            if freed_error:
+                box.label(text=freed_error, icon='ERROR')
+        
+        # Control surfaces over OSC
+        box = layout.box()
+        box.prop(settings, "osc_enabled")
+        if settings.osc_enabled:
+            box.prop(settings, "osc_port")
+            box.prop(settings, "osc_routes")
+            listener = websocket_server.osc_listener
+            if listener:
+                receiver = listener.receiver
+                box.label(text=f"Messages: {receiver.messages}   Unrouted: {receiver.unrouted}   "
+                               f"Unsupported: {receiver.unsupported}   Bad: {receiver.errors}")
+            if osc_error:
+                box.label(text=osc_error, icon='ERROR')
+        
+        # Frame-accurate take recording
+        recorder = websocket_server.recorder
+        box = layout.box()
+        if recorder.recording:
+            box.operator("camera_motion.toggle_recording", text="Stop Recording", icon='PAUSE')
+            box.label(text=f"{recorder.sample_count} samples from frame {recorder.start_frame}")
+        else:
+            box.operator("camera_motion.toggle_recording", text="Record Take", icon='REC')
+        
+        # Instant replay of the last few seconds, recorded or not
+        row = box.row(align=True)
+        row.operator("camera_motion.save_replay", text=f"Save Last {settings.replay_seconds:g}s", icon='RECOVER_LAST')
+        row.prop(settings, "replay_seconds", text="")
+        
+        # Seekable take file, saved on every recording and scrubbed from the timeline
+        box.prop(settings, "take_file")
+        if scrub_take is not None:
+            box.operator("camera_motion.scrub_take", text="Stop Scrubbing", icon='PAUSE')
+            box.label(text=f"{len(scrub_take)} samples, {scrub_take.end_time - scrub_take.start_time:.1f} s")
+        else:
+            box.operator("camera_motion.scrub_take", icon='PLAY')
+
+class CAMERA_MOTION_PT_metrics_panel(Panel):
+    bl_label = "Live Metrics"
+    bl_idname = "CAMERA_MOTION_PT_metrics_panel"
+    bl_space_type = 'VIEW_3D'
+    bl_region_type = 'UI'
+    bl_category = 'Camera Motion'
+    bl_parent_id = "CAMERA_MOTION_PT_main_panel"
+    bl_options = {'DEFAULT_CLOSED'}
+
+    def draw(self, context):
+        layout = self.layout
+        snapshot = metrics.registry.snapshot()
+        counters = snapshot['counters']
+        apply_time = snapshot['timers']['apply']
+        
+        # Pipeline throughput
+        col = layout.column(align=True)
+        col.label(text=f"Received: {counters['poses_received_total']}   Applied: {counters['poses_applied_total']}   "
+                       f"Unchanged: {counters['writes_skipped_total']}")
+        col.label(text=f"Dropped: {counters['poses_dropped_total']}   Parse errors: {counters['parse_errors_total']}")
+        col.label(text=f"Stale: {counters['poses_stale_total']}   Gaps: {counters['sequence_gaps_total']}   "
+                       f"Reordered: {counters['poses_reordered_total']}")
+        col.label(text=f"Apply rate: {websocket_server.apply_meter.current():.1f} Hz   "
+                       f"Queue: {snapshot['gauges']['queue_depth']}")
+        col.label(text=f"Apply time: {apply_time['average_ms']:.2f} ms avg, {apply_time['max_ms']:.2f} ms max")
+        for label, ticks in (("Timer", websocket_server.timer_ticks), ("Modal", websocket_server.modal_ticks)):
+            if ticks.count > 1:
+                col.label(text=f"{label} loop: {ticks.rate:.1f} Hz, jitter {ticks.jitter * 1000:.2f} ms")
+        col.label(text=f"Clock round trip: {snapshot['gauges']['clock_round_trip_seconds'] * 1000:.1f} ms   "
+                       f"Drift: {snapshot['gauges']['clock_drift_ppm']:.0f} ppm")
+        
+        # Per-client receive rates
+        box = layout.box()
+        if snapshot['clients']:
+            for client_id, stats in snapshot['clients'].items():
+                box.label(text=f"{client_id}: {stats['rate']:.1f} Hz ({stats['received']})", icon='LINKED')
+        else:
+            box.label(text="No clients connected", icon='UNLINKED')
+        
+        # Opt-in pipeline profiling
+        box = layout.box()
+        row = box.row()
+        if profiling.enabled:
+            row.operator("camera_motion.toggle_profiling", text="Stop Profiling", icon='REC')
+        else:
+            row.operator("camera_motion.toggle_profiling", text="Start Profiling", icon='TIME')
+        row.operator("camera_motion.export_profile", text="", icon='EXPORT')
+        
+        if profiling.span_count():
+            box.label(text=f"{profiling.span_count()} spans, 1 in {profiling.sample_every} sampled")
+            for name, (count, average_us, max_us) in sorted(profiling.summary().items()):
+                box.label(text=f"{name}: {average_us:.0f} µs avg, {max_us:.0f} µs max")
 
 class CAMERA_MOTION_OT_start_server(Operator):
     bl_idname = "camera_motion.start_server"
@@ -71,6 +612,8 @@ class CAMERA_MOTION_OT_start_server(Operator):
             try:
                 websocket_server.start_server()
                 server_running = True
+                update_freed(context.scene.camera_motion, context)
+                update_osc(context.scene.camera_motion, context)
                 self.report({'INFO'}, "WebSocket server started on localhost:8765")
             except Exception as e:
                 self.report({'ERROR'}, f"Failed to start server: {str(e)}")
@@ -92,11 +635,344 @@ class CAMERA_MOTION_OT_stop_server(Operator):
                 self.report({'ERROR'}, f"Failed to stop server: {str(e)}")
         return {'FINISHED'}
 
+class CAMERA_MOTION_OT_apply_loop(Operator):
+    bl_idname = "camera_motion.apply_loop"
+    bl_label = "Modal Apply Loop"
+    bl_description = ("Apply poses from a modal operator with its own window timer instead of an app "
+                      "timer, with a proper window context. Run again to go back to the app timer")
+    
+    # Bumped by every start, so an instance that was handed back never resumes
+    _generation = 0
+    
+    @classmethod
+    def poll(cls, context):
+        return server_running and context.window is not None
+    
+    def invoke(self, context, event):
+        if websocket_server.apply_loop == 'MODAL':
+            # The running instance ends on its next event
+            websocket_server.set_apply_loop('TIMER')
+            return {'FINISHED'}
+        
+        type(self)._generation += 1
+        self.generation = type(self)._generation
+        self.last_tick = None
+        wm = context.window_manager
+        self.timer = wm.event_timer_add(websocket_server.APPLY_INTERVAL, window=context.window)
+        wm.modal_handler_add(self)
+        websocket_server.set_apply_loop('MODAL')
+        return {'RUNNING_MODAL'}
+    
+    def modal(self, context, event):
+        if (websocket_server.apply_loop != 'MODAL' or not websocket_server.server_running
+                or self.generation != type(self)._generation):
+            self.finish(context)
+            return {'FINISHED'}
+        
+        # Other timers send TIMER events too; ours has fired when its duration moved on
+        if event.type == 'TIMER' and self.timer.time_duration != self.last_tick:
+            self.last_tick = self.timer.time_duration
+            websocket_server.apply_tick(websocket_server.modal_ticks, context)
+        return {'PASS_THROUGH'}
+    
+    def cancel(self, context):
+        self.finish(context)
+    
+    def finish(self, context):
+        context.window_manager.event_timer_remove(self.timer)
+        if websocket_server.apply_loop == 'MODAL' and self.generation == type(self)._generation:
+            websocket_server.set_apply_loop('TIMER')
+
+class CAMERA_MOTION_OT_commit_preview(Operator):
+    bl_idname = "camera_motion.commit_preview"
+    bl_label = "Commit Preview"
+    bl_description = "Write the previewed pose to the scene camera now"
+    
+    def execute(self, context):
+        if viewport_preview.commit(context.scene.camera):
+            self.report({'INFO'}, "Previewed pose committed to the camera")
+        else:
+            self.report({'INFO'}, "Camera is already up to date")
+        return {'FINISHED'}
+
+def key_take(camera, take):
+    """Key a (frames, values, channels) take on camera and return its frames
+    
+    The camera switches to the rotation form the take was recorded in; keys
+    outside the take's frames are kept. Lens and other channel columns are
+    keyed where they belong, e.g. on the camera data.
+    """
+    frames, values, channels = take
+    if any(path == 'rotation_quaternion' for path, _ in channels):
+        camera.rotation_mode = 'QUATERNION'
+    elif camera.rotation_mode in {'QUATERNION', 'AXIS_ANGLE'}:
+        camera.rotation_mode = 'XYZ'
+    camera_controller.CameraController.set_channel_curves(camera, frames, values, channels, merge=True)
+    return frames
+
+class CAMERA_MOTION_OT_toggle_recording(Operator):
+    bl_idname = "camera_motion.toggle_recording"
+    bl_label = "Toggle Recording"
+    bl_description = "Record every received pose as keyframes on the frames it was captured on"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.camera is not None
+    
+    def execute(self, context):
+        scene = context.scene
+        recorder = websocket_server.recorder
+        if not recorder.recording:
+            recorder.start(scene.frame_current, scene.render.fps / scene.render.fps_base)
+            self.report({'INFO'}, f"Recording from frame {scene.frame_current}")
+            return {'FINISHED'}
+        
+        take = recorder.stop()
+        if take is None:
+            self.report({'WARNING'}, "No poses were received while recording")
+            return {'CANCELLED'}
+        
+        frames = key_take(scene.camera, take)
+        message = f"Recorded {len(frames)} samples over frames {frames[0]:.1f}-{frames[-1]:.1f}"
+        
+        path = scene.camera_motion.take_file
+        if path:
+            if scrub_take is not None and scrub_take.path == bpy.path.abspath(path):
+                stop_scrubbing()
+            try:
+                write_take(bpy.path.abspath(path), take, recorder.start_frame, recorder.fps)
+                message += f", saved to {path}"
+            except (OSError, ValueError) as e:
+                self.report({'WARNING'}, f"{message}, but saving the take file failed: {e}")
+                return {'FINISHED'}
+        
+        self.report({'INFO'}, message)
+        return {'FINISHED'}
+
+class CAMERA_MOTION_OT_save_replay(Operator):
+    bl_idname = "camera_motion.save_replay"
+    bl_label = "Save Replay"
+    bl_description = "Key the last seconds of received poses on the camera, starting at the current frame"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.camera is not None
+    
+    def execute(self, context):
+        scene = context.scene
+        fps = scene.render.fps / scene.render.fps_base
+        take = websocket_server.replay.take(scene.camera_motion.replay_seconds, scene.frame_current, fps)
+        if take is None:
+            self.report({'WARNING'}, "No poses have been received yet")
+            return {'CANCELLED'}
+        
+        frames = key_take(scene.camera, take)
+        self.report({'INFO'}, f"Saved {len(frames)} samples over frames {frames[0]:.1f}-{frames[-1]:.1f}")
+        return {'FINISHED'}
+
+def scrub_frame(scene, depsgraph=None):
+    """Apply the scrubbed take's pose at the scene's current frame"""
+    if scrub_take is None or not scene.camera:
+        return
+    # Frames map to take time as they did when the take was keyed
+    seconds = (scene.frame_current + scene.frame_subframe - scrub_take.start_frame) / scrub_take.fps
+    websocket_server.apply_camera_motion(scrub_take.pose_at(seconds, websocket_server.channel_schema))
+
+def stop_scrubbing():
+    """Stop following the timeline and close the take file"""
+    global scrub_take
+    if scrub_frame in bpy.app.handlers.frame_change_post:
+        bpy.app.handlers.frame_change_post.remove(scrub_frame)
+    if scrub_take is not None:
+        scrub_take.close()
+        scrub_take = None
+
+class CAMERA_MOTION_OT_scrub_take(Operator):
+    bl_idname = "camera_motion.scrub_take"
+    bl_label = "Scrub Take File"
+    bl_description = ("Pose the camera from the take file at whatever frame the timeline is on, "
+                      "without keying it. Run again to stop")
+    
+    @classmethod
+    def poll(cls, context):
+        return scrub_take is not None or (context.scene.camera is not None
+                                          and bool(context.scene.camera_motion.take_file))
+    
+    def execute(self, context):
+        global scrub_take
+        if scrub_take is not None:
+            stop_scrubbing()
+            self.report({'INFO'}, "Stopped scrubbing the take file")
+            return {'FINISHED'}
+        
+        path = bpy.path.abspath(context.scene.camera_motion.take_file)
+        try:
+            take = TakeFile(path)
+        except (OSError, ValueError) as e:
+            self.report({'ERROR'}, f"Failed to open take file: {e}")
+            return {'CANCELLED'}
+        if not len(take):
+            take.close()
+            self.report({'WARNING'}, "The take file has no samples")
+            return {'CANCELLED'}
+        
+        # The camera isn't keyed, so the dead-band must not hold back the first pose
+        websocket_server.change_detector.forget()
+        scrub_take = take
+        bpy.app.handlers.frame_change_post.append(scrub_frame)
+        scrub_frame(context.scene)
+        end_frame = take.start_frame + take.end_time * take.fps
+        self.report({'INFO'}, f"Scrubbing {len(take)} samples over frames {take.start_frame:.0f}-{end_frame:.0f}")
+        return {'FINISHED'}
+
+class CAMERA_MOTION_OT_process_take(Operator):
+    bl_idname = "camera_motion.process_take"
+    bl_label = "Clean Up Take"
+    bl_description = "Smooth, unwrap, resample and reduce the scene camera's recorded keyframes"
+    bl_options = {'REGISTER', 'UNDO'}
+    
+    smoothing: EnumProperty(
+        name="Smoothing",
+        items=[
+            ('NONE', "None", "Keep the recorded values"),
+            ('BUTTERWORTH', "Butterworth", "Zero-phase low-pass filter"),
+            ('SAVGOL', "Savitzky-Golay", "Polynomial smoothing that keeps sharp moves"),
+        ],
+        default='BUTTERWORTH',
+    )
+    cutoff: FloatProperty(
+        name="Cutoff (Hz)",
+        description="Butterworth cutoff frequency; shake above it is removed",
+        default=take_processing.DEFAULT_CUTOFF,
+        min=0.1,
+    )
+    window: IntProperty(
+        name="Window",
+        description="Savitzky-Golay window in samples (rounded up to odd)",
+        default=take_processing.DEFAULT_WINDOW,
+        min=3,
+    )
+    unwrap: BoolProperty(
+        name="Unwrap Euler",
+        description="Remove ±180° flips from Euler rotation channels",
+        default=True,
+    )
+    resample: BoolProperty(
+        name="Resample to Scene FPS",
+        description="Put one key on every scene frame before reducing",
+        default=True,
+    )
+    reduce: BoolProperty(
+        name="Reduce Keyframes",
+        description="Drop keys that linear interpolation can reproduce within the tolerance",
+        default=True,
+    )
+    tolerance: FloatProperty(
+        name="Tolerance",
+        description="Largest error the reduction may introduce, in meters and radians",
+        default=0.001,
+        min=0.00001,
+        precision=4,
+    )
+    
+    @classmethod
+    def poll(cls, context):
+        return context.scene.camera is not None
+    
+    def invoke(self, context, event):
+        return context.window_manager.invoke_props_dialog(self)
+    
+    def execute(self, context):
+        scene = context.scene
+        camera = scene.camera
+        take = camera_controller.CameraController.get_transform_curves(camera)
+        if take is None or len(take[0]) < 3:
+            self.report({'ERROR'}, f"{camera.name} has no recorded transform keyframes")
+            return {'CANCELLED'}
+        
+        frames, values, channels = take
+        start = time.perf_counter()
+        
+        # Work in seconds so filter settings don't depend on the scene frame rate
+        fps = scene.render.fps / scene.render.fps_base
+        paths = [data_path for data_path, _ in channels]
+        quaternion_columns = [i for i, path in enumerate(paths) if path == 'rotation_quaternion']
+        new_times = None
+        if self.resample:
+            new_times = np.arange(np.ceil(frames[0]), np.floor(frames[-1]) + 1) / fps
+        
+        times, values = take_processing.process_take(
+            frames / fps, values,
+            euler_columns=[i for i, path in enumerate(paths) if path == 'rotation_euler'] if self.unwrap else (),
+            quaternion_columns=quaternion_columns if len(quaternion_columns) == 4 else None,
+            smoothing=None if self.smoothing == 'NONE' else self.smoothing,
+            cutoff=self.cutoff,
+            window=self.window | 1,
+            new_times=new_times,
+            tolerance=self.tolerance if self.reduce else None,
+        )
+        camera_controller.CameraController.set_transform_curves(camera, times * fps, values, channels)
+        
+        elapsed = time.perf_counter() - start
+        self.report({'INFO'}, f"Processed {len(frames)} samples into {len(times)} keyframes "
+                              f"in {elapsed * 1000:.0f} ms")
+        return {'FINISHED'}
+
+class CAMERA_MOTION_OT_toggle_profiling(Operator):
+    bl_idname = "camera_motion.toggle_profiling"
+    bl_label = "Toggle Profiling"
+    bl_description = "Record timing spans for each pipeline stage"
+    
+    sample_every: IntProperty(
+        name="Sample Every",
+        description="Record the spans of one in this many messages",
+        default=profiling.DEFAULT_SAMPLE_EVERY,
+        min=1,
+        max=profiling.MAX_SAMPLE_EVERY,
+    )
+    
+    def execute(self, context):
+        if profiling.enabled:
+            profiling.disable()
+            self.report({'INFO'}, f"Profiling stopped ({profiling.span_count()} spans recorded)")
+        else:
+            profiling.clear()
+            profiling.enable(self.sample_every)
+            self.report({'INFO'}, "Profiling started")
+        return {'FINISHED'}
+
+class CAMERA_MOTION_OT_export_profile(Operator, ExportHelper):
+    bl_idname = "camera_motion.export_profile"
+    bl_label = "Export Profile"
+    bl_description = "Save recorded pipeline spans as Chrome trace-event JSON"
+    
+    filename_ext = ".json"
+    
+    def execute(self, context):
+        try:
+            count = profiling.export_chrome_trace(self.filepath)
+            self.report({'INFO'}, f"Exported {count} spans to {self.filepath}")
+        except OSError as e:
+            self.report({'ERROR'}, f"Failed to export profile: {str(e)}")
+        return {'FINISHED'}
+
 # Registration
 classes = [
+    CameraMotionSettings,
     CAMERA_MOTION_PT_main_panel,
+    CAMERA_MOTION_PT_metrics_panel,
     CAMERA_MOTION_OT_start_server,
     CAMERA_MOTION_OT_stop_server,
+    CAMERA_MOTION_OT_apply_loop,
+    CAMERA_MOTION_OT_commit_preview,
+    CAMERA_MOTION_OT_toggle_recording,
+    CAMERA_MOTION_OT_save_replay,
+    CAMERA_MOTION_OT_scrub_take,
+    CAMERA_MOTION_OT_process_take,
+    CAMERA_MOTION_OT_toggle_profiling,
+    CAMERA_MOTION_OT_export_profile,
 ]
 
 def register():
@@ -106,6 +982,10 @@ def register():
             bpy.utils.register_class(cls)
             print(f"✅ Registered class: {cls.__name__}")
         
+        bpy.types.Scene.camera_motion = PointerProperty(type=CameraMotionSettings)
+        if load_settings not in bpy.app.handlers.load_post:
+            bpy.app.handlers.load_post.append(load_settings)
+        
         print("✅ All classes registered successfully!")
         
         # Start server automatically when add-on is enabled
@@ -134,6 +1014,16 @@ def unregister():
         except Exception as e:
             print(f"Failed to stop WebSocket server: {e}")
     
+    try:
+        viewport_preview.stop_preview()
+    except Exception as e:
+        print(f"Failed to restore camera views: {e}")
+    
+    stop_scrubbing()
+    
+    if load_settings in bpy.app.handlers.load_post:
+        bpy.app.handlers.load_post.remove(load_settings)
+    del bpy.types.Scene.camera_motion
     for cls in reversed(classes):
         bpy.utils.unregister_class(cls)
 
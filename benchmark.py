@@ -0,0 +1,930 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Camera Motion Receiver protocol code
+These run with a regular Python interpreter; see benchmark_blender.py for
+benchmarks that need Blender.
+
+Usage: python benchmark.py [name ...]
+"""
+
+import asyncio
+import contextlib
+import gc
+import io
+import json
+import math
+import multiprocessing
+import os
+import random
+import selectors
+import socket
+import statistics
+import struct
+import sys
+import tempfile
+import threading
+import time
+
+import metrics
+import pose_math
+import profiling
+import take_processing
+from channel_schema import ChannelSchema
+from coordinate_mapping import CoordinateMapper, MappingProfile
+from fanout_server import FanoutServer
+from freed import FreedDecoder, FreedListener, Calibration
+from freed_sender import motion_packet, send_motion
+from osc_input import OscListener, OscReceiver, encode_message, encode_bundle
+from pose_hub import PoseHub, wire_pose
+from imu_fusion import ImuFusion, MADGWICK, MAHONY, STANDARD_GRAVITY, decode_items
+from jitter_buffer import JitterBuffer
+from motion_client import MotionStream
+from replay_buffer import ReplayBuffer
+from sequencing import SequenceFilter
+from session import SessionLink
+from take_file import TakeFile, TakeWriter
+from take_recorder import QUATERNION_CHANNELS
+from clock_sync import ClockSync
+from flow_control import FlowController, RateMeter, encode_frame
+from pose_codec import PoseEncoder, PoseDecoder
+from pose_protocol import decode_pose
+
+
+def timed(func, repeat):
+    """Return the average seconds per call of func over repeat calls"""
+    start = time.perf_counter()
+    for _ in range(repeat):
+        func()
+    return (time.perf_counter() - start) / repeat
+
+
+def random_quaternion_poses(count, seed=1):
+    """Generate count random X, Y, Z, QUAT_W, QUAT_X, QUAT_Y, QUAT_Z rows"""
+    rng = random.Random(seed)
+    poses = []
+    for _ in range(count):
+        quat = pose_math.euler_to_quaternion(rng.uniform(-math.pi, math.pi),
+                                             rng.uniform(-1.5, 1.5),
+                                             rng.uniform(-math.pi, math.pi))
+        poses.append((rng.uniform(-10, 10), rng.uniform(-10, 10), rng.uniform(0, 5)) + quat)
+    return poses
+
+
+def benchmark_pose_conversion(count=10000):
+    """Per-pose cost of decoding and converting Euler, quaternion and matrix frames"""
+    poses = random_quaternion_poses(count)
+    euler_messages = [dict(zip(('X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z'),
+                               pose[:3] + pose_math.quaternion_to_euler(*pose[3:])))
+                      for pose in poses]
+    quat_messages = [dict(zip(('X', 'Y', 'Z', 'QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z'), pose))
+                     for pose in poses]
+
+    print(f"\n📊 Pose conversion ({count} poses)")
+    print(f"{'stage':<40} {'ns/pose':>10}")
+
+    def report(label, seconds):
+        print(f"{label:<40} {seconds / count * 1e9:>10.0f}")
+
+    report("decode Euler message", timed(lambda: [decode_pose(m) for m in euler_messages], 1))
+    report("decode quaternion message", timed(lambda: [decode_pose(m) for m in quat_messages], 1))
+    report("scalar quaternion -> Euler", timed(lambda: [pose_math.quaternion_to_euler(*p[3:]) for p in poses], 1))
+
+    if pose_math.np is None:
+        print("NumPy not installed, skipping batch conversions")
+        return
+
+    array = pose_math.np.array(poses)
+    matrices = pose_math.quaternions_to_matrices(array)
+    report("batch quaternion -> matrix", timed(lambda: pose_math.quaternions_to_matrices(array), 10))
+    report("batch matrix -> quaternion", timed(lambda: pose_math.matrices_to_quaternions(matrices), 10))
+    report("batch quaternion -> Euler", timed(lambda: pose_math.quaternions_to_eulers(array[:, 3:]), 10))
+
+
+def handheld_motion(count, rate=60.0, seed=2):
+    """Generate a smooth handheld-style camera path sampled at rate Hz"""
+    rng = random.Random(seed)
+    poses = []
+    for i in range(count):
+        t = i / rate
+        poses.append({
+            'X': 3.0 * math.cos(0.3 * t) + 0.01 * rng.gauss(0, 1),
+            'Y': 3.0 * math.sin(0.3 * t) + 0.01 * rng.gauss(0, 1),
+            'Z': 1.6 + 0.05 * math.sin(2.1 * t),
+            'ROT_X': 1.4 + 0.02 * math.sin(1.3 * t),
+            'ROT_Y': 0.01 * rng.gauss(0, 1),
+            'ROT_Z': 0.3 * t + math.pi / 2,
+        })
+    return poses
+
+
+def benchmark_pose_codec(count=20000):
+    """Bytes per pose and decode throughput of the binary codec against JSON"""
+    poses = handheld_motion(count)
+    json_bytes = sum(len(json.dumps(pose).encode('utf-8')) + 4 for pose in poses)
+
+    print(f"\n📊 Pose codec ({count} poses at 60 Hz, sizes include the 4-byte length prefix)")
+    print(f"{'precision':>10} {'bytes/pose':>11} {'max error':>11} {'encode/s':>10} {'decode/s':>10}")
+    print(f"{'JSON':>10} {json_bytes / count:>11.1f} {0.0:>11.1e} "
+          f"{count / timed(lambda: [json.dumps(p) for p in poses], 1):>10.0f} "
+          f"{count / timed(lambda: [decode_pose(json.loads(json.dumps(p))) for p in poses], 1):>10.0f}")
+
+    for precision in (1e-2, 1e-3, 1e-4, 1e-5):
+        encoder = PoseEncoder(position_precision=precision, rotation_precision=precision)
+        start = time.perf_counter()
+        frames = [encoder.encode(pose) for pose in poses]
+        encode_time = time.perf_counter() - start
+
+        decoder = PoseDecoder()
+        start = time.perf_counter()
+        decoded = [decoder.decode(frame) for frame in frames]
+        decode_time = time.perf_counter() - start
+
+        size = sum(len(frame) + 4 for frame in frames) / count
+        error = max(abs(pose[key] - result[key]) for pose, result in zip(poses, decoded) for key in pose)
+        print(f"{precision:>10.0e} {size:>11.1f} {error:>11.1e} {count / encode_time:>10.0f} {count / decode_time:>10.0f}")
+
+    # The same path with a slow zoom in the LENS channel
+    schema = ChannelSchema()
+    zooming = [decode_pose(dict(pose, LENS=47.0 - 23.0 * math.cos(i / 600.0)), schema) for i, pose in enumerate(poses)]
+    encoder, decoder = PoseEncoder(schema=schema), PoseDecoder(schema)
+    start = time.perf_counter()
+    frames = [encoder.encode(pose) for pose in zooming]
+    encode_time = time.perf_counter() - start
+    start = time.perf_counter()
+    for frame in frames:
+        decoder.decode(frame)
+    decode_time = time.perf_counter() - start
+    size = sum(len(frame) + 4 for frame in frames) / count
+    print(f"{'1e-04+lens':>10} {size:>11.1f} {'':>11} {count / encode_time:>10.0f} {count / decode_time:>10.0f}")
+
+
+def benchmark_profiling_overhead(count=500, rounds=400):
+    """Cost of profiling on the network thread's pipeline when disabled and enabled
+
+    Every message goes through what the socket server's network thread does
+    with it: the stages it profiles (receive, decode, filter, validate, map and
+    queue), the replay buffer and the per-connection bookkeeping. Each round times every mode once,
+    in a shuffled order, and the overhead is the median over the rounds of each
+    mode's time against the uninstrumented one from the same round, so drift in
+    the machine's speed cancels out. The last column is the cost of turning
+    profiling on, against the same code with it off.
+    """
+    frames = [encode_frame(dict(pose, SEQ=sequence)) for sequence, pose in enumerate(handheld_motion(count))]
+    mapper = CoordinateMapper(MappingProfile.preset('Y_UP'))
+    fusion = ImuFusion()
+    replay = ReplayBuffer(schema=ChannelSchema())
+    pending = [None]
+    pending_lock = threading.Lock()
+    client = metrics.registry.client('benchmark')
+    flow = FlowController(RateMeter())
+    decoder = PoseDecoder()
+    clock = ClockSync()
+    link = SessionLink()
+
+    def receive(frame):
+        length = struct.unpack_from('!I', frame)[0]
+        return frame[4:4 + length]
+
+    def store(poses):
+        # What receive_poses does between mapping and queueing
+        now = time.perf_counter()
+        for pose in poses:
+            replay.add(now, pose)
+        metrics.poses_received.inc(len(poses))
+
+    def queue_pose(pose):
+        with pending_lock:
+            if pending[0] is not None:
+                metrics.poses_dropped.inc()
+            pending[0] = pose
+        metrics.queue_depth.set(1)
+
+    def bookkeeping(count):
+        # The socket server's per-message replies, short of sending them
+        client.add(count)
+        flow.on_receive(count)
+        decoder.take_resync_request()
+        clock.poll()
+        link.poll(None, False)
+
+    def run_all():
+        sequence_filter = SequenceFilter(window=4)
+        countdown = profiling.sample_interval()
+        for frame in frames:
+            countdown -= 1
+            if countdown:
+                sampled = False
+            else:
+                countdown = profiling.sample_interval()
+                sampled = profiling.enabled
+            if sampled:
+                span = profiling.start_span()
+                message = receive(frame)
+                profiling.end_span('receive', span)
+            else:
+                message = receive(frame)
+
+            if sampled:
+                span = profiling.start_span()
+                data = json.loads(message)
+                profiling.end_span('decode', span)
+            else:
+                data = json.loads(message)
+
+            if sampled:
+                span = profiling.start_span()
+                items = sequence_filter.filter([data], 'bench')
+                profiling.end_span('filter', span)
+            else:
+                items = sequence_filter.filter([data], 'bench')
+
+            if sampled:
+                span = profiling.start_span()
+                poses, _ = decode_items(items, 'bench', fusion)
+                profiling.end_span('validate', span)
+            else:
+                poses, _ = decode_items(items, 'bench', fusion)
+
+            if sampled:
+                span = profiling.start_span()
+                poses = mapper.map_poses(poses)
+                profiling.end_span('map', span)
+            else:
+                poses = mapper.map_poses(poses)
+
+            store(poses)
+            if sampled:
+                span = profiling.start_span()
+            queue_pose(poses[-1])
+            if sampled:
+                profiling.end_span('queue', span)
+            bookkeeping(len(poses))
+
+    def run_plain():
+        sequence_filter = SequenceFilter(window=4)
+        for frame in frames:
+            message = receive(frame)
+            data = json.loads(message)
+            items = sequence_filter.filter([data], 'bench')
+            poses, _ = decode_items(items, 'bench', fusion)
+            poses = mapper.map_poses(poses)
+            store(poses)
+            queue_pose(poses[-1])
+            bookkeeping(len(poses))
+
+    print(f"\n📊 Profiling overhead ({count} messages x {rounds} rounds, receive to queue)")
+    modes = [
+        ('no instrumentation', run_plain, None),
+        ('disabled', run_all, None),
+        ('enabled, 1 in 100', run_all, 100),
+        ('enabled, 1 in 10', run_all, 10),
+        ('enabled, every message', run_all, 1),
+    ]
+    times = {label: [] for label, _, _ in modes}
+    rng = random.Random(3)
+
+    was_enabled, was_every = profiling.enabled, profiling.sample_every
+    # Collections would land on whichever mode crosses the threshold, so, as
+    # timeit does, the collector is paused while timing
+    gc.disable()
+    try:
+        for _ in range(rounds):
+            for label, func, every in rng.sample(modes, len(modes)):
+                if every is None:
+                    profiling.disable()
+                else:
+                    profiling.enable(every)
+                times[label].append(timed(func, 1))
+    finally:
+        gc.enable()
+        profiling.enable(was_every)
+        profiling.enabled = was_enabled
+        profiling.clear()
+
+    def overhead(label, against):
+        return statistics.median(time / base for time, base in zip(times[label], times[against])) - 1
+
+    print(f"{'mode':<24} {'ns/message':>11} {'overhead':>9} {'enabling':>9}")
+    for label, _, every in modes:
+        enabling = f"{overhead(label, 'disabled') * 100:>8.1f}%" if every else ''
+        print(f"{label:<24} {statistics.median(times[label]) / count * 1e9:>11.0f} "
+              f"{overhead(label, 'no instrumentation') * 100:>8.1f}% {enabling:>9}")
+
+
+def benchmark_take_processing(count=100000, rate=120.0, fps=24.0):
+    """Time each clean-up step on a long recorded take"""
+    np = take_processing.np
+    if np is None:
+        print("NumPy not installed, skipping take processing")
+        return
+
+    # Noisy handheld take: location plus Euler rotation that wraps at ±π
+    rng = np.random.default_rng(3)
+    times = np.arange(count) / rate
+    values = np.column_stack([
+        3.0 * np.cos(0.3 * times), 3.0 * np.sin(0.3 * times), 1.6 + 0.05 * np.sin(2.1 * times),
+        1.4 + 0.02 * np.sin(1.3 * times), np.zeros(count), 0.3 * times,
+    ]) + rng.normal(0.0, 0.005, (count, 6))
+    values[:, 3:] = (values[:, 3:] + np.pi) % (2 * np.pi) - np.pi
+    frames = np.arange(0.0, times[-1], 1.0 / fps)
+
+    print(f"\n📊 Take processing ({count} samples at {rate:.0f} Hz, 6 channels)")
+    print(f"{'step':<40} {'ms':>8}")
+
+    def report(label, func):
+        start = time.perf_counter()
+        result = func()
+        print(f"{label:<40} {(time.perf_counter() - start) * 1e3:>8.1f}")
+        return result
+
+    unwrapped = report("unwrap Euler", lambda: take_processing.unwrap_angles(values[:, 3:]))
+    smooth = report("Butterworth", lambda: take_processing.butterworth(values, rate))
+    report("Savitzky-Golay", lambda: take_processing.savitzky_golay(values))
+    resampled = report(f"resample to {fps:.0f} fps", lambda: take_processing.resample(times, smooth, frames))
+    kept = report("reduce keyframes (resampled)",
+                  lambda: take_processing.reduce_keyframes(frames, resampled, 1e-3))
+    report("reduce keyframes (full rate)", lambda: take_processing.reduce_keyframes(times, smooth, 1e-3))
+    report("process_take (all steps)", lambda: take_processing.process_take(
+        times, values, euler_columns=[3, 4, 5], smoothing='BUTTERWORTH', new_times=frames, tolerance=1e-3))
+    print(f"{len(kept)} of {len(frames)} resampled keys kept at 1e-3 tolerance")
+
+
+def benchmark_coordinate_mapping(count=10000):
+    """Compare mapping poses one at a time against one batch"""
+    if pose_math.np is None:
+        print("NumPy not installed, skipping coordinate mapping")
+        return
+
+    mapper = CoordinateMapper(MappingProfile.preset('Y_UP', scale=0.01, offset=(1.0, 2.0, 0.0)))
+    poses = [decode_pose(dict(zip(('X', 'Y', 'Z', 'QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z'), row)))
+             for row in random_quaternion_poses(count)]
+    identity = CoordinateMapper()
+
+    print(f"\n📊 Coordinate mapping ({count} quaternion poses)")
+    print(f"{'method':<32} {'µs/pose':>10}")
+    rows = [
+        ("identity profile (skipped)", timed(lambda: [identity.map_pose(pose) for pose in poses], 1)),
+        ("one pose at a time", timed(lambda: [mapper.map_pose(pose) for pose in poses], 1)),
+        ("one batch", timed(lambda: mapper.map_poses(poses), 1)),
+        ("unchanged profile re-set", timed(lambda: [mapper.set_profile(mapper.profile) for _ in poses], 1)),
+    ]
+    for label, seconds in rows:
+        print(f"{label:<32} {seconds / count * 1e6:>10.2f}")
+
+
+def _clumped_arrivals(duration, rate, clump, rng):
+    """(arrival, capture) times of a rate Hz sender delivered in Wi-Fi clumps about clump seconds apart"""
+    arrivals = []
+    pending = []
+    flush = clump
+    for i in range(int(duration * rate)):
+        pending.append(i / rate)
+        if (i + 1) / rate >= flush:
+            deliver = flush + rng.uniform(0.0, 0.01)
+            arrivals += [(deliver + k * 1e-4, capture) for k, capture in enumerate(pending)]
+            pending = []
+            flush += clump * rng.uniform(0.5, 1.5)
+    return sorted(arrivals)
+
+
+def _play_out(arrivals, buffer, stamped, rng, tick=1.0 / 60.0):
+    """Simulate the apply timer; returns (tick time, capture time) of each applied pose"""
+    applied = []
+    newest = None
+    index = 0
+    now = 0.0
+    end = arrivals[-1][0]
+    while now < end:
+        while index < len(arrivals) and arrivals[index][0] <= now:
+            arrival, capture = arrivals[index]
+            if buffer is None:
+                newest = capture
+            else:
+                buffer.push([capture], [capture] if stamped else None, now=arrival)
+            index += 1
+        if buffer is None:
+            pose, newest = newest, None
+        else:
+            pose = buffer.pop(now)
+        if pose is not None:
+            applied.append((now, pose))
+        # Blender's timers fire a little early or late
+        now += tick + rng.uniform(-0.002, 0.002)
+    return applied
+
+
+def benchmark_jitter_buffer(duration=60.0, rate=60.0, clump=0.08):
+    """Smoothness and latency of playout with and without the jitter buffer"""
+    rng = random.Random(1)
+    arrivals = _clumped_arrivals(duration, rate, clump, rng)
+
+    print(f"\n📊 Jitter buffer ({rate:.0f} Hz sender, Wi-Fi clumps every {clump * 1000:.0f} ms ± 50%, "
+          f"60 Hz apply tick)")
+    print(f"{'mode':<28} {'step std ms':>12} {'stalls':>7} {'latency ms':>11} {'underruns':>10}")
+    modes = [("mailbox (no buffer)", None, False)]
+    for latency, adaptive in ((0.05, False), (0.02, True)):
+        for stamped in (True, False):
+            label = f"{'adaptive' if adaptive else 'fixed'} {latency * 1000:.0f} ms, {'TS' if stamped else 'no TS'}"
+            buffer = JitterBuffer()
+            buffer.configure(True, latency, adaptive)
+            modes.append((label, buffer, stamped))
+
+    for label, buffer, stamped in modes:
+        applied = _play_out(arrivals, buffer, stamped, random.Random(2))
+        # Skip the first seconds while the adaptive delay settles
+        applied = [(now, capture) for now, capture in applied if now > 5.0]
+        steps = [b[1] - a[1] for a, b in zip(applied, applied[1:])]
+        stalls = sum(1 for a, b in zip(applied, applied[1:]) if b[0] - a[0] > 1.5 / 60.0)
+        latency = sum(now - capture for now, capture in applied) / len(applied)
+        underruns = buffer.underruns if buffer is not None else '-'
+        print(f"{label:<28} {statistics.pstdev(steps) * 1000:>12.1f} {stalls:>7} {latency * 1000:>11.1f} "
+              f"{underruns:>10}")
+
+
+def benchmark_replay_buffer(seconds=30.0, rate=120.0):
+    """Time keeping every pose in the replay buffer and saving the whole window"""
+    if pose_math.np is None:
+        print("NumPy not installed, skipping replay buffer")
+        return
+
+    count = int(seconds * rate)
+    euler = [decode_pose({'X': i * 0.01, 'Y': 0.0, 'Z': 1.6, 'ROT_X': 1.4, 'ROT_Y': 0.0, 'ROT_Z': i * 0.001})
+             for i in range(count)]
+    quaternion = [decode_pose(dict(zip(('X', 'Y', 'Z', 'QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z'), row)))
+                  for row in random_quaternion_poses(count)]
+
+    print(f"\n📊 Replay buffer ({seconds:.0f} s at {rate:.0f} Hz, {count} poses)")
+    print(f"{'poses':<16} {'µs/add':>8} {'ms/save':>8}")
+    for label, poses in (("Euler", euler), ("quaternion", quaternion)):
+        replay = ReplayBuffer(seconds, rate)
+        # Fill twice over so the adds wrap around the ring
+        add = timed(lambda: [replay.add(i / rate, pose) for i, pose in enumerate(poses + poses)], 1) / (2 * count)
+        save = timed(lambda: replay.take(seconds, 1, 24.0), 5)
+        print(f"{label:<16} {add * 1e6:>8.2f} {save * 1e3:>8.2f}")
+
+
+def _scan_to(path, row_size, seconds, chunk_rows=16384):
+    """Seek by reading rows from the start of the file, as a file without an index needs"""
+    with open(path, 'rb') as file:
+        file.seek(16)
+        read = 0
+        while True:
+            data = file.read(chunk_rows * row_size)
+            rows = len(data) // row_size
+            times = pose_math.np.frombuffer(data, dtype='<f8', count=rows * row_size // 8)[::row_size // 8]
+            found = int(pose_math.np.searchsorted(times, seconds, side='right'))
+            if found < len(times) or not len(times):
+                return read + found - 1
+            read += len(times)
+
+
+def benchmark_take_file(minutes=60.0, rate=200.0):
+    """Seeking and range extraction in a long take file against scanning it"""
+    if pose_math.np is None:
+        print("NumPy not installed, skipping take file")
+        return
+
+    np = pose_math.np
+    count = int(minutes * 60.0 * rate)
+    times = np.arange(count) / rate
+    rng = np.random.default_rng(5)
+    quaternions = rng.normal(size=(count, 4))
+    quaternions /= np.linalg.norm(quaternions, axis=1)[:, None]
+    values = np.column_stack((np.sin(times), np.cos(times), np.full(count, 1.6), quaternions, np.full(count, 35.0)))
+    channels = QUATERNION_CHANNELS + [ChannelSchema().keys[0]]
+    targets = rng.uniform(0.0, times[-1], 10000)
+
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, 'long.take')
+        start = time.perf_counter()
+        with TakeWriter(path, channels, 1, 24.0) as writer:
+            # Written in one-second chunks, as a long session would be
+            for first in range(0, count, int(rate)):
+                writer.write(times[first:first + int(rate)], values[first:first + int(rate)])
+        write = time.perf_counter() - start
+        size = os.path.getsize(path)
+
+        print(f"\n📊 Take file ({minutes:.0f} min at {rate:.0f} Hz, {count} samples, {size / 1e6:.0f} MB)")
+        print(f"   Write: {write * 1e3:.0f} ms")
+        start = time.perf_counter()
+        take = TakeFile(path)
+        print(f"   Open: {(time.perf_counter() - start) * 1e3:.2f} ms, index of {len(take._block_times)} blocks")
+
+        seek = timed(lambda: [take.index_at(t) for t in targets], 3) / len(targets)
+        pose = timed(lambda: [take.pose_at(t) for t in targets], 3) / len(targets)
+        row_size = 8 * (1 + len(channels))
+        scan = timed(lambda: [_scan_to(path, row_size, t) for t in targets[:20]], 1) / 20
+        assert all(take.index_at(t) == _scan_to(path, row_size, t) for t in targets[:20])
+        extract = timed(lambda: take.extract(42 * 60.0, 42 * 60.0 + 10.0), 20)
+        print(f"   Seek: {seek * 1e6:.1f} µs, pose at a time: {pose * 1e6:.1f} µs, "
+              f"linear scan: {scan * 1e3:.1f} ms")
+        print(f"   Extract 10 s at minute 42: {extract * 1e6:.0f} µs")
+        take.close()
+
+
+def simulated_imu(seconds, rate, magnetometer, seed=1):
+    """Return (IMU sample rows, true (N, 3, 3) orientations) of a handheld move
+
+    The gyroscope has a constant bias, and every sensor some noise.
+    """
+    np = pose_math.np
+    rng = np.random.default_rng(seed)
+    times = np.arange(int(seconds * rate) + 1) / rate
+    angles = np.column_stack((0.3 + 0.4 * np.sin(0.7 * times), 0.5 * np.sin(0.5 * times + 1.0),
+                              1.5 * np.sin(0.3 * times)))
+    rotations = pose_math.eulers_to_matrices(np.column_stack((np.zeros_like(angles), angles)))[:, :3, :3]
+
+    # Body rates from the change between consecutive orientations
+    delta = np.einsum('nji,njk->nik', rotations[:-1], rotations[1:])
+    gyro = np.column_stack((delta[:, 2, 1] - delta[:, 1, 2], delta[:, 0, 2] - delta[:, 2, 0],
+                            delta[:, 1, 0] - delta[:, 0, 1])) * rate / 2.0
+    rotations = rotations[1:]
+    count = len(rotations)
+    accel = np.einsum('nji,j->ni', rotations, (0.0, 0.0, STANDARD_GRAVITY)) + rng.normal(0.0, 0.05, (count, 3))
+    gyro += (0.01, -0.02, 0.015) + rng.normal(0.0, 0.01, (count, 3))
+    columns = [times[1:, None], accel, gyro]
+    if magnetometer:
+        columns.append(np.einsum('nji,j->ni', rotations, (0.4, 0.0, -0.9)) + rng.normal(0.0, 0.01, (count, 3)))
+    return np.hstack(columns).tolist(), rotations
+
+
+def benchmark_imu_fusion(seconds=20.0, rate=200.0, batch=20):
+    """Time fusing raw IMU batches and measure the error against the true orientation"""
+    if pose_math.np is None:
+        print("NumPy not installed, skipping IMU fusion")
+        return
+    np = pose_math.np
+
+    print(f"\n📊 IMU fusion ({seconds:.0f} s at {rate:.0f} Hz, {batch} samples per message)")
+    print(f"{'filter':<22} {'µs/sample':>10} {'tilt °':>8} {'heading °':>10}")
+    for magnetometer in (False, True):
+        rows, truth = simulated_imu(seconds, rate, magnetometer)
+        messages = [{'IMU': rows[i:i + batch]} for i in range(0, len(rows), batch)]
+        for algorithm in (MADGWICK, MAHONY):
+            fusion = ImuFusion(algorithm)
+            poses = []
+            start = time.perf_counter()
+            for message in messages:
+                poses.extend(fusion.update('device', message)[0])
+            per_sample = (time.perf_counter() - start) / len(rows)
+
+            fused = pose_math.quaternions_to_matrices(
+                [[0.0, 0.0, 0.0, p['QUAT_W'], p['QUAT_X'], p['QUAT_Y'], p['QUAT_Z']] for p in poses])[:, :3, :3]
+            # Skip the first seconds while the filter settles
+            settled = slice(int(2.0 * rate), None)
+            up = np.einsum('nij,nj->ni', fused[settled], truth[settled][:, 2])
+            tilt = np.degrees(np.arccos(np.clip(up[:, 2], -1.0, 1.0))).mean()
+            label = f"{algorithm.lower()} {'with' if magnetometer else 'without'} mag"
+            if magnetometer:
+                forward = np.einsum('nij,nj->ni', fused[settled], truth[settled][:, 0])
+                heading = f"{np.degrees(np.abs(np.arctan2(forward[:, 1], forward[:, 0]))).mean():.2f}"
+            else:
+                heading = "-"
+            print(f"{label:<22} {per_sample * 1e6:>10.2f} {tilt:>8.2f} {heading:>10}")
+
+
+def _freed_sender(port, cameras, rate, duration, start_event, sent):
+    """Send synthetic FreeD packets to the benchmark listener from a separate process"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_event.wait()
+    sent.value = send_motion(sock, ('127.0.0.1', port), cameras, rate, duration)
+    sock.close()
+
+
+def benchmark_freed(camera_counts=(1, 10, 50, 200), rate=60.0, duration=2.0, port=18940):
+    """Decode cost of FreeD D1 packets and listener throughput at broadcast rates"""
+    packets = [motion_packet(camera_id, i / rate) for i in range(2000) for camera_id in range(1, 6)]
+    decoder = FreedDecoder(ChannelSchema(), Calibration(0, 200000, 24.0, 70.0), Calibration(0, 50000, 0.5, 10.0))
+    decode = timed(lambda: [decoder.decode(packet) for packet in packets], 1) / len(packets)
+    print(f"\n📊 FreeD D1 ({decode * 1e6:.2f} µs to decode a packet with zoom and focus)")
+
+    # A paced sender per row, then one sending as fast as it can
+    context = multiprocessing.get_context('spawn')
+    print(f"{'cameras':>8} {'rate':>6} {'sent/s':>10} {'received/s':>11} {'lost':>7}")
+    for cameras, send_rate in [(count, rate) for count in camera_counts] + [(10, None)]:
+        received = []
+        listener = FreedListener(lambda camera_id, poses: received.append(len(poses)),
+                                 host='127.0.0.1', port=port, decoder=decoder)
+        listener.start()
+
+        start_event = context.Event()
+        sent = context.Value('q', 0)
+        process = context.Process(target=_freed_sender, args=(port, cameras, send_rate, duration, start_event, sent))
+        process.start()
+        time.sleep(0.5)
+        start_event.set()
+        process.join()
+        # Let the listener drain what is still queued in the socket
+        time.sleep(0.2)
+        listener.stop()
+
+        total = sum(received)
+        label = f"{send_rate:.0f}" if send_rate else "max"
+        print(f"{cameras:>8} {label:>6} {sent.value / duration:>10.0f} {total / duration:>11.0f} "
+              f"{1.0 - total / max(1, sent.value):>7.1%}")
+
+
+def _osc_sender(port, packets, duration, start_event, sent):
+    """Send OSC packets to the benchmark listener as fast as possible from a separate process"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    start_event.wait()
+    end = time.perf_counter() + duration
+    count = 0
+    while time.perf_counter() < end:
+        for packet in packets:
+            sock.sendto(packet, ('127.0.0.1', port))
+        count += len(packets)
+    sent.value = count
+    sock.close()
+
+
+def benchmark_osc(count=20000, duration=2.0, port=18941):
+    """Messages per second through the OSC parser and router, and over loopback"""
+    schema = ChannelSchema()
+    motion = handheld_motion(count)
+    positions = [encode_message('/camera/position', p['X'], p['Y'], p['Z']) for p in motion]
+    lenses = [encode_message('/camera/lens', 35.0 + i % 100 * 0.1) for i in range(count)]
+    bundles = [encode_bundle([position, encode_message('/camera/rotation', p['ROT_X'], p['ROT_Y'], p['ROT_Z']),
+                              lens], time.time()) for position, lens, p in zip(positions, lenses, motion)]
+    patterns = [encode_message('/camera/{lens,zoom}', 35.0 + i % 100 * 0.1) for i in range(count)]
+    unrouted = [encode_message('/mixer/fader1', 0.5) for _ in range(count)]
+
+    print(f"\n📊 OSC input ({count} packets)")
+    print(f"{'packet':<28} {'messages/s':>12} {'µs/packet':>10}")
+    for label, packets, messages in (("message, 3 floats", positions, 1), ("message, 1 float", lenses, 1),
+                                     ("bundle of 3 messages", bundles, 3), ("address pattern", patterns, 1),
+                                     ("unrouted address", unrouted, 1)):
+        receiver = OscReceiver(schema=schema)
+        seconds = timed(lambda: [receiver.feed(packet) for packet in packets], 1)
+        print(f"{label:<28} {count * messages / seconds:>12.0f} {seconds / count * 1e6:>10.2f}")
+
+    context = multiprocessing.get_context('spawn')
+    received = []
+    listener = OscListener(lambda poses, stamps: received.append(len(poses)), host='127.0.0.1', port=port,
+                           receiver=OscReceiver(schema=schema))
+    listener.start()
+    start_event = context.Event()
+    sent = context.Value('q', 0)
+    process = context.Process(target=_osc_sender, args=(port, positions[:1000], duration, start_event, sent))
+    process.start()
+    time.sleep(0.5)
+    start_event.set()
+    process.join()
+    time.sleep(0.2)
+    listener.stop()
+    total = sum(received)
+    print(f"{'loopback listener':<28} {total / duration:>12.0f} {'':>10}   "
+          f"({sent.value / duration:.0f} sent/s, {1.0 - total / max(1, sent.value):.1%} lost)")
+
+
+def _hub_subscribers(port, connections, ready_event, stop_event, received):
+    """Read as fast as possible on several subscriber connections from a separate process"""
+    sockets = [socket.create_connection(('127.0.0.1', port)) for _ in range(connections)]
+    for sock in sockets:
+        sock.setblocking(False)
+    ready_event.set()
+    total = 0
+    while not stop_event.is_set():
+        idle = True
+        for sock in sockets:
+            try:
+                total += len(sock.recv(1 << 20))
+                idle = False
+            except BlockingIOError:
+                pass
+        if idle:
+            time.sleep(0.0005)
+    received.value = total
+    for sock in sockets:
+        sock.close()
+
+
+def benchmark_pose_hub(subscriber_counts=(1, 5, 10, 25, 50), rate=1000.0, duration=2.0, port=18942):
+    """Publish cost and delivery of the pub-sub hub for 1 to 50 subscribers"""
+    schema = ChannelSchema()
+    poses = [decode_pose(dict(pose, LENS=35.0), schema) for pose in handheld_motion(int(rate * duration))]
+    frame_size = statistics.mean(len(encode_frame(wire_pose(pose, schema))) for pose in poses)
+    context = multiprocessing.get_context('spawn')
+
+    # Encoding happens once per frame whatever the subscriber count
+    hub = PoseHub(port=None, schema=schema)
+    start = time.perf_counter()
+    for pose in poses:
+        hub.publish_poses([pose])
+    encode_us = (time.perf_counter() - start) / len(poses) * 1e6
+
+    print(f"\n📊 Pose hub ({rate:.0f} frames/s for {duration:.0f} s, about {frame_size:.0f} bytes each)")
+    print(f"   Encode and publish with no subscribers: {encode_us:.1f} µs per frame")
+    print(f"{'subscribers':>11} {'µs/publish':>11} {'delivered/s':>12} {'dropped':>8}")
+    for count in subscriber_counts:
+        # Keep the hub's connect and disconnect messages out of the table
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            delivered, dropped, busy = _run_pose_hub(schema, poses, count, rate, port, context)
+        print(f"{count:>11} {busy / len(poses) * 1e6:>11.1f} {delivered / frame_size / duration:>12.0f} "
+              f"{dropped / (len(poses) * count):>8.1%}")
+
+
+def _run_pose_hub(schema, poses, count, rate, port, context):
+    """Publish poses at rate to count subscribers; returns (bytes delivered, frames dropped, seconds publishing)"""
+    hub = PoseHub(port=port, host='127.0.0.1', schema=schema)
+    hub.start()
+    ready_event, stop_event = context.Event(), context.Event()
+    received = context.Value('q', 0)
+    process = context.Process(target=_hub_subscribers, args=(port, count, ready_event, stop_event, received))
+    process.start()
+    ready_event.wait()
+    while len(hub.subscribers) < count:
+        time.sleep(0.01)
+
+    # Publish at a steady rate, timing only the publish calls
+    busy = 0.0
+    start = time.perf_counter()
+    for i, pose in enumerate(poses):
+        delay = start + i / rate - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        begin = time.perf_counter()
+        hub.publish_poses([pose])
+        busy += time.perf_counter() - begin
+    time.sleep(0.3)
+    stop_event.set()
+    process.join()
+    dropped = sum(subscriber.dropped for subscriber in hub.subscribers)
+    hub.stop()
+    return received.value, dropped, busy
+
+
+def _byte_sink(port, ready_event, stop_event, received):
+    """Accept connections and count the bytes they send, from a separate process"""
+    listener = socket.create_server(('127.0.0.1', port))
+    listener.setblocking(False)
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, None)
+    ready_event.set()
+    buffer = bytearray(1 << 20)
+    while not stop_event.is_set():
+        for key, _ in selector.select(timeout=0.05):
+            if key.data is None:
+                sock, _ = listener.accept()
+                sock.setblocking(False)
+                selector.register(sock, selectors.EVENT_READ, sock)
+                continue
+            try:
+                count = key.data.recv_into(buffer)
+            except BlockingIOError:
+                continue
+            if not count:
+                selector.unregister(key.data)
+                key.data.close()
+            with received.get_lock():
+                received.value += count
+    listener.close()
+
+
+def _send_two_calls(port, poses):
+    """test_client.py's pattern: a length send and a body send per pose"""
+    sock = socket.create_connection(('127.0.0.1', port))
+    for sequence, pose in enumerate(poses):
+        message = json.dumps(dict(pose, SEQ=sequence, TS=time.time())).encode('utf-8')
+        sock.send(struct.pack('!I', len(message)))
+        sock.send(message)
+    sock.close()
+
+
+async def _send_streams(port, poses, streams, **options):
+    connections = [MotionStream('127.0.0.1', port, stream=f"bench-{index}", **options) for index in range(streams)]
+    await asyncio.gather(*(connection.connect() for connection in connections))
+    # Queue in ticks of 64 poses per stream, giving the transports a chance to push back
+    for start in range(0, len(poses), 64):
+        for connection in connections:
+            connection.send_many(poses[start:start + 64])
+        await asyncio.gather(*(connection.drain() for connection in connections))
+    writes = sum(connection.writes for connection in connections)
+    await asyncio.gather(*(connection.close() for connection in connections))
+    return writes
+
+
+def benchmark_motion_client(count=100000, port=18944):
+    """Sender throughput of the asyncio client against two sends per pose"""
+    poses = handheld_motion(count)
+    context = multiprocessing.get_context('spawn')
+    ready_event, stop_event = context.Event(), context.Event()
+    received = context.Value('q', 0)
+    sink = context.Process(target=_byte_sink, args=(port, ready_event, stop_event, received))
+    sink.start()
+    ready_event.wait()
+
+    def settle():
+        # Wait for the sink to stop receiving, so the next run starts on an idle link
+        last = None
+        while received.value != last:
+            last = received.value
+            time.sleep(0.05)
+
+    try:
+        print(f"\n📊 Asyncio client ({count} poses per stream)")
+        print(f"{'sender':>28} {'poses/s':>10} {'writes/pose':>12}")
+        start = time.perf_counter()
+        _send_two_calls(port, poses)
+        elapsed = time.perf_counter() - start
+        settle()
+        print(f"{'two sends per pose':>28} {count / elapsed:>10.0f} {2.0:>12.3f}")
+
+        runs = [
+            ("one write per pose", 1, {}),
+            ("batches of 16", 1, {'batch_size': 16}),
+            ("batches of 16, Nagle on", 1, {'batch_size': 16, 'nodelay': False}),
+            ("2 ms batching", 1, {'batch_size': 1000, 'batch_delay': 0.002}),
+            ("4 streams, batches of 16", 4, {'batch_size': 16}),
+        ]
+        for label, streams, options in runs:
+            start = time.perf_counter()
+            writes = asyncio.run(_send_streams(port, poses, streams, **options))
+            elapsed = time.perf_counter() - start
+            settle()
+            print(f"{label:>28} {count * streams / elapsed:>10.0f} {writes / (count * streams):>12.3f}")
+    finally:
+        stop_event.set()
+        sink.join()
+
+
+def _fanout_sender(port, connections, duration, start_event):
+    """Send pre-encoded JSON frames over several connections as fast as possible"""
+    payload = b''.join(encode_frame(pose) for pose in handheld_motion(64))
+    sockets = [socket.create_connection(('127.0.0.1', port)) for _ in range(connections)]
+    start_event.wait()
+    end = time.monotonic() + duration
+    while time.monotonic() < end:
+        for sock in sockets:
+            sock.sendall(payload)
+    for sock in sockets:
+        sock.close()
+
+
+def benchmark_fanout(worker_counts=(1, 2, 4), senders=4, connections=8, duration=3.0, port=18765):
+    """Aggregate ingest throughput of the multi-process fan-out server"""
+    context = multiprocessing.get_context('spawn')
+    print(f"\n📊 Fan-out ingest ({senders} sender processes x {connections} connections, "
+          f"{duration:.0f} s each, {multiprocessing.cpu_count()} CPUs)")
+    print(f"{'workers':>8} {'poses/s':>12} {'scaling':>8}")
+
+    baseline = None
+    for workers in worker_counts:
+        server = FanoutServer(workers=workers, host='127.0.0.1', port=port)
+        server.start()
+        # Give the workers time to start listening
+        time.sleep(1.0)
+
+        start_event = context.Event()
+        processes = [context.Process(target=_fanout_sender, args=(port, connections, duration, start_event))
+                     for _ in range(senders)]
+        for process in processes:
+            process.start()
+        time.sleep(0.5)
+
+        before = server.received
+        start = time.perf_counter()
+        start_event.set()
+        for process in processes:
+            process.join()
+        rate = (server.received - before) / (time.perf_counter() - start)
+        server.stop()
+
+        baseline = baseline or rate
+        print(f"{workers:>8} {rate:>12.0f} {rate / baseline:>7.2f}x")
+
+
+BENCHMARKS = {
+    'pose_conversion': benchmark_pose_conversion,
+    'pose_codec': benchmark_pose_codec,
+    'profiling_overhead': benchmark_profiling_overhead,
+    'take_processing': benchmark_take_processing,
+    'coordinate_mapping': benchmark_coordinate_mapping,
+    'jitter_buffer': benchmark_jitter_buffer,
+    'replay_buffer': benchmark_replay_buffer,
+    'take_file': benchmark_take_file,
+    'imu_fusion': benchmark_imu_fusion,
+    'freed': benchmark_freed,
+    'osc': benchmark_osc,
+    'pose_hub': benchmark_pose_hub,
+    'motion_client': benchmark_motion_client,
+    'fanout': benchmark_fanout,
+}
+
+
+def main():
+    """Run the benchmarks named on the command line, or all of them"""
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark: {name}. Available: {', '.join(BENCHMARKS)}")
+            return 1
+    print("🧪 Camera Motion Receiver - benchmarks")
+    for name in names:
+        BENCHMARKS[name]()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
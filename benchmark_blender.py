@@ -0,0 +1,134 @@
+#!/usr/bin/env python3
+"""
+Benchmarks for the Camera Motion Receiver add-on that need Blender
+Run with: blender --background --factory-startup --python benchmark_blender.py
+"""
+
+import importlib
+import importlib.util
+import math
+import random
+import sys
+import time
+from pathlib import Path
+
+import bpy
+
+ADDON_NAME = "camera_motion_receiver"
+ADDON_DIR = Path(__file__).resolve().parent
+
+
+def load_addon_module(name):
+    """Import an add-on submodule from this checkout without installing the add-on"""
+    if ADDON_NAME not in sys.modules:
+        spec = importlib.util.spec_from_file_location(
+            ADDON_NAME,
+            ADDON_DIR / "__init__.py",
+            submodule_search_locations=[str(ADDON_DIR)],
+        )
+        package = importlib.util.module_from_spec(spec)
+        sys.modules[ADDON_NAME] = package
+        spec.loader.exec_module(package)
+    return importlib.import_module(f"{ADDON_NAME}.{name}")
+
+
+def create_objects(count, prefix="BenchObject"):
+    """Create count empties linked to the current scene"""
+    collection = bpy.context.scene.collection
+    objects = []
+    for i in range(count):
+        obj = bpy.data.objects.new(f"{prefix}_{i:03d}", None)
+        collection.objects.link(obj)
+        objects.append(obj)
+    return objects
+
+
+def remove_objects(objects):
+    """Remove benchmark objects from the file"""
+    for obj in objects:
+        bpy.data.objects.remove(obj, do_unlink=True)
+
+
+def make_poses(count, frame):
+    """Generate one circular-motion pose per object for the given frame"""
+    poses = []
+    for i in range(count):
+        t = (frame + i) * 0.01
+        poses.append((
+            5.0 * math.cos(t), 5.0 * math.sin(t), 2.0 + math.sin(2 * t),
+            0.1 * math.sin(t), 0.0, t,
+        ))
+    return poses
+
+
+def benchmark_batch_apply(object_counts=(1, 10, 100), frames=300):
+    """Compare per-object set_camera_transform against set_transforms_batch"""
+    camera_controller = load_addon_module("camera_controller")
+    controller = camera_controller.CameraController
+
+    print("\n📊 Transform apply: per-object vs batch")
+    print(f"{'objects':>8} {'per-object µs/frame':>20} {'batch µs/frame':>16} {'speedup':>8}")
+
+    for count in object_counts:
+        objects = create_objects(count)
+        pose_frames = [make_poses(count, frame) for frame in range(frames)]
+
+        try:
+            start = time.perf_counter()
+            for poses in pose_frames:
+                for obj, pose in zip(objects, poses):
+                    controller.set_camera_transform(obj, pose[:3], pose[3:])
+            per_object = (time.perf_counter() - start) / frames
+
+            start = time.perf_counter()
+            for poses in pose_frames:
+                controller.set_transforms_batch(objects, poses)
+            batch = (time.perf_counter() - start) / frames
+        finally:
+            remove_objects(objects)
+
+        print(f"{count:>8} {per_object * 1e6:>20.1f} {batch * 1e6:>16.1f} {per_object / batch:>7.2f}x")
+
+
+def benchmark_dead_band(frames=600, noise=2e-5):
+    """Apply a resting phone's poses with and without the dead-band change detector"""
+    camera_controller = load_addon_module("camera_controller")
+    change_detection = load_addon_module("change_detection")
+    controller = camera_controller.CameraController
+    rng = random.Random(1)
+    # A phone on a table: sensor noise well inside the default dead-band
+    poses = [{'X': 1.0 + rng.gauss(0, noise), 'Y': 2.0 + rng.gauss(0, noise), 'Z': 1.5,
+              'ROT_X': 1.2 + rng.gauss(0, noise), 'ROT_Y': 0.0, 'ROT_Z': 0.5} for _ in range(frames)]
+    view_layer = bpy.context.view_layer
+
+    print(f"\n📊 Idle stream apply ({frames} poses, {noise:.0e} noise, including depsgraph update)")
+    print(f"{'mode':<20} {'µs/pose':>10} {'writes':>8}")
+
+    camera = create_objects(1, "BenchCamera")[0]
+    try:
+        start = time.perf_counter()
+        for pose in poses:
+            controller.set_camera_pose(camera, pose)
+            view_layer.update()
+        print(f"{'always write':<20} {(time.perf_counter() - start) / frames * 1e6:>10.1f} {frames:>8}")
+
+        detector = change_detection.ChangeDetector()
+        start = time.perf_counter()
+        for pose in poses:
+            if detector.changed(camera.name, pose):
+                controller.set_camera_pose(camera, pose)
+            view_layer.update()
+        print(f"{'dead-band':<20} {(time.perf_counter() - start) / frames * 1e6:>10.1f} {detector.written:>8}")
+    finally:
+        remove_objects([camera])
+
+
+def main():
+    """Run all Blender-side benchmarks"""
+    print("🧪 Camera Motion Receiver - Blender benchmarks")
+    benchmark_batch_apply()
+    benchmark_dead_band()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,7 +1,23 @@
 import bpy
 import math
 import mathutils
-from mathutils import Vector, Euler
+import numpy as np
+from mathutils import Vector, Euler, Matrix
+
+try:
+    from . import pose_math
+    from .channel_schema import split_path
+    from .pose_protocol import decode_pose, pose_mode, MODE_QUATERNION, MODE_MATRIX, MATRIX_FIELD
+except ImportError:
+    import pose_math
+    from channel_schema import split_path
+    from pose_protocol import decode_pose, pose_mode, MODE_QUATERNION, MODE_MATRIX, MATRIX_FIELD
+
+# Animated transform channels, in column order for take processing
+TRANSFORM_PATHS = ('location', 'rotation_euler', 'rotation_quaternion')
+
+# Keyframe interpolation enum value of 'LINEAR', for foreach_set
+LINEAR_INTERPOLATION = 1
 
 class CameraController:
     """Handles camera manipulation and provides utility functions"""
@@ -37,6 +53,202 @@ class CameraController:
             return True
         return False
     
+    @staticmethod
+    def set_camera_pose(camera, pose):
+        """Apply a decoded pose in its native rotation form, without converting through Euler"""
+        if not camera:
+            return False
+        
+        mode = pose_mode(pose)
+        if mode == MODE_MATRIX:
+            values = pose[MATRIX_FIELD]
+            camera.matrix_basis = Matrix((values[0:4], values[4:8], values[8:12], values[12:16]))
+        elif mode == MODE_QUATERNION:
+            if camera.rotation_mode != 'QUATERNION':
+                camera.rotation_mode = 'QUATERNION'
+            camera.location = (pose['X'], pose['Y'], pose['Z'])
+            camera.rotation_quaternion = (pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+        else:
+            if camera.rotation_mode in {'QUATERNION', 'AXIS_ANGLE'}:
+                camera.rotation_mode = 'XYZ'
+            camera.location = (pose['X'], pose['Y'], pose['Z'])
+            camera.rotation_euler = (pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'])
+        return True
+    
+    @staticmethod
+    def pose_matrix(pose, euler_order='XYZ'):
+        """Build the unscaled local transform of a decoded pose as a Matrix"""
+        mode = pose_mode(pose)
+        if mode == MODE_MATRIX:
+            values = pose[MATRIX_FIELD]
+            return Matrix((values[0:4], values[4:8], values[8:12], values[12:16]))
+        
+        location = (pose['X'], pose['Y'], pose['Z'])
+        if mode == MODE_QUATERNION:
+            rotation = mathutils.Quaternion((pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z']))
+        else:
+            rotation = Euler((pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z']), euler_order)
+        return Matrix.LocRotScale(location, rotation, None)
+    
+    @staticmethod
+    def compose_transform_matrices(poses, scales=None):
+        """Build 4x4 transform matrices for a batch of poses
+        
+        Rows may be Euler poses (X, Y, Z, ROT_X, ROT_Y, ROT_Z), quaternion poses
+        (X, Y, Z, QUAT_W, QUAT_X, QUAT_Y, QUAT_Z) or flattened row-major 4x4 matrices.
+        """
+        poses = np.asarray(poses, dtype=np.float64)
+        width = poses.shape[-1] if poses.ndim == 2 else 16
+        
+        if width == 6:
+            matrices = pose_math.eulers_to_matrices(poses)
+        elif width == 7:
+            matrices = pose_math.quaternions_to_matrices(poses)
+        elif width == 16:
+            matrices = poses.reshape(-1, 4, 4).copy()
+        else:
+            raise ValueError(f"Unsupported pose width: {width}")
+        
+        if scales is not None:
+            matrices[:, :3, :3] *= np.asarray(scales, dtype=np.float64).reshape(-1, 1, 3)
+        
+        return matrices
+    
+    @staticmethod
+    def set_transforms_batch(objects, poses, scales=None):
+        """Set location and rotation for many objects with one matrix_basis write each
+        
+        poses holds one row per object in any layout accepted by
+        compose_transform_matrices. Each object keeps its current scale unless
+        scales is given as one (sx, sy, sz) row per object.
+        """
+        if len(objects) != len(poses):
+            raise ValueError(f"Got {len(poses)} poses for {len(objects)} objects")
+        if not objects:
+            return 0
+        
+        if scales is None:
+            scales = [obj.scale for obj in objects]
+        
+        # Compose every matrix up front, then do a single RNA write per object
+        rows = CameraController.compose_transform_matrices(poses, scales).tolist()
+        for obj, matrix in zip(objects, rows):
+            obj.matrix_basis = Matrix(matrix)
+        
+        return len(objects)
+    
+    @staticmethod
+    def get_transform_curves(obj):
+        """Read an object's animated transform channels as NumPy arrays
+        
+        Returns (frames, values, channels) where channels lists the (data_path,
+        index) of each value column, or None without transform animation. Curves
+        keyed on other frames than the densest one are interpolated onto it.
+        """
+        action = obj.animation_data.action if obj.animation_data else None
+        if action is None:
+            return None
+        
+        curves = [fcurve for fcurve in action.fcurves
+                  if fcurve.data_path in TRANSFORM_PATHS and len(fcurve.keyframe_points)]
+        if not curves:
+            return None
+        curves.sort(key=lambda fcurve: (TRANSFORM_PATHS.index(fcurve.data_path), fcurve.array_index))
+        
+        # Bulk-read every curve's keyframe coordinates
+        points = []
+        for fcurve in curves:
+            co = np.empty(len(fcurve.keyframe_points) * 2)
+            fcurve.keyframe_points.foreach_get('co', co)
+            points.append(co.reshape(-1, 2))
+        
+        frames = max(points, key=len)[:, 0]
+        values = np.column_stack([
+            co[:, 1] if len(co) == len(frames) and np.array_equal(co[:, 0], frames)
+            else np.interp(frames, co[:, 0], co[:, 1])
+            for co in points
+        ])
+        return frames, values, [(fcurve.data_path, fcurve.array_index) for fcurve in curves]
+    
+    @staticmethod
+    def set_transform_curves(obj, frames, values, channels, merge=False, group='Object Transforms'):
+        """Replace the keyframes of an object's transform channels with linear keys
+        
+        Each curve is rebuilt with one keyframe_points.add and one foreach_set per
+        attribute, so the number of Python calls does not grow with the key count.
+        With merge, existing keys outside the new frame range are kept, so a take
+        can be recorded over part of an animation. An action is created if needed.
+        New curves go in the given action group.
+        """
+        if obj.animation_data is None:
+            obj.animation_data_create()
+        action = obj.animation_data.action
+        if action is None:
+            action = bpy.data.actions.new(f"{obj.name}Action")
+            obj.animation_data.action = action
+        
+        frames = np.asarray(frames, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        
+        for (data_path, index), column in zip(channels, values.T):
+            fcurve = action.fcurves.find(data_path, index=index)
+            curve_group = group
+            co = np.empty((len(frames), 2))
+            co[:, 0] = frames
+            co[:, 1] = column
+            if fcurve is not None:
+                curve_group = fcurve.group.name if fcurve.group else ''
+                if merge and len(fcurve.keyframe_points):
+                    # Keep the old keys either side of the new range
+                    old = np.empty(len(fcurve.keyframe_points) * 2)
+                    fcurve.keyframe_points.foreach_get('co', old)
+                    old = old.reshape(-1, 2)
+                    before = old[old[:, 0] < frames[0]]
+                    after = old[old[:, 0] > frames[-1]]
+                    co = np.concatenate((before, co, after))
+                action.fcurves.remove(fcurve)
+            fcurve = action.fcurves.new(data_path, index=index, action_group=curve_group)
+            
+            count = len(co)
+            fcurve.keyframe_points.add(count)
+            fcurve.keyframe_points.foreach_set('co', co.ravel())
+            fcurve.keyframe_points.foreach_set('interpolation', np.full(count, LINEAR_INTERPOLATION, dtype=np.int32))
+            fcurve.update()
+        
+        return len(frames)
+    
+    @staticmethod
+    def set_channel_curves(obj, frames, values, channels, merge=False):
+        """Key a take's transform and ChannelSchema columns on a camera object
+        
+        Transform columns are keyed on obj. Channel columns are keyed on the ID
+        their path belongs to, the camera data for "data." paths, and only on the
+        frames where they have a value rather than NaN.
+        """
+        frames = np.asarray(frames, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        transform = [column for column, (data_path, _) in enumerate(channels) if data_path in TRANSFORM_PATHS]
+        if transform:
+            CameraController.set_transform_curves(obj, frames, values[:, transform],
+                                                  [channels[column] for column in transform], merge)
+        
+        for column, (path, index) in enumerate(channels):
+            if column in transform:
+                continue
+            sent = ~np.isnan(values[:, column])
+            if not sent.any():
+                continue
+            on_data, path = split_path(path)
+            owner = obj.data if on_data else obj
+            if owner is None:
+                continue
+            if path.startswith('["') and path[2:-2] not in owner:
+                # A custom property has to exist before it can be animated
+                owner[path[2:-2]] = float(values[sent, column][0])
+            CameraController.set_transform_curves(owner, frames[sent], values[sent, column:column + 1],
+                                                  [(path, index)], merge, group='')
+        return len(frames)
+    
     @staticmethod
     def create_camera_if_needed():
         """Create a camera if none exists in the scene"""
@@ -74,29 +286,21 @@ class CameraController:
     @staticmethod
     def validate_camera_data(data):
         """Validate incoming camera motion data"""
-        required_fields = ['X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z']
-        
-        # Check if all required fields are present
-        for field in required_fields:
-            if field not in data:
-                return False, f"Missing required field: {field}"
-        
-        # Check if all values are numeric
         try:
-            for field in required_fields:
-                float(data[field])
-        except (ValueError, TypeError):
-            return False, f"Invalid numeric value in field: {field}"
+            decode_pose(data)
+        except ValueError as e:
+            return False, str(e)
         
         return True, "Valid data"
     
     @staticmethod
     def apply_camera_motion(data):
         """Apply camera motion data to the active camera"""
-        # Validate data
-        is_valid, message = CameraController.validate_camera_data(data)
-        if not is_valid:
-            print(f"Invalid camera data: {message}")
+        # Validate and normalise data
+        try:
+            pose = decode_pose(data)
+        except ValueError as e:
+            print(f"Invalid camera data: {e}")
             return False
         
         # Get or create camera
@@ -107,30 +311,28 @@ class CameraController:
                 print("Failed to create camera")
                 return False
         
-        # Convert data to float
-        try:
-            location = (float(data['X']), float(data['Y']), float(data['Z']))
-            rotation = (float(data['ROT_X']), float(data['ROT_Y']), float(data['ROT_Z']))
-        except (ValueError, TypeError) as e:
-            print(f"Error converting data to float: {e}")
-            return False
-        
         # Apply transform
-        success = CameraController.set_camera_transform(camera, location, rotation)
+        success = CameraController.set_camera_pose(camera, pose)
         
         if success:
             # Update viewport
             CameraController.update_viewport()
-            print(f"Applied camera motion: Location={location}, Rotation={rotation}")
+            print(f"Applied camera motion: {pose_mode(pose)} pose {pose}")
         
         return success
     
     @staticmethod
-    def update_viewport():
-        """Update the 3D viewport to reflect camera changes"""
-        for area in bpy.context.screen.areas:
-            if area.type == 'VIEW_3D':
-                area.tag_redraw()
+    def update_viewport(context=None):
+        """Update the 3D viewports of every window to reflect camera changes
+        
+        Goes through the window manager, as context.screen is None in some
+        timer callbacks.
+        """
+        context = context or bpy.context
+        for window in context.window_manager.windows:
+            for area in window.screen.areas:
+                if area.type == 'VIEW_3D':
+                    area.tag_redraw()
     
     @staticmethod
     def reset_camera():
@@ -157,6 +359,10 @@ def apply_camera_motion(data):
     """Apply camera motion data"""
     return CameraController.apply_camera_motion(data)
 
+def set_transforms_batch(objects, poses, scales=None):
+    """Apply one pose per object in a single batch"""
+    return CameraController.set_transforms_batch(objects, poses, scales)
+
 def reset_camera():
     """Reset camera to default position"""
     return CameraController.reset_camera()
@@ -0,0 +1,99 @@
+"""
+Dead-band change detection for pose writes
+
+A phone lying still keeps streaming the same pose, and writing it again costs
+a depsgraph update and a viewport redraw for nothing. ChangeDetector keeps the
+last pose written to each target and reports whether a new pose moved it by
+more than a position or angle epsilon. Poses are compared against the last
+written pose rather than the last received one, so slow drift still gets
+written once it adds up.
+
+Rotations are compared by the angle between them whatever form the pose uses.
+A pose in a different rotation form than the last one always counts as changed,
+since writing it switches the target's rotation mode, and so does any change in
+its extra channels such as the lens.
+"""
+
+import math
+import threading
+from array import array
+
+try:
+    from .pose_math import euler_to_quaternion, matrix_to_location_quaternion, normalize_quaternion
+    from .pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MODE_MATRIX, MATRIX_FIELD, CHANNELS_FIELD
+except ImportError:
+    from pose_math import euler_to_quaternion, matrix_to_location_quaternion, normalize_quaternion
+    from pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MODE_MATRIX, MATRIX_FIELD, CHANNELS_FIELD
+
+# Default dead-band: a tenth of a millimetre and about 0.006 degrees
+POSITION_EPSILON = 1e-4
+ANGLE_EPSILON = 1e-4
+
+_MODE_CODES = {MODE_EULER: 0.0, MODE_QUATERNION: 1.0, MODE_MATRIX: 2.0}
+
+# Slots of a target's state: location, unit quaternion, rotation form
+_STATE_SIZE = 8
+
+
+class ChangeDetector:
+    """Remembers the last pose written to each target and filters out repeats"""
+
+    def __init__(self, position_epsilon=POSITION_EPSILON, angle_epsilon=ANGLE_EPSILON):
+        self.skipped = 0
+        self.written = 0
+        self._states = {}
+        self._channels = {}
+        self._lock = threading.Lock()
+        self.configure(position_epsilon, angle_epsilon)
+
+    def configure(self, position_epsilon, angle_epsilon):
+        """Set the dead-band; 0 for both only skips exact repeats"""
+        self.position_epsilon = max(0.0, float(position_epsilon))
+        self.angle_epsilon = max(0.0, float(angle_epsilon))
+        # Unit quaternions q1, q2 are within angle_epsilon when |q1 . q2| >= cos(angle / 2)
+        self._min_dot = math.cos(min(self.angle_epsilon, math.pi) / 2.0)
+
+    def changed(self, target, pose):
+        """True if pose should be written to target; remembers it as written if so
+
+        target is any hashable key, such as an object's name.
+        """
+        mode = pose_mode(pose)
+        if mode == MODE_MATRIX:
+            (x, y, z), (qw, qx, qy, qz) = matrix_to_location_quaternion(pose[MATRIX_FIELD])
+        else:
+            x, y, z = pose['X'], pose['Y'], pose['Z']
+            if mode == MODE_QUATERNION:
+                qw, qx, qy, qz = normalize_quaternion(pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+            else:
+                qw, qx, qy, qz = euler_to_quaternion(pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'])
+        code = _MODE_CODES[mode]
+        channels = pose.get(CHANNELS_FIELD)
+
+        with self._lock:
+            state = self._states.get(target)
+            if state is not None and state[7] == code and channels == self._channels.get(target):
+                epsilon = self.position_epsilon
+                if (abs(x - state[0]) <= epsilon and abs(y - state[1]) <= epsilon and abs(z - state[2]) <= epsilon
+                        and abs(qw * state[3] + qx * state[4] + qy * state[5] + qz * state[6]) >= self._min_dot):
+                    self.skipped += 1
+                    return False
+            elif state is None:
+                state = self._states[target] = array('d', bytes(8 * _STATE_SIZE))
+
+            state[0], state[1], state[2] = x, y, z
+            state[3], state[4], state[5], state[6] = qw, qx, qy, qz
+            state[7] = code
+            self._channels[target] = channels
+            self.written += 1
+        return True
+
+    def forget(self, target=None):
+        """Drop the remembered pose of target, or of every target, so the next pose is written"""
+        with self._lock:
+            if target is None:
+                self._states.clear()
+                self._channels.clear()
+            else:
+                self._states.pop(target, None)
+                self._channels.pop(target, None)
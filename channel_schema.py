@@ -0,0 +1,162 @@
+"""
+Declared channels beyond the pose: lens, focus, aperture and custom properties
+
+A pose message may carry extra channels, each a plain number in its own field:
+
+    {"X": 0.0, ..., "ROT_Z": 0.0, "LENS": 35.0, "FOCUS": 2.4, "APERTURE": 2.8, "shutter": 0.5}
+
+A ChannelSchema declares the channels the receiver understands and compiles them
+once into a fixed column layout. Decoding stores a pose's channels as one tuple in
+column order under CHANNELS_FIELD, with None for channels the message left out,
+so everything after decoding works on positions rather than field names.
+
+Each channel targets an RNA path relative to the camera object. Paths under
+"data." belong to the camera data block and '["name"]' paths are custom
+properties of the object. compile_setters resolves the paths for one camera into
+bound setters, so applying channels does no path lookups per pose.
+
+The binary codec, the take recorder and the replay buffer carry the same
+columns, so a sender using the codec must declare the same schema as the receiver.
+"""
+
+import functools
+import math
+from collections import namedtuple
+
+try:
+    from .pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+    from .sequencing import SEQUENCE_FIELD, TIMESTAMP_FIELD, STREAM_FIELD
+except ImportError:
+    from pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+    from sequencing import SEQUENCE_FIELD, TIMESTAMP_FIELD, STREAM_FIELD
+
+# field: message field; path: RNA path from the camera object; step: codec quantisation step
+Channel = namedtuple('Channel', 'field path step')
+
+LENS = Channel('LENS', 'data.lens', 0.01)
+FOCUS = Channel('FOCUS', 'data.dof.focus_distance', 1e-4)
+APERTURE = Channel('APERTURE', 'data.dof.aperture_fstop', 0.01)
+STANDARD_CHANNELS = (LENS, FOCUS, APERTURE)
+
+CUSTOM_STEP = 1e-4
+
+# The codec marks which channels a frame carries in a 32-bit mask
+MAX_CHANNELS = 32
+
+DATA_PREFIX = 'data.'
+
+_RESERVED_FIELDS = frozenset(EULER_FIELDS + QUATERNION_FIELDS + (
+    MATRIX_FIELD, CHANNELS_FIELD, SEQUENCE_FIELD, TIMESTAMP_FIELD, STREAM_FIELD, 'type'))
+
+
+def custom_channel(name, step=CUSTOM_STEP):
+    """Channel for a custom property of the camera object, sent under its own name"""
+    if not name.isidentifier():
+        raise ValueError(f"Custom channel name must be an identifier: {name!r}")
+    return Channel(name, f'["{name}"]', step)
+
+
+def parse_custom_channels(text):
+    """Channels for a comma-separated list of custom property names"""
+    return [custom_channel(name.strip()) for name in text.split(',') if name.strip()]
+
+
+def split_path(path):
+    """Return (True, path on the camera data) for data paths, else (False, path on the object)"""
+    if path.startswith(DATA_PREFIX):
+        return True, path[len(DATA_PREFIX):]
+    return False, path
+
+
+def _resolve_setter(obj, path):
+    """Bind a setter for path on obj; raises AttributeError if the path does not resolve"""
+    if path.startswith('["'):
+        return functools.partial(obj.__setitem__, path[2:-2])
+    *owners, name = path.split('.')
+    owner = functools.reduce(getattr, owners, obj)
+    if owner is None or not hasattr(owner, name):
+        raise AttributeError(f"{path} does not resolve on {obj!r}")
+    return functools.partial(setattr, owner, name)
+
+
+class ChannelSchema:
+    """Compiled column layout of the declared channels"""
+
+    def __init__(self, channels=STANDARD_CHANNELS):
+        channels = tuple(channels)
+        fields = [channel.field for channel in channels]
+        if len(channels) > MAX_CHANNELS:
+            raise ValueError(f"At most {MAX_CHANNELS} channels can be declared")
+        for field in fields:
+            if field in _RESERVED_FIELDS:
+                raise ValueError(f"Channel field is reserved for the pose: {field}")
+            if fields.count(field) > 1:
+                raise ValueError(f"Channel declared twice: {field}")
+
+        self.channels = channels
+        self.fields = tuple(fields)
+        self.steps = tuple(channel.step for channel in channels)
+        self.columns = {field: column for column, field in enumerate(fields)}
+        # One animation curve per channel, as (data_path, index) like the transform channels
+        self.keys = [(channel.path, 0) for channel in channels]
+        self.empty = (None,) * len(channels)
+        self._field_set = frozenset(fields)
+
+    def __len__(self):
+        return len(self.channels)
+
+    def __eq__(self, other):
+        return isinstance(other, ChannelSchema) and self.channels == other.channels
+
+    def __hash__(self):
+        return hash(self.channels)
+
+    @classmethod
+    def with_custom(cls, text):
+        """The standard channels plus the custom properties named in text"""
+        return cls(STANDARD_CHANNELS + tuple(parse_custom_channels(text)))
+
+    def read(self, data):
+        """Channel values of a message in column order, or None if it carries none
+
+        Raises ValueError on bad values.
+        """
+        present = self._field_set.intersection(data)
+        if not present:
+            return None
+        values = list(self.empty)
+        for field in present:
+            try:
+                value = float(data[field])
+            except (ValueError, TypeError):
+                raise ValueError(f"Invalid numeric value in field: {field}")
+            if not math.isfinite(value):
+                raise ValueError(f"Non-finite value in field: {field}")
+            values[self.columns[field]] = value
+        return tuple(values)
+
+    def named(self, values):
+        """Channel values from read() as a dict of message fields, leaving out missing ones"""
+        return {field: value for field, value in zip(self.fields, values) if value is not None}
+
+    def compile_setters(self, obj):
+        """(column, setter) pairs writing each channel to obj
+
+        Channels whose path does not resolve on obj, e.g. lens on an empty, are
+        left out.
+        """
+        setters = []
+        for column, channel in enumerate(self.channels):
+            try:
+                setters.append((column, _resolve_setter(obj, channel.path)))
+            except AttributeError:
+                pass
+        return setters
+
+
+def apply_channels(setters, values):
+    """Write a pose's channel values through setters from compile_setters"""
+    for column, setter in setters:
+        value = values[column]
+        if value is not None:
+            setter(value)
@@ -0,0 +1,172 @@
+"""
+Sender clock synchronisation over the control channel
+
+The receiver pings each sender on the same connection as the control frames:
+
+    receiver -> sender   {"type": "ping", "id": 7, "t0": 1234.5678}
+    sender -> receiver   {"type": "pong", "id": 7, "t0": 1234.5678, "t1": ..., "t2": ...}
+
+t0 is the receiver's clock when the ping was sent, and t1 and t2 are the
+sender's clock when it received the ping and sent the pong. The receiver reads
+t3 on arrival and takes the NTP estimates:
+
+    offset = ((t1 - t0) + (t2 - t3)) / 2      sender clock minus receiver clock
+    delay  = (t3 - t0) - (t2 - t1)            network round trip
+
+Only pongs with a round trip close to the smallest recently seen are used, since
+queueing delay is rarely symmetric. Offset and drift come from a weighted linear
+fit over exponentially decaying sums, so the estimate uses O(1) memory however
+long the session runs. Sample TS values (sender clock) then map to the receiver's
+time.perf_counter() clock with to_local.
+"""
+
+import time
+
+PING_TYPE = 'ping'
+PONG_TYPE = 'pong'
+
+# Seconds between pings once synchronised, and during the initial burst
+PING_INTERVAL = 1.0
+BURST_INTERVAL = 0.1
+BURST_PINGS = 8
+
+# Half-life in seconds of a sample's weight in the offset and drift fit
+HALF_LIFE = 60.0
+
+# Accept pongs whose round trip is within this factor (plus a small constant)
+# of the smallest recent one; the minimum relaxes by MIN_DELAY_GROWTH per second
+DELAY_FACTOR = 1.5
+DELAY_SLACK = 0.002
+MIN_DELAY_GROWTH = 0.01
+
+
+def is_ping(data):
+    """Check whether a decoded message is a clock ping"""
+    return isinstance(data, dict) and data.get('type') == PING_TYPE
+
+
+def is_pong(data):
+    """Check whether a decoded message is a clock pong"""
+    return isinstance(data, dict) and data.get('type') == PONG_TYPE
+
+
+def make_pong(ping, received, now=None):
+    """Sender side: answer a ping received at time received on the sender clock"""
+    return {
+        'type': PONG_TYPE,
+        'id': ping.get('id'),
+        't0': ping.get('t0'),
+        't1': received,
+        't2': time.time() if now is None else now,
+    }
+
+
+class ClockSync:
+    """Estimates one sender's clock offset and drift relative to this process"""
+
+    def __init__(self, half_life=HALF_LIFE):
+        self.half_life = half_life
+        self.offset = 0.0
+        self.drift = 0.0
+        self.delay = None
+        self.samples = 0
+        self.rejected = 0
+
+        self._next_id = 0
+        self._pings_sent = 0
+        self._last_ping = None
+        self._min_delay = None
+
+        # Exponentially decayed weighted sums for the linear fit of offset over
+        # local time, measured from _origin to keep the numbers small
+        self._origin = None
+        self._offset_origin = 0.0
+        self._last_update = None
+        self._sw = self._sx = self._sxx = self._sy = self._sxy = 0.0
+        self._mean_x = self._mean_y = 0.0
+
+    @property
+    def synced(self):
+        return self.samples > 0
+
+    def poll(self, now=None):
+        """Return a ping to send if one is due, otherwise None"""
+        now = time.perf_counter() if now is None else now
+        interval = BURST_INTERVAL if self._pings_sent < BURST_PINGS else PING_INTERVAL
+        if self._last_ping is not None and now - self._last_ping < interval:
+            return None
+        self._last_ping = now
+        self._pings_sent += 1
+        self._next_id += 1
+        return {'type': PING_TYPE, 'id': self._next_id, 't0': now}
+
+    def on_pong(self, pong, now=None):
+        """Feed a pong into the estimate; returns True if it was used"""
+        t3 = time.perf_counter() if now is None else now
+        try:
+            t0, t1, t2 = float(pong['t0']), float(pong['t1']), float(pong['t2'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        delay = (t3 - t0) - (t2 - t1)
+        if delay < 0.0 or t3 < t0:
+            self.rejected += 1
+            return False
+
+        # Let the minimum creep up so a route change doesn't freeze the estimate
+        if self._min_delay is None or delay < self._min_delay:
+            self._min_delay = delay
+        elif self._last_update is not None:
+            self._min_delay *= 1.0 + MIN_DELAY_GROWTH * (t3 - self._last_update)
+        if delay > self._min_delay * DELAY_FACTOR + DELAY_SLACK:
+            self.rejected += 1
+            return False
+
+        offset = ((t1 - t0) + (t2 - t3)) / 2.0
+        local = (t0 + t3) / 2.0
+        self._add_sample(local, offset, t3)
+        self.delay = delay
+        return True
+
+    def _add_sample(self, local, offset, now):
+        if self._origin is None:
+            self._origin = local
+            self._offset_origin = offset
+        else:
+            decay = 0.5 ** ((now - self._last_update) / self.half_life)
+            self._sw *= decay
+            self._sx *= decay
+            self._sxx *= decay
+            self._sy *= decay
+            self._sxy *= decay
+        self._last_update = now
+
+        x = local - self._origin
+        y = offset - self._offset_origin
+        self._sw += 1.0
+        self._sx += x
+        self._sxx += x * x
+        self._sy += y
+        self._sxy += x * y
+        self.samples += 1
+
+        # Weighted least squares; drift stays 0 until the samples span some time
+        spread = self._sw * self._sxx - self._sx * self._sx
+        if spread > 1e-9 * self._sw * self._sw:
+            self.drift = (self._sw * self._sxy - self._sx * self._sy) / spread
+        else:
+            self.drift = 0.0
+        self._mean_x = self._sx / self._sw
+        self._mean_y = self._sy / self._sw
+        self.offset = self.offset_at(now)
+
+    def offset_at(self, local):
+        """Estimated sender-minus-receiver offset at a receiver time"""
+        if not self.synced:
+            return 0.0
+        return self._offset_origin + self._mean_y + self.drift * (local - self._origin - self._mean_x)
+
+    def to_local(self, sender_time, now=None):
+        """Map a sender timestamp to the receiver's perf_counter clock"""
+        now = time.perf_counter() if now is None else now
+        return sender_time - self.offset_at(now)
@@ -0,0 +1,234 @@
+"""
+Mapping of sender coordinate conventions onto Blender's
+
+Phones and engines disagree on which way is up and on handedness. A profile
+names, for each Blender axis, the sender axis it comes from, both for the world
+and for the camera's own axes (Blender cameras look down -Z with +Y up). It also
+has a scale for the sender's units, an origin offset and an optional anchor
+object whose world matrix the result is parented to.
+
+A profile compiles once into two 4x4 matrices, so a sender pose P maps to
+
+    anchor @ offset @ world_axes @ scale @ P @ scale⁻¹ @ camera_axesᵀ
+
+as left @ P @ right. Batches of poses map with one stacked matmul, and single
+poses with plain float arithmetic, which is far quicker than NumPy for one 4x4.
+The compiled matrices are cached and only rebuilt when the profile or anchor
+changes.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+try:
+    from . import pose_math
+    from .pose_protocol import (pose_mode, EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD,
+                                MODE_EULER, MODE_QUATERNION, MODE_MATRIX)
+except ImportError:
+    import pose_math
+    from pose_protocol import (pose_mode, EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD,
+                               MODE_EULER, MODE_QUATERNION, MODE_MATRIX)
+
+AXES = {
+    'X': (1, 0, 0), '-X': (-1, 0, 0),
+    'Y': (0, 1, 0), '-Y': (0, -1, 0),
+    'Z': (0, 0, 1), '-Z': (0, 0, -1),
+}
+
+# (world axes, camera axes): the sender axis behind Blender's X, Y and Z
+PRESETS = {
+    # Z up, right-handed, camera looking down -Z
+    'BLENDER': (('X', 'Y', 'Z'), ('X', 'Y', 'Z')),
+    # ARKit, ARCore, WebXR and three.js: Y up, right-handed, camera looking down -Z
+    'Y_UP': (('X', '-Z', 'Y'), ('X', 'Y', 'Z')),
+    # Unity: Y up, left-handed, camera looking down +Z
+    'UNITY': (('X', 'Z', 'Y'), ('X', 'Y', '-Z')),
+}
+
+
+def _axes_matrix(axes):
+    """3x3 matrix whose rows pick the sender axis for each Blender axis"""
+    if len(axes) != 3 or any(axis not in AXES for axis in axes):
+        raise ValueError(f"Axes must be three of {', '.join(AXES)}")
+    matrix = np.array([AXES[axis] for axis in axes], dtype=np.float64)
+    if abs(np.linalg.det(matrix)) != 1.0:
+        raise ValueError(f"Axes {', '.join(axes)} use a sender axis twice")
+    return matrix
+
+
+def _multiply(a, b):
+    """Product of two 4x4 matrices given as 16 row-major values"""
+    return [a[r] * b[c] + a[r + 1] * b[c + 4] + a[r + 2] * b[c + 8] + a[r + 3] * b[c + 12]
+            for r in (0, 4, 8, 12) for c in range(4)]
+
+
+class MappingProfile:
+    """Axis conventions, scale and origin offset of one sender"""
+
+    def __init__(self, world_axes=('X', 'Y', 'Z'), camera_axes=('X', 'Y', 'Z'), scale=1.0,
+                 offset=(0.0, 0.0, 0.0)):
+        self.world_axes = tuple(world_axes)
+        self.camera_axes = tuple(camera_axes)
+        self.scale = float(scale)
+        self.offset = tuple(float(value) for value in offset)
+
+    @classmethod
+    def preset(cls, name, scale=1.0, offset=(0.0, 0.0, 0.0)):
+        """Profile for a named convention in PRESETS"""
+        world_axes, camera_axes = PRESETS[name]
+        return cls(world_axes, camera_axes, scale, offset)
+
+    def key(self):
+        return (self.world_axes, self.camera_axes, self.scale, self.offset)
+
+    def compile(self, anchor=None):
+        """Return the (left, right) 4x4 matrices for this profile
+
+        anchor is an optional 4x4 world matrix, given as 16 row-major values or
+        nested rows. Raises ValueError for axes that repeat a sender axis, mix
+        handedness between world and camera, or a zero scale.
+        """
+        if np is None:
+            raise ImportError("NumPy is required for coordinate mapping")
+        world = _axes_matrix(self.world_axes)
+        camera = _axes_matrix(self.camera_axes)
+        # A mirrored world needs the camera axes mirrored too, or rotations come
+        # out as reflections
+        if np.linalg.det(world) != np.linalg.det(camera):
+            raise ValueError("World and camera axes must have the same handedness")
+        if self.scale == 0.0:
+            raise ValueError("Scale must not be zero")
+
+        left = np.eye(4)
+        left[:3, :3] = world * self.scale
+        left[:3, 3] = self.offset
+        if anchor is not None:
+            left = np.asarray(anchor, dtype=np.float64).reshape(4, 4) @ left
+
+        right = np.eye(4)
+        right[:3, :3] = camera.T / self.scale
+        return left, right
+
+
+class CoordinateMapper:
+    """Applies the compiled matrices of the current profile to poses
+
+    set_profile and set_anchor may be called as often as convenient; the matrices
+    are only recompiled when the profile or anchor actually changes. The compiled
+    pair is swapped in one assignment, so mapping from another thread is safe.
+    """
+
+    def __init__(self, profile=None):
+        self.profile = None
+        self.anchor = None
+        self.identity = True
+        self._compiled = None
+        self.set_profile(profile or MappingProfile())
+
+    def set_profile(self, profile):
+        """Use profile from now on; raises ValueError and keeps the old one if it is invalid"""
+        if self.profile is not None and profile.key() == self.profile.key():
+            return False
+        self._compile(profile, self.anchor)
+        return True
+
+    def set_anchor(self, matrix):
+        """Parent mapped poses to a 4x4 world matrix, or to nothing with None"""
+        anchor = None if matrix is None else tuple(float(value) for row in matrix for value in row)
+        if anchor == self.anchor:
+            return False
+        self._compile(self.profile, anchor)
+        return True
+
+    def _compile(self, profile, anchor):
+        if profile.key() == MappingProfile().key() and anchor is None:
+            compiled = None
+        else:
+            left, right = profile.compile(anchor)
+            compiled = (left, right, left.ravel().tolist(), right.ravel().tolist())
+        self.profile = profile
+        self.anchor = anchor
+        self._compiled = compiled
+        self.identity = compiled is None
+
+    def map_matrices(self, matrices):
+        """Map (N, 4, 4) pose matrices in one stacked multiply"""
+        compiled = self._compiled
+        if compiled is None:
+            return matrices
+        left, right = compiled[:2]
+        return left @ matrices @ right
+
+    def map_pose(self, pose):
+        """Map one decoded pose, keeping its rotation form and channels"""
+        compiled = self._compiled
+        if compiled is None:
+            return pose
+
+        mapped = self._map_transform(pose, compiled)
+        channels = pose.get(CHANNELS_FIELD)
+        if channels is not None:
+            mapped[CHANNELS_FIELD] = channels
+        return mapped
+
+    def _map_transform(self, pose, compiled):
+        mode = pose_mode(pose)
+        if mode == MODE_MATRIX:
+            values = pose[MATRIX_FIELD]
+        else:
+            location = (pose['X'], pose['Y'], pose['Z'])
+            if mode == MODE_QUATERNION:
+                quat = (pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+            else:
+                quat = pose_math.euler_to_quaternion(pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'])
+            values = pose_math.location_quaternion_to_matrix(location, quat)
+
+        values = _multiply(_multiply(compiled[2], values), compiled[3])
+
+        if mode == MODE_MATRIX:
+            return {MATRIX_FIELD: tuple(values)}
+        (x, y, z), quat = pose_math.matrix_to_location_quaternion(values)
+        if mode == MODE_QUATERNION:
+            return dict(zip(QUATERNION_FIELDS, (x, y, z) + tuple(quat)))
+        return dict(zip(EULER_FIELDS, (x, y, z) + tuple(pose_math.quaternion_to_euler(*quat))))
+
+    def map_poses(self, poses):
+        """Map a list of decoded poses, keeping each one's rotation form
+
+        Poses that share a form, which is every pose of a normal batch, are
+        converted and mapped as one array.
+        """
+        if self._compiled is None or not poses:
+            return poses
+
+        mode = pose_mode(poses[0])
+        if len(poses) == 1 or any(pose_mode(pose) != mode for pose in poses):
+            return [self.map_pose(pose) for pose in poses]
+
+        if mode == MODE_EULER:
+            matrices = pose_math.eulers_to_matrices([[pose[field] for field in EULER_FIELDS] for pose in poses])
+        elif mode == MODE_QUATERNION:
+            matrices = pose_math.quaternions_to_matrices([[pose[field] for field in QUATERNION_FIELDS] for pose in poses])
+        else:
+            matrices = np.array([pose[MATRIX_FIELD] for pose in poses], dtype=np.float64).reshape(-1, 4, 4)
+
+        matrices = self.map_matrices(matrices)
+
+        if mode == MODE_EULER:
+            rows = pose_math.matrices_to_quaternions(matrices)
+            rows = np.column_stack((rows[:, :3], pose_math.quaternions_to_eulers(rows[:, 3:])))
+            mapped = [dict(zip(EULER_FIELDS, row)) for row in rows.tolist()]
+        elif mode == MODE_QUATERNION:
+            rows = pose_math.matrices_to_quaternions(matrices)
+            mapped = [dict(zip(QUATERNION_FIELDS, row)) for row in rows.tolist()]
+        else:
+            mapped = [{MATRIX_FIELD: tuple(row)} for row in matrices.reshape(-1, 16).tolist()]
+
+        # Channels are not spatial and pass through unchanged
+        for pose, result in zip(poses, mapped):
+            channels = pose.get(CHANNELS_FIELD)
+            if channels is not None:
+                result[CHANNELS_FIELD] = channels
+        return mapped
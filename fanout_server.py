@@ -0,0 +1,447 @@
+"""
+Multi-process pose ingest for many senders feeding one Blender
+
+Client connections are sharded across a pool of worker processes. Each worker
+accepts connections (SO_REUSEPORT sockets where available, otherwise a shared
+listening socket passed to every worker), reads length-prefixed frames,
+decodes JSON or codec frames and validates them. Only the newest pose per
+connection from each read cycle is kept. Workers then forward compact packed
+poses over a pipe to one aggregator thread in the parent process, which hands
+them to a callback, e.g. to forward to Blender.
+
+JSON parsing happens in the workers, so it is no longer bound to a single GIL.
+Workers speak the same protocol as the single-threaded server: they answer
+hellos with a welcome and acknowledgements, drop stale sequenced poses, fuse
+IMU batches and ask for codec keyframes. That state lives in the worker that
+accepted the connection, so a sender reconnecting to another worker is
+welcomed as a new session rather than resumed.
+"""
+
+import json
+import math
+import multiprocessing
+import selectors
+import socket
+import struct
+import sys
+import threading
+import time
+from multiprocessing.connection import wait
+
+try:
+    from . import metrics
+    from .channel_schema import ChannelSchema
+    from .flow_control import encode_frame, split_frames, MAX_FRAME_SIZE
+    from .imu_fusion import ImuFusion, decode_items
+    from .pose_codec import PoseDecoder, is_codec_frame, resync_message
+    from .pose_hub import wire_pose
+    from .pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+    from .sequencing import SequenceFilter
+    from .session import SessionLink, SessionTable, is_hello
+except ImportError:
+    import metrics
+    from channel_schema import ChannelSchema
+    from flow_control import encode_frame, split_frames, MAX_FRAME_SIZE
+    from imu_fusion import ImuFusion, decode_items
+    from pose_codec import PoseDecoder, is_codec_frame, resync_message
+    from pose_hub import wire_pose
+    from pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+    from sequencing import SequenceFilter
+    from session import SessionLink, SessionTable, is_hello
+
+# Each worker message starts with the poses decoded and messages rejected
+# since the last one, followed by packed pose records: client id, pose kind and
+# channel count, then the pose values and the channels as doubles, NaN for a
+# channel the pose left out
+_BLOCK_HEADER = struct.Struct('!II')
+_RECORD_HEADER = struct.Struct('!IBB')
+_KIND_EULER = 0
+_KIND_QUATERNION = 1
+_KIND_MATRIX = 2
+_KIND_VALUES = {
+    _KIND_EULER: struct.Struct(f'!{len(EULER_FIELDS)}d'),
+    _KIND_QUATERNION: struct.Struct(f'!{len(QUATERNION_FIELDS)}d'),
+    _KIND_MATRIX: struct.Struct('!16d'),
+}
+
+_WORKER_ID_SHIFT = 24
+
+# Samples the workers hold back to restore order, as in the single-threaded server
+SEQUENCE_WINDOW = 4
+
+
+def pack_pose(client_id, pose):
+    """Pack a decoded pose into a compact record"""
+    if MATRIX_FIELD in pose:
+        kind, values = _KIND_MATRIX, pose[MATRIX_FIELD]
+    elif 'QUAT_W' in pose:
+        kind, values = _KIND_QUATERNION, [pose[field] for field in QUATERNION_FIELDS]
+    else:
+        kind, values = _KIND_EULER, [pose[field] for field in EULER_FIELDS]
+    channels = pose.get(CHANNELS_FIELD) or ()
+    record = _RECORD_HEADER.pack(client_id, kind, len(channels)) + _KIND_VALUES[kind].pack(*values)
+    if channels:
+        record += struct.pack(f'!{len(channels)}d', *(math.nan if value is None else value for value in channels))
+    return record
+
+
+def pack_block(decoded, errors, newest):
+    """Pack a worker message from its counts and {client_id: pose}"""
+    return _BLOCK_HEADER.pack(decoded, errors) + b''.join(
+        pack_pose(client_id, pose) for client_id, pose in newest.items())
+
+
+def unpack_block(data):
+    """Unpack a worker message into (decoded, errors, [(client_id, pose), ...])"""
+    decoded, errors = _BLOCK_HEADER.unpack_from(data)
+    return decoded, errors, unpack_poses(data, _BLOCK_HEADER.size)
+
+
+def unpack_poses(data, offset=0):
+    """Unpack packed records into a list of (client_id, pose) pairs"""
+    poses = []
+    while offset < len(data):
+        client_id, kind, count = _RECORD_HEADER.unpack_from(data, offset)
+        offset += _RECORD_HEADER.size
+        body = _KIND_VALUES[kind]
+        values = body.unpack_from(data, offset)
+        offset += body.size
+        if kind == _KIND_MATRIX:
+            pose = {MATRIX_FIELD: values}
+        elif kind == _KIND_QUATERNION:
+            pose = dict(zip(QUATERNION_FIELDS, values))
+        else:
+            pose = dict(zip(EULER_FIELDS, values))
+        if count:
+            channels = struct.unpack_from(f'!{count}d', data, offset)
+            offset += 8 * count
+            pose[CHANNELS_FIELD] = tuple(None if math.isnan(value) else value for value in channels)
+        poses.append((client_id, pose))
+    return poses
+
+
+class _Ingest:
+    """Receiver state of one worker: sequencing, sessions and IMU fusion"""
+
+    def __init__(self, schema=None):
+        self.schema = schema
+        self.sequence_filter = SequenceFilter(window=SEQUENCE_WINDOW)
+        self.sessions = SessionTable(on_expire=self.sequence_filter.remove)
+        self.fusion = ImuFusion()
+
+    def reply(self, link):
+        """Welcome or acknowledgement due on a connection; workers never record"""
+        if link.session is None:
+            return None
+        return link.poll(self.sequence_filter.last_sequence(link.session), False)
+
+    def close(self, connection):
+        self.sequence_filter.remove(connection.client_id)
+        connection.link.close(self.sessions)
+
+
+def decode_message(message, connection, ingest):
+    """Decode one JSON or codec message of a connection into a list of poses
+
+    Hellos update the connection's session and yield no poses. Raises
+    ValueError for a malformed message.
+    """
+    if is_codec_frame(message):
+        pose = connection.decoder.decode(message)
+        return [pose] if pose is not None else []
+    data = json.loads(message)
+    link = connection.link
+    if is_hello(data):
+        link.on_hello(data, ingest.sessions)
+        if not link.resumed:
+            # A new session numbers its poses afresh
+            ingest.sequence_filter.remove(link.session)
+        return []
+    stream = link.session if link.session is not None else connection.client_id
+    items = ingest.sequence_filter.filter(data if isinstance(data, list) else [data], stream)
+    poses, _ = decode_items(items, stream, ingest.fusion, ingest.schema)
+    return poses
+
+
+def _open_listener(host, port, reuse_port):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    return sock
+
+
+def supports_reuse_port():
+    """SO_REUSEPORT load-balances accepts across processes on Linux"""
+    return hasattr(socket, 'SO_REUSEPORT') and sys.platform.startswith('linux')
+
+
+class _Connection:
+    __slots__ = ('sock', 'client_id', 'buffer', 'decoder', 'link', 'outgoing')
+
+    def __init__(self, sock, client_id, schema=None):
+        self.sock = sock
+        self.client_id = client_id
+        self.buffer = b''
+        self.decoder = PoseDecoder(schema)
+        self.link = SessionLink()
+        # Control frames the sender hasn't taken yet
+        self.outgoing = b''
+
+    def send(self, message):
+        """Queue a control frame and send what the socket takes. Raises OSError"""
+        self.outgoing += encode_frame(message)
+        self.flush()
+
+    def flush(self):
+        """Send queued control frames; returns True if some is left. Raises OSError"""
+        try:
+            sent = self.sock.send(self.outgoing)
+        except (BlockingIOError, InterruptedError):
+            return True
+        self.outgoing = self.outgoing[sent:]
+        return bool(self.outgoing)
+
+
+def _worker_main(worker_index, listener, host, port, pipe, stop_event, schema=None):
+    """Accept, decode and validate in a worker process, forwarding packed poses"""
+    if listener is None:
+        listener = _open_listener(host, port, reuse_port=True)
+    listener.setblocking(False)
+
+    selector = selectors.DefaultSelector()
+    selector.register(listener, selectors.EVENT_READ, None)
+    ingest = _Ingest(schema)
+    next_client = 0
+
+    def close(connection):
+        selector.unregister(connection.sock)
+        connection.sock.close()
+        ingest.close(connection)
+
+    try:
+        while not stop_event.is_set():
+            newest = {}
+            decoded = errors = 0
+            for key, events in selector.select(timeout=0.1):
+                if key.data is None:
+                    try:
+                        sock, _ = listener.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue
+                    sock.setblocking(False)
+                    next_client += 1
+                    client_id = (worker_index << _WORKER_ID_SHIFT) | (next_client & 0xFFFFFF)
+                    selector.register(sock, selectors.EVENT_READ, _Connection(sock, client_id, schema))
+                    continue
+
+                connection = key.data
+                if events & selectors.EVENT_WRITE:
+                    try:
+                        if not connection.flush():
+                            selector.modify(connection.sock, selectors.EVENT_READ, connection)
+                    except OSError:
+                        close(connection)
+                        continue
+                if not events & selectors.EVENT_READ:
+                    continue
+
+                try:
+                    chunk = connection.sock.recv(65536)
+                except (BlockingIOError, InterruptedError):
+                    continue
+                except OSError:
+                    chunk = b''
+                if not chunk:
+                    close(connection)
+                    continue
+
+                frames, connection.buffer = split_frames(connection.buffer + chunk)
+                if len(connection.buffer) >= 4 and struct.unpack_from('!I', connection.buffer)[0] > MAX_FRAME_SIZE:
+                    close(connection)
+                    continue
+
+                for frame in frames:
+                    try:
+                        poses = decode_message(frame, connection, ingest)
+                    except ValueError:
+                        errors += 1
+                        continue
+                    decoded += len(poses)
+                    if poses:
+                        # Only the newest pose of each cycle per connection matters downstream
+                        newest[connection.client_id] = poses[-1]
+
+                # Ask for a keyframe after lost codec frames, and welcome or acknowledge the sender
+                replies = [resync_message()] if connection.decoder.take_resync_request() else []
+                reply = ingest.reply(connection.link)
+                if reply:
+                    replies.append(reply)
+                try:
+                    for message in replies:
+                        connection.send(message)
+                except OSError:
+                    close(connection)
+                    continue
+                if connection.outgoing:
+                    selector.modify(connection.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, connection)
+
+            if newest or errors:
+                pipe.send_bytes(pack_block(decoded, errors, newest))
+    except (BrokenPipeError, EOFError, KeyboardInterrupt):
+        pass
+    finally:
+        selector.close()
+        listener.close()
+
+
+class FanoutServer:
+    """Pool of ingest worker processes feeding one aggregator callback"""
+
+    def __init__(self, workers=None, host='0.0.0.0', port=8765, on_poses=None, schema=None):
+        self.workers = workers or multiprocessing.cpu_count()
+        self.host = host
+        self.port = port
+        # ChannelSchema of the channels workers decode and pass on under CHANNELS
+        self.schema = schema
+        # Called from the aggregator thread with a list of (client_id, pose) pairs
+        self.on_poses = on_poses or (lambda poses: None)
+
+        # Totals across all workers; received counts every decoded pose
+        # while on_poses only sees the newest per connection and cycle
+        self.received = 0
+        self.errors = 0
+        self._processes = []
+        self._pipes = []
+        self._stop_event = None
+        self._aggregator = None
+        self._shared_listener = None
+        self._running = False
+
+    def start(self):
+        """Start the worker processes and the aggregator thread"""
+        context = multiprocessing.get_context('spawn')
+        self._stop_event = context.Event()
+
+        # Without SO_REUSEPORT every worker accepts on one shared listening socket
+        reuse_port = supports_reuse_port()
+        if not reuse_port:
+            self._shared_listener = _open_listener(self.host, self.port, reuse_port=False)
+
+        for index in range(self.workers):
+            receiver, sender = context.Pipe(duplex=False)
+            process = context.Process(
+                target=_worker_main,
+                args=(index, self._shared_listener, self.host, self.port, sender, self._stop_event, self.schema),
+                daemon=True,
+            )
+            process.start()
+            sender.close()
+            self._processes.append(process)
+            self._pipes.append(receiver)
+
+        self._running = True
+        self._aggregator = threading.Thread(target=self._aggregate, daemon=True)
+        self._aggregator.start()
+
+    def _aggregate(self):
+        pipes = list(self._pipes)
+        while self._running and pipes:
+            for pipe in wait(pipes, timeout=0.2):
+                try:
+                    decoded, errors, poses = unpack_block(pipe.recv_bytes())
+                except (EOFError, OSError):
+                    pipes.remove(pipe)
+                    continue
+                self.received += decoded
+                self.errors += errors
+                metrics.poses_received.inc(decoded)
+                metrics.poses_dropped.inc(decoded - len(poses))
+                metrics.parse_errors.inc(errors)
+                if not poses:
+                    continue
+                try:
+                    self.on_poses(poses)
+                except Exception as e:
+                    print(f"❌ Error handling aggregated poses: {e}")
+
+    def stop(self):
+        """Stop the workers and the aggregator"""
+        self._running = False
+        if self._stop_event:
+            self._stop_event.set()
+        for process in self._processes:
+            process.join(timeout=1.0)
+            if process.is_alive():
+                process.terminate()
+        if self._aggregator:
+            self._aggregator.join(timeout=1.0)
+        for pipe in self._pipes:
+            pipe.close()
+        if self._shared_listener:
+            self._shared_listener.close()
+        self._processes, self._pipes = [], []
+        self._shared_listener = None
+
+
+class PoseForwarder:
+    """Sends the newest aggregated pose to Blender over one length-prefixed connection
+
+    The socket is non-blocking. A frame Blender can't take yet is kept and
+    finished on a later call; newer poses are skipped meanwhile, since Blender
+    would coalesce them anyway, but a frame is never cut short. Whatever Blender
+    sends back, such as rate advice, clock pings and acks, is read and ignored so
+    its sends never stall.
+    """
+
+    def __init__(self, host='localhost', port=8765, retry_interval=1.0, schema=None):
+        self.host = host
+        self.port = port
+        self.retry_interval = retry_interval
+        # Names the CHANNELS columns, which go out under their own fields
+        self.schema = schema if schema is not None else ChannelSchema()
+        self.socket = None
+        self._next_attempt = 0.0
+        # Unsent rest of the current frame
+        self._pending = None
+
+    def __call__(self, poses):
+        if not poses:
+            return
+        now = time.monotonic()
+        if self.socket is None:
+            if now < self._next_attempt:
+                return
+            try:
+                self.socket = socket.create_connection((self.host, self.port), timeout=1.0)
+                self.socket.setblocking(False)
+            except OSError as e:
+                print(f"⚠️  Could not connect to Blender at {self.host}:{self.port}: {e}")
+                self._next_attempt = now + self.retry_interval
+                return
+            self._pending = None
+        try:
+            self._drain()
+            if self._pending is None:
+                self._pending = memoryview(encode_frame(wire_pose(poses[-1][1], self.schema)))
+            sent = self.socket.send(self._pending)
+            self._pending = self._pending[sent:] if sent < len(self._pending) else None
+        except BlockingIOError:
+            # Blender is behind; the rest of the frame goes on a later call
+            pass
+        except OSError:
+            self.socket.close()
+            self.socket = None
+            self._pending = None
+            self._next_attempt = now + self.retry_interval
+
+    def _drain(self):
+        """Read and discard what Blender sent back; raises ConnectionError once it closes"""
+        while True:
+            try:
+                if not self.socket.recv(65536):
+                    raise ConnectionError("Blender closed the connection")
+            except BlockingIOError:
+                return
@@ -0,0 +1,223 @@
+"""
+Sender rate negotiation for the Camera Motion Receiver
+
+The receiver measures how fast it can actually apply poses and sends control
+frames back to each sender on the same connection:
+
+    {"type": "control", "apply_rate": 58.7, "receive_rate": 120.3,
+     "max_rate": 58.7, "batch": 1}
+
+max_rate is the highest pose rate worth sending (null when there is no limit)
+and batch is how many poses to pack into one message (a JSON array of poses).
+Senders that ignore control frames keep working; extra poses are coalesced.
+"""
+
+import json
+import math
+import struct
+import time
+
+CONTROL_TYPE = 'control'
+
+# Minimum seconds between two control frames to the same sender
+ADVICE_INTERVAL = 1.0
+
+# Relative change in advised rate that is worth telling the sender about
+RATE_TOLERANCE = 0.1
+
+# Largest frame accepted from a sender; a longer length prefix means the stream
+# is corrupt, and reading it would allocate the whole claimed size
+MAX_FRAME_SIZE = 1 << 20
+
+
+def encode_frame(data):
+    """Encode a JSON-serialisable object as a length-prefixed frame"""
+    message = json.dumps(data).encode('utf-8')
+    return struct.pack('!I', len(message)) + message
+
+
+def split_frames(buffer):
+    """Split complete length-prefixed frames off the front of buffer
+
+    Returns (frames, remaining_bytes).
+    """
+    frames = []
+    offset = 0
+    while len(buffer) - offset >= 4:
+        length = struct.unpack_from('!I', buffer, offset)[0]
+        if len(buffer) - offset - 4 < length:
+            break
+        frames.append(bytes(buffer[offset + 4:offset + 4 + length]))
+        offset += 4 + length
+    return frames, buffer[offset:]
+
+
+def recv_exact(conn, size):
+    """Read exactly size bytes from a socket; None if it closes first"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = conn.recv_into(view[received:], size - received)
+        if not count:
+            return None
+        received += count
+    return bytes(buffer)
+
+
+def recv_frame(conn, max_size=MAX_FRAME_SIZE):
+    """Read one length-prefixed frame from a blocking socket
+
+    Returns None once the connection closes, even part way through a frame.
+    Raises ValueError for a length prefix over max_size; the stream can't be
+    resynchronised after that, so the connection should be dropped.
+    """
+    prefix = recv_exact(conn, 4)
+    if prefix is None:
+        return None
+    length = struct.unpack('!I', prefix)[0]
+    if length > max_size:
+        raise ValueError(f"Frame length {length} exceeds the {max_size} byte limit")
+    return recv_exact(conn, length)
+
+
+def is_control_message(data):
+    """Check whether a decoded message is a control frame"""
+    return isinstance(data, dict) and data.get('type') == CONTROL_TYPE
+
+
+class RateMeter:
+    """Smoothed events-per-second estimate with constant memory"""
+
+    def __init__(self, window=0.5, smoothing=0.5):
+        self.window = window
+        self.smoothing = smoothing
+        self.rate = 0.0
+        self._count = 0
+        self._window_start = None
+        self._has_rate = False
+
+    def add(self, count=1, now=None):
+        """Record count events"""
+        now = time.perf_counter() if now is None else now
+        if self._window_start is None:
+            self._window_start = now
+        self._count += count
+
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            sample = self._count / elapsed
+            if self._has_rate:
+                self.rate += self.smoothing * (sample - self.rate)
+            else:
+                self.rate = sample
+                self._has_rate = True
+            self._count = 0
+            self._window_start = now
+
+    def current(self, now=None):
+        """Return the rate, pulled down if events have stopped arriving"""
+        if self._window_start is None:
+            return 0.0
+        now = time.perf_counter() if now is None else now
+        elapsed = now - self._window_start
+        if elapsed >= self.window:
+            return min(self.rate, self._count / elapsed)
+        return self.rate
+
+
+class TickMeter:
+    """Smoothed interval and jitter of a periodic callback with constant memory
+
+    jitter is the smoothed absolute difference between each interval and the
+    smoothed interval.
+    """
+
+    def __init__(self, smoothing=0.05):
+        self.smoothing = smoothing
+        self.interval = 0.0
+        self.jitter = 0.0
+        self.count = 0
+        self._last = None
+
+    def add(self, now=None):
+        """Record one tick"""
+        now = time.perf_counter() if now is None else now
+        if self._last is not None:
+            interval = now - self._last
+            if self.count == 1:
+                self.interval = interval
+            else:
+                self.jitter += self.smoothing * (abs(interval - self.interval) - self.jitter)
+                self.interval += self.smoothing * (interval - self.interval)
+        self._last = now
+        self.count += 1
+
+    def restart(self):
+        """Forget the last tick, so a pause in the loop isn't counted as an interval"""
+        self._last = None
+        self.count = 0
+
+    @property
+    def rate(self):
+        return 1.0 / self.interval if self.interval else 0.0
+
+
+class FlowController:
+    """Decides the rate and batch size to request from one sender"""
+
+    def __init__(self, capacity_meter, preserve_samples=None, advice_interval=ADVICE_INTERVAL):
+        # capacity_meter measures how often the receiver can apply a pose
+        self.capacity_meter = capacity_meter
+        self.receive_meter = RateMeter()
+        # Returns True when every sample matters (e.g. while recording), in which
+        # case senders are asked to batch instead of downsample
+        self.preserve_samples = preserve_samples or (lambda: False)
+        self.advice_interval = advice_interval
+        self.last_advice = None
+        self._last_sent = None
+
+    def on_receive(self, count=1, now=None):
+        """Record received poses and return a control frame to send, or None"""
+        now = time.perf_counter() if now is None else now
+        self.receive_meter.add(count, now)
+
+        if self._last_sent is not None and now - self._last_sent < self.advice_interval:
+            return None
+
+        capacity = self.capacity_meter.current(now)
+        if capacity <= 0.0:
+            return None
+        received = self.receive_meter.current(now)
+
+        if self.preserve_samples():
+            max_rate = None
+            batch = max(1, math.ceil(received / capacity)) if received > capacity else 1
+        else:
+            max_rate = round(capacity, 1)
+            batch = 1
+
+        if not self._advice_changed(max_rate, batch):
+            return None
+
+        self._last_sent = now
+        self.last_advice = {
+            'type': CONTROL_TYPE,
+            'apply_rate': round(capacity, 1),
+            'receive_rate': round(received, 1),
+            'max_rate': max_rate,
+            'batch': batch,
+        }
+        return self.last_advice
+
+    def _advice_changed(self, max_rate, batch):
+        previous = self.last_advice
+        if previous is None:
+            return True
+        if previous['batch'] != batch:
+            return True
+        if (previous['max_rate'] is None) != (max_rate is None):
+            return True
+        if max_rate is None:
+            return False
+        return abs(max_rate - previous['max_rate']) > RATE_TOLERANCE * previous['max_rate']
@@ -0,0 +1,208 @@
+"""
+FreeD D1 input from studio camera tracking systems
+
+Tracking systems send one 29-byte D1 packet per camera and video frame over UDP:
+
+    offset  size  field
+    0       1     message type, 0xD1
+    1       1     camera id
+    2       3     pan      signed, 1/32768 degree
+    5       3     tilt     signed, 1/32768 degree
+    8       3     roll     signed, 1/32768 degree
+    11      3     X        signed, 1/64 mm
+    14      3     Y        signed, 1/64 mm
+    17      3     Z        signed, 1/64 mm (height)
+    20      3     zoom     unsigned encoder counts
+    23      3     focus    unsigned encoder counts
+    26      2     spare
+    28      1     checksum, 0x40 minus the sum of bytes 0-27, modulo 256
+
+All fields are big-endian. The layout is compiled once into a Struct that
+reads each 24-bit field as a high byte and a low 16-bit word, so a packet
+decodes with one unpack call; the high byte is signed for the signed fields,
+which sign-extends the joined value for free.
+
+Pan turns right, tilt up and roll clockwise as seen from behind the camera. At
+zero the camera looks along +Y, level, with Z up. Positions arrive in
+millimetres and are passed on in metres; the coordinate mapping settings
+handle any other axis convention. Zoom and focus are raw lens encoder counts
+that only mean something with a calibration, so they become the LENS and
+FOCUS channels only when a Calibration maps them.
+"""
+
+import math
+import struct
+from collections import namedtuple
+
+try:
+    from . import metrics
+    from .pose_protocol import CHANNELS_FIELD
+    from .udp_input import UdpListener
+except ImportError:
+    import metrics
+    from pose_protocol import CHANNELS_FIELD
+    from udp_input import UdpListener
+
+FREED_PORT = 40000
+
+MESSAGE_D1 = 0xD1
+PACKET_SIZE = 29
+
+ANGLE_UNIT = 1.0 / 32768.0
+POSITION_UNIT = 1.0 / 64.0 / 1000.0
+
+CHECKSUM_BASE = 0x40
+
+# Listener camera filter that accepts packets from every camera
+ANY_CAMERA = -1
+
+# Type, camera id, six signed and two unsigned 24-bit fields, spare, checksum
+_PACKET = struct.Struct('>BB' + 'bH' * 6 + 'BH' * 2 + '2xB')
+_ENCODE_FIELDS = struct.Struct('>BB')
+
+# Linear map from raw encoder counts to a lens value, e.g. focal length in mm
+Calibration = namedtuple('Calibration', 'raw_min raw_max value_min value_max')
+
+
+def checksum(packet):
+    """Checksum byte of a D1 packet's first 28 bytes"""
+    return (CHECKSUM_BASE - sum(packet[:PACKET_SIZE - 1])) & 0xFF
+
+
+def _int24(value, signed=True):
+    value = int(round(value))
+    low, high = (-0x800000, 0x800000) if signed else (0, 0x1000000)
+    if not low <= value < high:
+        raise ValueError(f"Value does not fit 24 bits: {value}")
+    return (value & 0xFFFFFF).to_bytes(3, 'big')
+
+
+def encode_d1(camera_id, pan, tilt, roll, x, y, z, zoom=0, focus=0):
+    """Build a D1 packet; angles in degrees, positions in metres, zoom and focus in counts"""
+    body = b''.join((
+        _ENCODE_FIELDS.pack(MESSAGE_D1, camera_id),
+        _int24(pan / ANGLE_UNIT), _int24(tilt / ANGLE_UNIT), _int24(roll / ANGLE_UNIT),
+        _int24(x / POSITION_UNIT), _int24(y / POSITION_UNIT), _int24(z / POSITION_UNIT),
+        _int24(zoom, False), _int24(focus, False), b'\x00\x00',
+    ))
+    return body + bytes((checksum(body),))
+
+
+def pan_tilt_roll_quaternion(pan, tilt, roll):
+    """Camera rotation for FreeD angles in radians, as (w, x, y, z)
+
+    Rz(-pan) Rx(90° + tilt) Rz(-roll): the Blender camera first rolls about its
+    view axis, is stood up to look along +Y and tilted, then panned about Z.
+    """
+    a = -0.5 * pan
+    b = 0.5 * (tilt + math.pi / 2.0)
+    c = -0.5 * roll
+    ca, sa = math.cos(a), math.sin(a)
+    cb, sb = math.cos(b), math.sin(b)
+    cc, sc = math.cos(c), math.sin(c)
+    w, x, y, z = ca * cb, ca * sb, sa * sb, sa * cb
+    return (w * cc - z * sc, x * cc + y * sc, y * cc - x * sc, w * sc + z * cc)
+
+
+class FreedDecoder:
+    """Decodes D1 packets into quaternion poses
+
+    schema is the receiver's ChannelSchema; zoom and focus Calibrations, when
+    given, fill its LENS and FOCUS columns.
+    """
+
+    def __init__(self, schema=None, zoom=None, focus=None):
+        self.schema = schema
+        self.zoom = zoom
+        self.focus = focus
+        columns = schema.columns if schema is not None else {}
+        # (column, raw field index, offset, scale) for each calibrated channel
+        self._lens = []
+        for field, calibration, index in (('LENS', zoom, 0), ('FOCUS', focus, 1)):
+            if calibration is None or field not in columns:
+                continue
+            span = calibration.raw_max - calibration.raw_min
+            if not span:
+                raise ValueError(f"{field} calibration needs two different raw values")
+            scale = (calibration.value_max - calibration.value_min) / span
+            self._lens.append((columns[field], index, calibration.value_min - calibration.raw_min * scale, scale))
+
+    def decode(self, packet):
+        """Return (camera id, pose) for one D1 packet; raises ValueError if it is not valid"""
+        if len(packet) != PACKET_SIZE:
+            raise ValueError(f"FreeD packet must be {PACKET_SIZE} bytes, got {len(packet)}")
+        (kind, camera_id,
+         pan_hi, pan_lo, tilt_hi, tilt_lo, roll_hi, roll_lo,
+         x_hi, x_lo, y_hi, y_lo, z_hi, z_lo,
+         zoom_hi, zoom_lo, focus_hi, focus_lo, check) = _PACKET.unpack(packet)
+        if kind != MESSAGE_D1:
+            raise ValueError(f"Unsupported FreeD message type: 0x{kind:02X}")
+        if check != checksum(packet):
+            raise ValueError("FreeD checksum mismatch")
+
+        unit = ANGLE_UNIT * math.pi / 180.0
+        w, qx, qy, qz = pan_tilt_roll_quaternion(
+            ((pan_hi << 16) | pan_lo) * unit, ((tilt_hi << 16) | tilt_lo) * unit, ((roll_hi << 16) | roll_lo) * unit)
+        pose = {
+            'X': ((x_hi << 16) | x_lo) * POSITION_UNIT,
+            'Y': ((y_hi << 16) | y_lo) * POSITION_UNIT,
+            'Z': ((z_hi << 16) | z_lo) * POSITION_UNIT,
+            'QUAT_W': w, 'QUAT_X': qx, 'QUAT_Y': qy, 'QUAT_Z': qz,
+        }
+        if self._lens:
+            raw = ((zoom_hi << 16) | zoom_lo, (focus_hi << 16) | focus_lo)
+            channels = list(self.schema.empty)
+            for column, index, offset, scale in self._lens:
+                channels[column] = offset + raw[index] * scale
+            pose[CHANNELS_FIELD] = tuple(channels)
+        return camera_id, pose
+
+
+class FreedListener(UdpListener):
+    """Receives D1 packets on a UDP port and hands their poses to a callback
+
+    on_poses is called from the listener thread as on_poses(camera_id, poses)
+    with the poses of one datagram; a datagram may pack several packets. With
+    camera_id set, packets from other cameras are counted and ignored.
+    """
+
+    def __init__(self, on_poses, host='0.0.0.0', port=FREED_PORT, camera_id=ANY_CAMERA, decoder=None):
+        super().__init__(host, port)
+        self.on_poses = on_poses
+        self.camera_id = camera_id
+        self.decoder = decoder or FreedDecoder()
+        self.received = 0
+        self.errors = 0
+        self.ignored = 0
+
+    def handle(self, datagram):
+        size = len(datagram)
+        poses = []
+        camera = None
+        for offset in range(0, size - PACKET_SIZE + 1, PACKET_SIZE):
+            try:
+                camera_id, pose = self.decoder.decode(datagram[offset:offset + PACKET_SIZE])
+            except ValueError:
+                self.errors += 1
+                metrics.parse_errors.inc()
+                continue
+            if self.camera_id != ANY_CAMERA and camera_id != self.camera_id:
+                self.ignored += 1
+                continue
+            if camera is not None and camera_id != camera:
+                self._deliver(camera, poses)
+                poses = []
+            camera = camera_id
+            poses.append(pose)
+        if size % PACKET_SIZE:
+            self.errors += 1
+            metrics.parse_errors.inc()
+        if poses:
+            self._deliver(camera, poses)
+
+    def _deliver(self, camera_id, poses):
+        self.received += len(poses)
+        try:
+            self.on_poses(camera_id, poses)
+        except Exception as e:
+            print(f"Error handling FreeD poses: {e}")
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Synthetic FreeD D1 sender for testing the receiver's FreeD input
+
+Sends one packet per camera and frame, as a studio tracking system does. Each
+camera circles its own point, panning to follow the motion and sweeping zoom
+and focus through their encoder range.
+
+Usage: python freed_sender.py [--cameras 4] [--rate 50] [--duration 10]
+"""
+
+import argparse
+import math
+import socket
+import time
+
+from freed import encode_d1, FREED_PORT
+
+# Encoder counts swept by zoom and focus
+ZOOM_COUNTS = 200000
+FOCUS_COUNTS = 50000
+
+
+def motion_packet(camera_id, t):
+    """D1 packet of a camera t seconds into its move"""
+    phase = t * 0.5 + camera_id
+    # Cameras stand on a 3 m grid, 20 to a row
+    x = 3.0 * (camera_id % 20) + 2.0 * math.cos(phase)
+    y = 3.0 * (camera_id // 20) + 2.0 * math.sin(phase)
+    pan = math.degrees(phase) % 360.0 - 180.0
+    tilt = 10.0 * math.sin(t * 0.3)
+    roll = 2.0 * math.sin(t * 1.1)
+    zoom = ZOOM_COUNTS * (0.5 - 0.5 * math.cos(t * 0.2))
+    focus = FOCUS_COUNTS * (0.5 - 0.5 * math.cos(t * 0.35))
+    return encode_d1(camera_id, pan, tilt, roll, x, y, 1.6, zoom, focus)
+
+
+def send_motion(sock, address, cameras, rate, duration, first_camera=1):
+    """Send cameras' packets to address at rate frames/s for duration; returns packets sent
+
+    A rate of None sends as fast as possible.
+    """
+    start = time.perf_counter()
+    frame = 0
+    sent = 0
+    camera_ids = range(first_camera, first_camera + cameras)
+    while True:
+        now = time.perf_counter()
+        if now - start >= duration:
+            break
+        t = frame / rate if rate else now - start
+        for camera_id in camera_ids:
+            try:
+                sock.sendto(motion_packet(camera_id, t), address)
+                sent += 1
+            except BlockingIOError:
+                pass
+        frame += 1
+        if rate:
+            delay = start + frame / rate - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+    return sent
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Synthetic FreeD D1 sender")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=FREED_PORT)
+    parser.add_argument('--cameras', type=int, default=1, help="cameras to send, with ids from 1")
+    parser.add_argument('--rate', type=float, default=50.0, help="frames per second per camera")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to send for")
+    args = parser.parse_args()
+
+    print(f"🎥 Sending FreeD D1 for {args.cameras} camera(s) at {args.rate:g} Hz to {args.host}:{args.port}")
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    try:
+        sent = send_motion(sock, (args.host, args.port), args.cameras, args.rate, args.duration)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+        return
+    finally:
+        sock.close()
+    print(f"✅ Sent {sent} packets in {args.duration:g} seconds")
+
+
+if __name__ == "__main__":
+    main()
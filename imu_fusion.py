@@ -0,0 +1,405 @@
+"""
+Orientation from raw IMU samples, fused on the receiver
+
+Phones can send their raw sensor readings instead of a pose they computed
+themselves. An IMU message is a batch of samples, one row each:
+
+    {"IMU": [[t, ax, ay, az, gx, gy, gz], ...]}
+    {"IMU": [[t, ax, ay, az, gx, gy, gz, mx, my, mz], ...]}
+
+t is the sample time in seconds on the sender's clock, the same clock as TS.
+Acceleration is in m/s² including gravity, the gyroscope in rad/s and the
+magnetometer in any unit, all in the device's own axes. On phones these are
+the camera's axes too: the back camera looks down -Z, as a Blender camera does.
+The message may carry SEQ and STREAM like a pose; the STREAM, or else the
+connection, identifies the device.
+
+A Madgwick or Mahony filter fuses each device's samples into its orientation in
+a world frame with Z up. Without a magnetometer the heading starts at 0 and
+drifts slowly with the gyroscope bias. While the device accelerates, readings
+that point away from gravity are left out of the correction for up to
+RECOVERY_TIME. Each device keeps O(1) state: its quaternion, the Mahony integral
+term, the rejection timer and, with position tracking, a velocity and position.
+A batch is parsed, checked and normalised as one NumPy array; the filter then
+steps through its samples, since each step depends on the last.
+
+Position tracking integrates gravity-free acceleration twice. Velocity is reset
+whenever the device holds still and leaks away otherwise, so drift stays bounded
+but slow glides are underestimated; it suits handheld moves of a few seconds.
+"""
+
+import math
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+try:
+    from .pose_protocol import decode_pose, QUATERNION_FIELDS
+    from .sequencing import MAX_STREAMS, STREAM_FIELD, TIMESTAMP_FIELD
+except ImportError:
+    from pose_protocol import decode_pose, QUATERNION_FIELDS
+    from sequencing import MAX_STREAMS, STREAM_FIELD, TIMESTAMP_FIELD
+
+IMU_FIELD = 'IMU'
+
+MADGWICK = 'MADGWICK'
+MAHONY = 'MAHONY'
+
+# Madgwick's beta in rad/s and Mahony's proportional gain; both trade gyroscope
+# smoothness against how quickly accelerometer and magnetometer pull drift back
+MADGWICK_GAIN = 0.1
+MAHONY_GAIN = 1.0
+
+# Mahony integral gain, which learns the gyroscope bias
+MAHONY_INTEGRAL_GAIN = 0.02
+
+# Acceleration further than this angle from the estimated gravity is mostly the
+# device's own motion and is left out of the correction, as it would tilt the
+# estimate; after this many seconds of rejection it is trusted again regardless
+REJECTION_ANGLE = math.radians(3.0)
+RECOVERY_TIME = 2.0
+
+# Samples further apart than this are treated as a restart of the stream
+MAX_STEP = 0.1
+
+# Most samples accepted in one message
+MAX_SAMPLES = 4096
+
+STANDARD_GRAVITY = 9.80665
+
+# Still when acceleration less gravity is below this and rotation below this rate
+STILL_ACCELERATION = 0.3
+STILL_ROTATION = 0.05
+
+# Seconds over which velocity leaks away while moving
+VELOCITY_TIME_CONSTANT = 5.0
+
+_ZERO = (0.0, 0.0, 0.0)
+
+
+def is_imu_message(data):
+    """Check whether a decoded message carries raw IMU samples"""
+    return isinstance(data, dict) and IMU_FIELD in data
+
+
+def decode_items(items, stream, fusion, schema=None):
+    """Decode the items of a message into (poses, stamps)
+
+    Pose items decode as usual with their TS as the stamp. IMU items are fused
+    by fusion for their STREAM, or else for stream, and yield a pose per sample
+    stamped with its t. Raises ValueError for a malformed item.
+    """
+    poses = []
+    stamps = []
+    for item in items:
+        if is_imu_message(item):
+            fused, times = fusion.update(item.get(STREAM_FIELD, stream), item)
+            poses.extend(fused)
+            stamps.extend(times)
+        else:
+            poses.append(decode_pose(item, schema))
+            stamps.append(item.get(TIMESTAMP_FIELD))
+    return poses, stamps
+
+
+def _read_samples(data):
+    """Parse an IMU message into a float array of 7 or 10 columns; raises ValueError"""
+    rows = data[IMU_FIELD]
+    if not isinstance(rows, list) or not rows:
+        raise ValueError(f"{IMU_FIELD} must be a non-empty list of samples")
+    if len(rows) > MAX_SAMPLES:
+        raise ValueError(f"{IMU_FIELD} carries more than {MAX_SAMPLES} samples")
+    try:
+        samples = np.array(rows, dtype=np.float64)
+    except (ValueError, TypeError):
+        raise ValueError(f"Invalid numeric value in field: {IMU_FIELD}")
+    if samples.ndim != 2 or samples.shape[1] not in (7, 10):
+        raise ValueError(f"{IMU_FIELD} samples must have 7 or 10 values")
+    if not np.isfinite(samples).all():
+        raise ValueError(f"Non-finite value in field: {IMU_FIELD}")
+    return samples
+
+
+def _unit_rows(vectors):
+    """Normalise rows, leaving zero rows at zero so the step can skip them"""
+    norms = np.sqrt((vectors * vectors).sum(axis=1))
+    return vectors / np.where(norms > 0.0, norms, 1.0)[:, None]
+
+
+def initial_quaternion(ax, ay, az, mx=0.0, my=0.0, mz=0.0):
+    """Orientation that explains a resting accelerometer (and magnetometer) reading
+
+    The heading puts magnetic north along +X, or is 0 without a magnetometer.
+    """
+    roll = math.atan2(ay, az)
+    pitch = math.atan2(-ax, math.hypot(ay, az))
+    yaw = 0.0
+    if mx or my or mz:
+        # Tilt-compensate the field, then turn its horizontal part onto +X
+        cr, sr = math.cos(roll), math.sin(roll)
+        cp, sp = math.cos(pitch), math.sin(pitch)
+        my_level = cr * my - sr * mz
+        mz_level = sr * my + cr * mz
+        mx_level = cp * mx + sp * mz_level
+        yaw = math.atan2(-my_level, mx_level)
+    cx, sx = math.cos(roll * 0.5), math.sin(roll * 0.5)
+    cy, sy = math.cos(pitch * 0.5), math.sin(pitch * 0.5)
+    cz, sz = math.cos(yaw * 0.5), math.sin(yaw * 0.5)
+    return (cx * cy * cz + sx * sy * sz, sx * cy * cz - cx * sy * sz,
+            cx * sy * cz + sx * cy * sz, cx * cy * sz - sx * sy * cz)
+
+
+def madgwick_step(q, gyro, accel, mag, gain, dt):
+    """One Madgwick update of q from unit accel and mag (or zero vectors to skip them)"""
+    q0, q1, q2, q3 = q
+    gx, gy, gz = gyro
+    # Rate of change from the gyroscope: 0.5 q ⊗ ω
+    d0 = 0.5 * (-q1 * gx - q2 * gy - q3 * gz)
+    d1 = 0.5 * (q0 * gx + q2 * gz - q3 * gy)
+    d2 = 0.5 * (q0 * gy - q1 * gz + q3 * gx)
+    d3 = 0.5 * (q0 * gz + q1 * gy - q2 * gx)
+
+    ax, ay, az = accel
+    if ax or ay or az:
+        # Gradient of |R^T g - a|² (+ |R^T b - m|²) over q; R^T ez is gravity in device axes
+        fx = 2.0 * (q1 * q3 - q0 * q2) - ax
+        fy = 2.0 * (q0 * q1 + q2 * q3) - ay
+        fz = 1.0 - 2.0 * (q1 * q1 + q2 * q2) - az
+        s0 = -2.0 * q2 * fx + 2.0 * q1 * fy
+        s1 = 2.0 * q3 * fx + 2.0 * q0 * fy - 4.0 * q1 * fz
+        s2 = -2.0 * q0 * fx + 2.0 * q3 * fy - 4.0 * q2 * fz
+        s3 = 2.0 * q1 * fx + 2.0 * q2 * fy
+
+        mx, my, mz = mag
+        if mx or my or mz:
+            # Earth's field as the filter sees it, turned into the X-Z plane
+            hx = (mx * (1.0 - 2.0 * (q2 * q2 + q3 * q3)) + my * 2.0 * (q1 * q2 - q0 * q3)
+                  + mz * 2.0 * (q1 * q3 + q0 * q2))
+            hy = (mx * 2.0 * (q1 * q2 + q0 * q3) + my * (1.0 - 2.0 * (q1 * q1 + q3 * q3))
+                  + mz * 2.0 * (q2 * q3 - q0 * q1))
+            bz = (mx * 2.0 * (q1 * q3 - q0 * q2) + my * 2.0 * (q2 * q3 + q0 * q1)
+                  + mz * (1.0 - 2.0 * (q1 * q1 + q2 * q2)))
+            bx = math.hypot(hx, hy)
+            # R^T b - m, with R^T ez being the predicted gravity direction
+            bx_ = bx * (1.0 - 2.0 * (q2 * q2 + q3 * q3)) + bz * (fx + ax) - mx
+            by_ = bx * 2.0 * (q1 * q2 - q0 * q3) + bz * (fy + ay) - my
+            bz_ = bx * 2.0 * (q1 * q3 + q0 * q2) + bz * (fz + az) - mz
+            s0 += bx * (-2.0 * q3 * by_ + 2.0 * q2 * bz_) + bz * (-2.0 * q2 * bx_ + 2.0 * q1 * by_)
+            s1 += bx * (2.0 * q2 * by_ + 2.0 * q3 * bz_) + bz * (2.0 * q3 * bx_ + 2.0 * q0 * by_ - 4.0 * q1 * bz_)
+            s2 += (bx * (-4.0 * q2 * bx_ + 2.0 * q1 * by_ + 2.0 * q0 * bz_)
+                   + bz * (-2.0 * q0 * bx_ + 2.0 * q3 * by_ - 4.0 * q2 * bz_))
+            s3 += bx * (-4.0 * q3 * bx_ - 2.0 * q0 * by_ + 2.0 * q1 * bz_) + bz * (2.0 * q1 * bx_ + 2.0 * q2 * by_)
+
+        norm = math.sqrt(s0 * s0 + s1 * s1 + s2 * s2 + s3 * s3)
+        if norm > 0.0:
+            step = gain / norm
+            d0 -= step * s0
+            d1 -= step * s1
+            d2 -= step * s2
+            d3 -= step * s3
+
+    q0 += d0 * dt
+    q1 += d1 * dt
+    q2 += d2 * dt
+    q3 += d3 * dt
+    norm = 1.0 / math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+    return (q0 * norm, q1 * norm, q2 * norm, q3 * norm)
+
+
+def mahony_step(q, integral, gyro, accel, mag, gain, integral_gain, dt):
+    """One Mahony update; returns (q, integral) from unit accel and mag (or zero vectors)"""
+    q0, q1, q2, q3 = q
+    gx, gy, gz = gyro
+    ax, ay, az = accel
+    if ax or ay or az:
+        # Error between measured and estimated directions, as a rotation rate
+        vx = 2.0 * (q1 * q3 - q0 * q2)
+        vy = 2.0 * (q0 * q1 + q2 * q3)
+        vz = 1.0 - 2.0 * (q1 * q1 + q2 * q2)
+        ex = ay * vz - az * vy
+        ey = az * vx - ax * vz
+        ez = ax * vy - ay * vx
+
+        mx, my, mz = mag
+        if mx or my or mz:
+            hx = (mx * (1.0 - 2.0 * (q2 * q2 + q3 * q3)) + my * 2.0 * (q1 * q2 - q0 * q3)
+                  + mz * 2.0 * (q1 * q3 + q0 * q2))
+            hy = (mx * 2.0 * (q1 * q2 + q0 * q3) + my * (1.0 - 2.0 * (q1 * q1 + q3 * q3))
+                  + mz * 2.0 * (q2 * q3 - q0 * q1))
+            bz = (mx * 2.0 * (q1 * q3 - q0 * q2) + my * 2.0 * (q2 * q3 + q0 * q1)
+                  + mz * (1.0 - 2.0 * (q1 * q1 + q2 * q2)))
+            bx = math.hypot(hx, hy)
+            wx = bx * (1.0 - 2.0 * (q2 * q2 + q3 * q3)) + bz * vx
+            wy = bx * 2.0 * (q1 * q2 - q0 * q3) + bz * vy
+            wz = bx * 2.0 * (q1 * q3 + q0 * q2) + bz * vz
+            ex += my * wz - mz * wy
+            ey += mz * wx - mx * wz
+            ez += mx * wy - my * wx
+
+        if integral_gain > 0.0:
+            ix, iy, iz = integral
+            integral = (ix + integral_gain * ex * dt, iy + integral_gain * ey * dt, iz + integral_gain * ez * dt)
+            gx, gy, gz = gx + integral[0], gy + integral[1], gz + integral[2]
+        gx += gain * ex
+        gy += gain * ey
+        gz += gain * ez
+
+    half = 0.5 * dt
+    q0, q1, q2, q3 = (q0 + half * (-q1 * gx - q2 * gy - q3 * gz),
+                      q1 + half * (q0 * gx + q2 * gz - q3 * gy),
+                      q2 + half * (q0 * gy - q1 * gz + q3 * gx),
+                      q3 + half * (q0 * gz + q1 * gy - q2 * gx))
+    norm = 1.0 / math.sqrt(q0 * q0 + q1 * q1 + q2 * q2 + q3 * q3)
+    return (q0 * norm, q1 * norm, q2 * norm, q3 * norm), integral
+
+
+class DeviceState:
+    """What the filter remembers about one device between batches"""
+
+    __slots__ = ('quaternion', 'integral', 'rejected', 'velocity', 'position', 'time')
+
+    def __init__(self):
+        self.quaternion = None
+        self.integral = (0.0, 0.0, 0.0)
+        self.rejected = 0.0
+        self.velocity = (0.0, 0.0, 0.0)
+        self.position = (0.0, 0.0, 0.0)
+        self.time = None
+
+
+class ImuFusion:
+    """Fuses IMU batches into quaternion poses, with one DeviceState per device"""
+
+    def __init__(self, algorithm=MADGWICK, gain=None, track_position=False, max_devices=MAX_STREAMS):
+        self.max_devices = max_devices
+        self._devices = OrderedDict()
+        self._lock = threading.Lock()
+        self.configure(algorithm, gain, track_position)
+
+    def configure(self, algorithm, gain=None, track_position=False):
+        """Pick the filter and its gain; None uses the filter's default gain"""
+        if algorithm not in (MADGWICK, MAHONY):
+            raise ValueError(f"Unknown fusion filter: {algorithm}")
+        self.algorithm = algorithm
+        self.gain = gain if gain is not None else (MADGWICK_GAIN if algorithm == MADGWICK else MAHONY_GAIN)
+        if not track_position:
+            with self._lock:
+                for state in self._devices.values():
+                    state.velocity = state.position = (0.0, 0.0, 0.0)
+        self.track_position = track_position
+
+    def reset(self, device=None):
+        """Forget one device, or all, so the next sample re-initialises from gravity"""
+        with self._lock:
+            if device is None:
+                self._devices.clear()
+            else:
+                self._devices.pop(device, None)
+
+    def __len__(self):
+        return len(self._devices)
+
+    def update(self, device, data):
+        """Fuse one IMU message from device; returns (poses, sample times)
+
+        Each sample yields a quaternion pose; the times are the samples' t, for
+        use like TS stamps. Samples not after the previous one are dropped.
+        Raises ValueError for a malformed message.
+        """
+        samples = _read_samples(data)
+        accel = _unit_rows(samples[:, 1:4])
+        gyro = samples[:, 4:7]
+        mag = _unit_rows(samples[:, 7:10]) if samples.shape[1] == 10 else np.zeros_like(accel)
+        turning = (gyro * gyro).sum(axis=1) >= STILL_ROTATION ** 2
+
+        with self._lock:
+            state = self._devices.get(device)
+            if state is None:
+                if len(self._devices) >= self.max_devices:
+                    self._devices.popitem(last=False)
+                state = self._devices[device] = DeviceState()
+            else:
+                self._devices.move_to_end(device)
+
+            # Keep samples later than any before them; a first sample has an infinite step
+            times = samples[:, 0]
+            latest = np.maximum.accumulate(np.concatenate(
+                ([state.time if state.time is not None else -math.inf], times)))
+            steps = times - latest[:-1]
+            keep = steps > 0.0
+            if not keep.any():
+                return [], []
+            times, steps = times[keep], steps[keep]
+            rows = zip(steps.tolist(), accel[keep].tolist(), gyro[keep].tolist(), mag[keep].tolist(),
+                       samples[keep, 1:4].tolist(), turning[keep].tolist())
+            poses = self._fuse(state, rows)
+            state.time = float(times[-1])
+        return poses, times.tolist()
+
+    def _fuse(self, state, rows):
+        q = state.quaternion
+        integral = state.integral
+        rejected = state.rejected
+        min_cos = math.cos(REJECTION_ANGLE)
+        velocity, position = state.velocity, state.position
+        madgwick = self.algorithm == MADGWICK
+        gain = self.gain
+        track = self.track_position
+        leak = 1.0 / VELOCITY_TIME_CONSTANT
+        poses = []
+
+        for dt, accel, gyro, mag, raw, turning in rows:
+            if q is None or dt > MAX_STEP:
+                # First sample, or the stream paused: start over from gravity
+                q = initial_quaternion(*accel, *mag) if any(accel) else (1.0, 0.0, 0.0, 0.0)
+                velocity = (0.0, 0.0, 0.0)
+                rejected = 0.0
+                poses.append(dict(zip(QUATERNION_FIELDS, position + q)))
+                continue
+
+            # Compare the reading with gravity as the current estimate predicts it
+            q0, q1, q2, q3 = q
+            ax, ay, az = accel
+            cos = (ax * 2.0 * (q1 * q3 - q0 * q2) + ay * 2.0 * (q0 * q1 + q2 * q3)
+                   + az * (1.0 - 2.0 * (q1 * q1 + q2 * q2)))
+            if cos >= min_cos:
+                rejected = 0.0
+            elif rejected < RECOVERY_TIME:
+                rejected += dt
+                accel = mag = _ZERO
+            # Rejected for too long: the estimate has drifted, so trust the reading until it agrees
+
+            if madgwick:
+                q = madgwick_step(q, gyro, accel, mag, gain, dt)
+            else:
+                q, integral = mahony_step(q, integral, gyro, accel, mag, gain, MAHONY_INTEGRAL_GAIN, dt)
+
+            if track:
+                velocity, position = self._integrate(q, raw, turning, velocity, position, dt, leak)
+            poses.append(dict(zip(QUATERNION_FIELDS, position + q)))
+
+        state.quaternion, state.integral, state.rejected = q, integral, rejected
+        state.velocity, state.position = velocity, position
+        return poses
+
+    @staticmethod
+    def _integrate(q, raw, turning, velocity, position, dt, leak):
+        """Advance velocity and position by one sample of device acceleration"""
+        q0, q1, q2, q3 = q
+        ax, ay, az = raw
+        # World-frame acceleration R a, less gravity
+        wx = ((1.0 - 2.0 * (q2 * q2 + q3 * q3)) * ax + 2.0 * (q1 * q2 - q0 * q3) * ay
+              + 2.0 * (q1 * q3 + q0 * q2) * az)
+        wy = (2.0 * (q1 * q2 + q0 * q3) * ax + (1.0 - 2.0 * (q1 * q1 + q3 * q3)) * ay
+              + 2.0 * (q2 * q3 - q0 * q1) * az)
+        wz = (2.0 * (q1 * q3 - q0 * q2) * ax + 2.0 * (q2 * q3 + q0 * q1) * ay
+              + (1.0 - 2.0 * (q1 * q1 + q2 * q2)) * az) - STANDARD_GRAVITY
+        if not turning and wx * wx + wy * wy + wz * wz < STILL_ACCELERATION ** 2:
+            # Zero-velocity update: holding still pins velocity and stops drift
+            return (0.0, 0.0, 0.0), position
+        decay = max(0.0, 1.0 - leak * dt)
+        vx, vy, vz = velocity
+        vx, vy, vz = (vx + wx * dt) * decay, (vy + wy * dt) * decay, (vz + wz * dt) * decay
+        px, py, pz = position
+        return (vx, vy, vz), (px + vx * dt, py + vy * dt, pz + vz * dt)
@@ -26,6 +26,28 @@ def create_addon_zip():
         "__init__.py",
         "websocket_server.py", 
         "camera_controller.py",
+        "pose_math.py",
+        "pose_protocol.py",
+        "flow_control.py",
+        "pose_codec.py",
+        "metrics.py",
+        "profiling.py",
+        "viewport_preview.py",
+        "sequencing.py",
+        "session.py",
+        "coordinate_mapping.py",
+        "take_processing.py",
+        "clock_sync.py",
+        "take_recorder.py",
+        "jitter_buffer.py",
+        "change_detection.py",
+        "replay_buffer.py",
+        "channel_schema.py",
+        "imu_fusion.py",
+        "freed.py",
+        "osc_input.py",
+        "udp_input.py",
+        "take_file.py",
         "README.md"
     ]
     
@@ -0,0 +1,198 @@
+"""
+Adaptive jitter buffer between ingest and the main-thread apply
+
+Wi-Fi delivers poses in clumps with silent gaps in between. The buffer holds each
+pose until its capture time plus a playout delay, and the apply timer takes them
+out on its steady tick, so motion plays back evenly at a known latency instead
+of stuttering with the network.
+
+A pose's capture time is its TS on our clock once the sender's clock is
+synchronised. Unstamped poses are spaced at the average arrival interval,
+which undoes the clumping, but never placed later than their arrival or earlier
+than the current delay allows.
+
+The delay follows the RFC 3550 interarrival jitter, the smoothed change in transit
+time between consecutive poses. The target is the configured latency, or with
+adaptation JITTER_FACTOR times the jitter when that is larger, up to the maximum
+delay. The playout delay slews toward the target rather than jumping, so playback
+runs briefly slower or faster instead of freezing or skipping.
+"""
+
+import bisect
+import itertools
+import threading
+import time
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+# Seconds of playout delay by default, and the most the adaptation may add up to
+DEFAULT_LATENCY = 0.05
+MAX_DELAY = 0.5
+
+# Target delay as a multiple of the interarrival jitter; 4 rides out clumps
+# 40 to 120 ms apart with an underrun every few seconds at most
+JITTER_FACTOR = 4.0
+
+# Smoothing of the jitter (RFC 3550 uses 1/16) and of the arrival interval
+JITTER_GAIN = 1.0 / 16.0
+INTERVAL_GAIN = 1.0 / 64.0
+
+# Unstamped poses are spaced this much wider than the average arrival interval,
+# so their times creep toward the least delayed arrivals instead of falling behind
+SPACING_STRETCH = 1.01
+
+# Seconds of delay gained or shed per second of playback while slewing, i.e.
+# playback at 0.5x while growing and 1.05x while shrinking
+GROW_RATE = 0.5
+SHRINK_RATE = 0.05
+
+# Poses held at most, about four seconds at 60 Hz
+CAPACITY = 256
+
+# A sender silent for this long has stopped, so running dry is not an underrun
+IDLE_TIMEOUT = 0.5
+
+
+class JitterBuffer:
+    """Holds poses for a playout delay and releases them on the apply tick
+
+    push runs on the receiving threads and pop on Blender's main thread.
+    Counts:
+
+        underruns   the buffer ran dry while the sender was still live
+        overruns    poses dropped because the buffer was full
+        late        poses that arrived after poses captured later were played
+    """
+
+    def __init__(self, latency=DEFAULT_LATENCY, adaptive=True, max_delay=MAX_DELAY, capacity=CAPACITY):
+        self.enabled = False
+        self.latency = latency
+        self.adaptive = adaptive
+        self.max_delay = max_delay
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._order = itertools.count()
+        self.reset()
+
+    def configure(self, enabled, latency, adaptive):
+        """Apply panel settings; turning the buffer off forgets what it holds"""
+        with self._lock:
+            self.latency = min(max(0.0, latency), self.max_delay)
+            self.adaptive = adaptive
+            self.enabled = enabled
+        if not enabled:
+            self.reset()
+
+    def reset(self):
+        """Drop held poses and start estimating afresh"""
+        with self._lock:
+            self._samples = []
+            self.delay = self.latency
+            self.jitter = 0.0
+            self.interval = None
+            self.underruns = 0
+            self.overruns = 0
+            self.late = 0
+            self._last_arrival = None
+            self._last_capture = None
+            self._last_transit = None
+            self._played = None
+            self._last_pop = None
+            self._dry_since = None
+
+    def __len__(self):
+        return len(self._samples)
+
+    def target_delay(self):
+        """Delay the playout is slewing toward"""
+        if not self.adaptive:
+            return self.latency
+        return min(self.max_delay, max(self.latency, JITTER_FACTOR * self.jitter))
+
+    def push(self, poses, capture_times=None, now=None):
+        """Hold poses that arrived together at now
+
+        capture_times gives each pose's capture time on our clock, or None where
+        it is unknown.
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            # A sender that went quiet only briefly leaves a gap in the motion
+            if self._dry_since is not None:
+                if now - self._dry_since < IDLE_TIMEOUT:
+                    self.underruns += 1
+                    metrics.jitter_underruns.inc()
+                self._dry_since = None
+
+            if self._last_arrival is not None:
+                gap = now - self._last_arrival
+                self.interval = gap if self.interval is None else self.interval + (gap - self.interval) * INTERVAL_GAIN
+            self._last_arrival = now
+
+            for i, pose in enumerate(poses):
+                capture = capture_times[i] if capture_times is not None else None
+                if capture is None:
+                    if self._last_capture is None or self.interval is None:
+                        capture = now
+                    else:
+                        spaced = self._last_capture + self.interval * SPACING_STRETCH
+                        capture = min(now, max(spaced, now - self.delay))
+                self._add(pose, capture, now)
+
+    def _add(self, pose, capture, now):
+        if self._played is not None and capture <= self._played:
+            self.late += 1
+            metrics.poses_dropped.inc()
+            return
+
+        transit = now - capture
+        if self._last_transit is not None:
+            self.jitter += (abs(transit - self._last_transit) - self.jitter) * JITTER_GAIN
+        self._last_transit = transit
+        self._last_capture = capture
+
+        samples = self._samples
+        if len(samples) >= self.capacity:
+            del samples[0]
+            self.overruns += 1
+            metrics.jitter_overruns.inc()
+            metrics.poses_dropped.inc()
+        # Usually an append; the order counter keeps pose dicts out of comparisons
+        bisect.insort(samples, (capture, next(self._order), pose))
+
+    def pop(self, now=None):
+        """Return the newest pose due for playout, or None
+
+        Poses that fell due together are superseded by the newest, as one pose
+        is applied per tick.
+        """
+        now = time.perf_counter() if now is None else now
+        with self._lock:
+            elapsed = now - self._last_pop if self._last_pop is not None else 0.0
+            self._last_pop = now
+            target = self.target_delay()
+            if target > self.delay:
+                self.delay = min(target, self.delay + GROW_RATE * elapsed)
+            else:
+                self.delay = max(target, self.delay - SHRINK_RATE * elapsed)
+
+            playout = now - self.delay
+            samples = self._samples
+            due = 0
+            while due < len(samples) and samples[due][0] <= playout:
+                due += 1
+            if not due:
+                # Nothing held and the next pose is overdue: motion stalls until it comes
+                if (not samples and self._dry_since is None and self._played is not None
+                        and self.interval is not None and playout - self._played > 1.5 * self.interval):
+                    self._dry_since = now
+                return None
+
+            self._played, _, pose = samples[due - 1]
+            del samples[:due]
+        if due > 1:
+            metrics.poses_dropped.inc(due - 1)
+        return pose
@@ -0,0 +1,225 @@
+"""
+Runtime metrics for the Camera Motion Receiver
+
+Counters, gauges and timers are plain objects whose update is a single
+attribute increment, cheap enough for the per-pose hot path. Increments are not
+locked: under the GIL two threads can very rarely lose an update on the same
+counter, which is fine for monitoring.
+
+The registry renders as Prometheus text for the HTTP endpoint and as a dict
+snapshot for the Blender panel.
+"""
+
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+try:
+    from .flow_control import RateMeter
+except ImportError:
+    from flow_control import RateMeter
+
+METRIC_PREFIX = 'camera_motion_'
+
+# Default port for the metrics HTTP endpoint
+METRICS_PORT = 9108
+
+
+class Counter:
+    """Monotonically increasing count"""
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge:
+    """Value that can go up and down"""
+    __slots__ = ('name', 'help', 'value')
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+
+class Timer:
+    """Count, total, maximum and last duration of a timed operation"""
+    __slots__ = ('name', 'help', 'count', 'total_ns', 'max_ns', 'last_ns')
+
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self.count = 0
+        self.total_ns = 0
+        self.max_ns = 0
+        self.last_ns = 0
+
+    def observe(self, duration_ns):
+        self.count += 1
+        self.total_ns += duration_ns
+        self.last_ns = duration_ns
+        if duration_ns > self.max_ns:
+            self.max_ns = duration_ns
+
+    @property
+    def average_ms(self):
+        return self.total_ns / self.count / 1e6 if self.count else 0.0
+
+
+class ClientStats:
+    """Received pose count and rate for one connected sender"""
+
+    def __init__(self, client_id):
+        self.client_id = client_id
+        self.received = 0
+        self.meter = RateMeter()
+        self.connected_at = time.time()
+
+    def add(self, count):
+        self.received += count
+        self.meter.add(count)
+
+
+class MetricsRegistry:
+    """Holds every metric and renders them for the endpoint and the panel"""
+
+    def __init__(self):
+        self.counters = {}
+        self.gauges = {}
+        self.timers = {}
+        self.clients = {}
+        self._lock = threading.Lock()
+
+    def counter(self, name, help_text=''):
+        """Get or create a counter"""
+        return self.counters.setdefault(name, Counter(name, help_text))
+
+    def gauge(self, name, help_text=''):
+        """Get or create a gauge"""
+        return self.gauges.setdefault(name, Gauge(name, help_text))
+
+    def timer(self, name, help_text=''):
+        """Get or create a timer"""
+        return self.timers.setdefault(name, Timer(name, help_text))
+
+    def client(self, client_id):
+        """Get or create the stats for a connected sender"""
+        with self._lock:
+            stats = self.clients.get(client_id)
+            if stats is None:
+                stats = self.clients[client_id] = ClientStats(client_id)
+            return stats
+
+    def remove_client(self, client_id):
+        """Forget a sender once it disconnects"""
+        with self._lock:
+            self.clients.pop(client_id, None)
+
+    def snapshot(self):
+        """Return the current values as a plain dict"""
+        with self._lock:
+            clients = list(self.clients.values())
+        return {
+            'counters': {name: counter.value for name, counter in self.counters.items()},
+            'gauges': {name: gauge.value for name, gauge in self.gauges.items()},
+            'timers': {name: {'count': timer.count, 'average_ms': timer.average_ms,
+                              'max_ms': timer.max_ns / 1e6, 'last_ms': timer.last_ns / 1e6}
+                       for name, timer in self.timers.items()},
+            'clients': {str(stats.client_id): {'received': stats.received, 'rate': stats.meter.current()}
+                        for stats in clients},
+        }
+
+    def render_prometheus(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        lines = []
+        for counter in list(self.counters.values()):
+            name = METRIC_PREFIX + counter.name
+            lines += [f"# HELP {name} {counter.help}", f"# TYPE {name} counter", f"{name} {counter.value}"]
+        for gauge in list(self.gauges.values()):
+            name = METRIC_PREFIX + gauge.name
+            lines += [f"# HELP {name} {gauge.help}", f"# TYPE {name} gauge", f"{name} {gauge.value}"]
+        for timer in list(self.timers.values()):
+            name = METRIC_PREFIX + timer.name + '_seconds'
+            lines += [
+                f"# HELP {name} {timer.help}",
+                f"# TYPE {name} summary",
+                f"{name}_count {timer.count}",
+                f"{name}_sum {timer.total_ns / 1e9:.9f}",
+                f"# TYPE {name}_max gauge",
+                f"{name}_max {timer.max_ns / 1e9:.9f}",
+            ]
+
+        with self._lock:
+            clients = list(self.clients.values())
+        received = METRIC_PREFIX + 'client_poses_received_total'
+        rate = METRIC_PREFIX + 'client_pose_rate'
+        lines += [f"# HELP {received} Poses received per connected sender", f"# TYPE {received} counter"]
+        lines += [f'{received}{{client="{_label(stats.client_id)}"}} {stats.received}' for stats in clients]
+        lines += [f"# HELP {rate} Poses per second per connected sender", f"# TYPE {rate} gauge"]
+        lines += [f'{rate}{{client="{_label(stats.client_id)}"}} {stats.meter.current():.3f}' for stats in clients]
+        return '\n'.join(lines) + '\n'
+
+
+def _label(value):
+    """Format a value as a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# Shared registry and the standard pipeline metrics
+registry = MetricsRegistry()
+
+poses_received = registry.counter('poses_received_total', 'Poses decoded from senders')
+poses_applied = registry.counter('poses_applied_total', 'Poses applied to the camera')
+writes_skipped = registry.counter('writes_skipped_total', 'Applied poses within the dead-band of the last write, so not written')
+poses_dropped = registry.counter('poses_dropped_total', 'Poses coalesced or dropped before being applied')
+parse_errors = registry.counter('parse_errors_total', 'Messages that failed to decode')
+poses_stale = registry.counter('poses_stale_total', 'Poses dropped as older than one already delivered')
+poses_reordered = registry.counter('poses_reordered_total', 'Late poses delivered in order by the reorder window')
+sequence_gaps = registry.counter('sequence_gaps_total', 'Poses missing from sender sequence numbers')
+queue_depth = registry.gauge('queue_depth', 'Poses waiting to be applied')
+tick_jitter = registry.gauge('tick_jitter_seconds', 'Smoothed deviation of apply loop ticks from their interval')
+jitter_delay = registry.gauge('jitter_delay_seconds', 'Playout delay of the jitter buffer')
+jitter_underruns = registry.counter('jitter_underruns_total', 'Times the jitter buffer ran dry while the sender was live')
+jitter_overruns = registry.counter('jitter_overruns_total', 'Poses dropped because the jitter buffer was full')
+clock_round_trip = registry.gauge('clock_round_trip_seconds', 'Round trip of the last accepted clock ping')
+clock_drift = registry.gauge('clock_drift_ppm', 'Estimated sender clock drift against ours')
+apply_time = registry.timer('apply', 'Main-thread time spent applying a pose')
+
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Serves /metrics as Prometheus text"""
+
+    def do_GET(self):
+        if self.path.split('?')[0] != '/metrics':
+            self.send_response(404)
+            self.end_headers()
+            return
+
+        body = registry.render_prometheus().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Scrapes every few seconds would flood the console
+        pass
+
+
+def start_metrics_server(port=METRICS_PORT, host='0.0.0.0'):
+    """Serve the metrics endpoint from a daemon thread and return the HTTP server"""
+    server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+    server.daemon_threads = True
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
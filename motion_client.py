@@ -0,0 +1,274 @@
+#!/usr/bin/env python3
+"""
+Asyncio client SDK for pushing poses to the Camera Motion Receiver
+
+A MotionStream is one sender connection with its own session and SEQ
+numbering. send() stamps a pose and queues it; queued poses go out as one
+frame, a JSON array of poses, once batch_size of them are waiting or
+batch_delay seconds after the first was queued, whichever comes first. The
+length prefix and body of every frame in a flush are handed to the transport
+in one writelines call: a single sendmsg with scatter-gather on Python 3.12
+and later, one joined send before that, instead of the two sends per pose of
+test_client.py. TCP_NODELAY is on by default, as batching already decides
+when bytes leave; pass nodelay=False to let Nagle coalesce instead.
+
+    async def main():
+        streams = await open_streams('localhost', 8765, ['cam-a', 'cam-b'], batch_delay=0.005)
+        for pose in poses:
+            for stream in streams:
+                stream.send(pose)
+            await asyncio.gather(*(stream.drain() for stream in streams))
+        await asyncio.gather(*(stream.close() for stream in streams))
+
+send() never blocks; await drain() now and then so a slow receiver pushes
+back instead of the transport buffering without bound. Each stream answers
+the receiver's clock pings and keeps its latest rate advice and acknowledged
+SEQ, raising its batch size when the receiver asks for larger batches. It does
+not reconnect or replay unacknowledged poses; test_client.py shows that part of
+the protocol.
+
+Usage: python motion_client.py [--streams 4] [--rate 240] [--batch 8] [--batch-delay 0.01]
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import socket
+import struct
+import time
+
+from clock_sync import is_ping, make_pong
+from flow_control import encode_frame, is_control_message, MAX_FRAME_SIZE
+from pose_codec import is_resync_message
+from session import is_ack, is_welcome, make_hello, new_session_id
+
+_LENGTH = struct.Struct('!I')
+
+
+class MotionStream:
+    """One sender connection with its own SEQ numbering and batching
+
+    With an encoder (pose_codec.PoseEncoder) every pose is its own binary
+    frame, and batching groups the frames into one write instead.
+    """
+
+    def __init__(self, host='localhost', port=8765, stream=None, batch_size=1, batch_delay=0.0,
+                 nodelay=True, encoder=None):
+        self.host = host
+        self.port = port
+        # Poses are stamped with STREAM when given; it also names the session
+        self.stream = stream
+        self.session = stream or new_session_id()
+        self.batch_size = max(1, batch_size)
+        self.batch_delay = batch_delay
+        self.nodelay = nodelay
+        self.encoder = encoder
+        self.sequence = 0
+
+        # Latest advice and acknowledgement from the receiver
+        self.max_rate = None
+        self.advised_batch = 1
+        self.acked = None
+        self.recording = False
+
+        self.sent_poses = 0
+        self.sent_frames = 0
+        self.writes = 0
+        self._pending = []
+        self._timer = None
+        self._reader = None
+        self._writer = None
+        self._read_task = None
+
+    @property
+    def connected(self):
+        return self._writer is not None and not self._writer.is_closing()
+
+    async def connect(self):
+        """Open the connection and introduce the session"""
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+        sock = self._writer.get_extra_info('socket')
+        if sock is not None:
+            # asyncio turns TCP_NODELAY on for every TCP connection
+            sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1 if self.nodelay else 0)
+        if self.encoder:
+            self.encoder.request_keyframe()
+        # The receiver handles frames in order, so nothing needs to wait for the welcome
+        self._writer.write(encode_frame(make_hello(self.session)))
+        self._read_task = asyncio.get_running_loop().create_task(self._read_loop())
+
+    def send(self, pose):
+        """Stamp and queue a pose, flushing when the batch is full"""
+        self._pending.append(self.stamp(pose))
+        if len(self._pending) >= max(self.batch_size, self.advised_batch):
+            self.flush()
+        elif self.batch_delay and self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.batch_delay, self.flush)
+
+    def send_many(self, poses):
+        """Queue several poses, e.g. a burst of IMU-rate samples"""
+        for pose in poses:
+            self.send(pose)
+
+    def stamp(self, pose):
+        """Return a copy of pose with the next sequence number and a send timestamp"""
+        stamped = dict(pose, SEQ=self.sequence, TS=time.time())
+        if self.stream:
+            stamped['STREAM'] = self.stream
+        self.sequence += 1
+        return stamped
+
+    def flush(self):
+        """Write the queued poses now"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        pending = self._pending
+        if not pending or not self.connected:
+            return
+        self._pending = []
+
+        if self.encoder:
+            bodies = [self.encoder.encode(pose) for pose in pending]
+        else:
+            bodies = [json.dumps(pending if len(pending) > 1 else pending[0]).encode('utf-8')]
+        parts = []
+        for body in bodies:
+            parts.append(_LENGTH.pack(len(body)))
+            parts.append(body)
+        self._writer.writelines(parts)
+        self.writes += 1
+        self.sent_frames += len(bodies)
+        self.sent_poses += len(pending)
+
+    async def drain(self):
+        """Wait until the transport's buffer is back under its high-water mark"""
+        if not self.connected:
+            raise ConnectionError("Stream is not connected")
+        await self._writer.drain()
+
+    async def close(self):
+        """Flush what is queued and close the connection"""
+        self.flush()
+        if self._writer is None:
+            return
+        try:
+            if not self._writer.is_closing():
+                await self._writer.drain()
+            self._writer.close()
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+        if self._read_task is not None:
+            self._read_task.cancel()
+            try:
+                await self._read_task
+            except asyncio.CancelledError:
+                pass
+            self._read_task = None
+        self._writer = None
+
+    async def _read_loop(self):
+        """Handle control frames the receiver sends back on the connection"""
+        try:
+            while True:
+                length = _LENGTH.unpack(await self._reader.readexactly(4))[0]
+                if length > MAX_FRAME_SIZE:
+                    raise ValueError(f"Frame length {length} exceeds the {MAX_FRAME_SIZE} byte limit")
+                frame = await self._reader.readexactly(length)
+                received = time.time()
+                try:
+                    data = json.loads(frame.decode('utf-8'))
+                except (UnicodeDecodeError, json.JSONDecodeError):
+                    continue
+                self._on_control(data, received)
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+
+    def _on_control(self, data, received):
+        if is_ping(data):
+            # Answer clock pings so the receiver can place our TS stamps on its clock
+            self._writer.write(encode_frame(make_pong(data, received)))
+        elif is_control_message(data):
+            self.max_rate = data.get('max_rate')
+            self.advised_batch = max(1, int(data.get('batch') or 1))
+        elif is_ack(data) or is_welcome(data):
+            if data.get('ack') is not None:
+                self.acked = data['ack']
+                if is_welcome(data):
+                    # Restarted under a resumed session: the receiver drops anything
+                    # not newer than what it already has, so carry on from there
+                    self.sequence = max(self.sequence, self.acked + 1)
+            self.recording = bool(data.get('recording'))
+        elif is_resync_message(data) and self.encoder:
+            self.encoder.request_keyframe()
+
+
+async def open_streams(host, port, names, **options):
+    """Connect one MotionStream per name concurrently; options go to MotionStream"""
+    streams = [MotionStream(host, port, stream=name, **options) for name in names]
+    await asyncio.gather(*(stream.connect() for stream in streams))
+    return streams
+
+
+def circle_pose(t, offset=0.0):
+    """Camera circling the origin, t seconds into the move"""
+    angle = 0.5 * t + offset
+    return {"X": 5.0 * math.cos(angle), "Y": 5.0 * math.sin(angle), "Z": 2.0 + math.sin(2.0 * t),
+            "ROT_X": math.pi / 2, "ROT_Y": 0.0, "ROT_Z": angle + math.pi / 2}
+
+
+async def send_circles(streams, rate, duration):
+    """Send every stream its own circle at rate poses/s for duration seconds"""
+    loop = asyncio.get_running_loop()
+    start = loop.time()
+    tick = 0
+    while tick / rate < duration:
+        for index, stream in enumerate(streams):
+            stream.send(circle_pose(tick / rate, index * 2.0 * math.pi / len(streams)))
+        await asyncio.gather(*(stream.drain() for stream in streams))
+        tick += 1
+        delay = start + tick / rate - loop.time()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+
+async def run(args):
+    names = [f"{args.prefix}-{index + 1}" for index in range(args.streams)]
+    streams = await open_streams(args.host, args.port, names, batch_size=args.batch,
+                                 batch_delay=args.batch_delay, nodelay=not args.nagle)
+    print(f"🔗 Connected {len(streams)} stream(s) to {args.host}:{args.port}")
+    try:
+        await send_circles(streams, args.rate, args.duration)
+    finally:
+        await asyncio.gather(*(stream.close() for stream in streams))
+    for stream in streams:
+        print(f"✅ {stream.stream}: {stream.sent_poses} poses in {stream.sent_frames} frames, "
+              f"{stream.writes} writes, acknowledged up to SEQ {stream.acked}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Asyncio pose sender")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--streams', type=int, default=1, help="concurrent sender connections")
+    parser.add_argument('--prefix', default='sdk', help="STREAM names are PREFIX-1, PREFIX-2, ...")
+    parser.add_argument('--rate', type=float, default=60.0, help="poses per second per stream")
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to send for")
+    parser.add_argument('--batch', type=int, default=1, help="poses per frame")
+    parser.add_argument('--batch-delay', type=float, default=0.0,
+                        help="longest a pose waits for its batch to fill, in seconds")
+    parser.add_argument('--nagle', action='store_true', help="leave TCP_NODELAY off")
+    args = parser.parse_args()
+
+    try:
+        asyncio.run(run(args))
+    except KeyboardInterrupt:
+        print("\n👋 Stopped")
+    except OSError as e:
+        print(f"❌ Failed to connect: {e}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,342 @@
+"""
+OSC input from control surfaces, lighting desks and other applications
+
+OSC messages arrive over UDP, each an address, a type tag string and big-endian
+arguments, all padded to 4 bytes; bundles group messages or further bundles
+under an NTP time tag. Controllers send single values such as a fader, so
+routes name the pose fields and channels each address drives:
+
+    /camera/position=X Y Z; /camera/rotation=ROT_X ROT_Y ROT_Z; /camera/lens=LENS
+
+An OscReceiver keeps the current value of every routed field and yields the
+whole pose after each plain message, and once per bundle after all of its
+messages, stamped with the bundle's time tag. Routing to QUAT_* fields makes the
+poses quaternion poses, and channel fields fill the ChannelSchema's columns.
+
+Parsing reads the datagram in place with precompiled Structs: one per type
+tag string, cached, so a message's numeric arguments unpack in one call, and
+the routes are compiled into a dict from address bytes to state slots. Each
+distinct header, address plus type tags, is resolved once into its slots and
+Struct, so dispatching a message is one dict lookup without decoding anything.
+Address patterns with OSC wildcards (?, *, [...], {...}) are matched against
+the routes when their header is first seen. Only numeric arguments (f, i, d, h) are understood; messages
+with others are counted and skipped. Non-finite arguments are rejected as
+errors and leave the state as it was, and a routed quaternion of zero length
+yields no pose.
+"""
+
+import functools
+import math
+import re
+import struct
+import time
+
+try:
+    from . import metrics
+    from .channel_schema import ChannelSchema
+    from .pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, CHANNELS_FIELD
+    from .udp_input import UdpListener
+except ImportError:
+    import metrics
+    from channel_schema import ChannelSchema
+    from pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, CHANNELS_FIELD
+    from udp_input import UdpListener
+
+OSC_PORT = 8000
+
+DEFAULT_ROUTES = "/camera/position=X Y Z; /camera/rotation=ROT_X ROT_Y ROT_Z; /camera/lens=LENS"
+
+BUNDLE_TAG = b'#bundle\0'
+
+# Time tags count seconds since 1900 in 32.32 fixed point; 1 means "now"
+IMMEDIATE = 1
+NTP_TO_UNIX = 2208988800
+
+# Most distinct message headers whose routing is remembered
+HEADER_CACHE_SIZE = 256
+
+_TAG_FORMATS = {ord('f'): 'f', ord('i'): 'i', ord('d'): 'd', ord('h'): 'q'}
+_PATTERN_CHARS = frozenset(b'?*[{')
+_LENGTH = struct.Struct('>i')
+_TIME_TAG = struct.Struct('>Q')
+
+# Slots of the receiver state: location, Euler rotation, quaternion, then channels
+_QUATERNION_START = 6
+_STATE_FIELDS = EULER_FIELDS + QUATERNION_FIELDS[3:]
+
+
+def _padded(size):
+    return (size + 4) & ~3
+
+
+@functools.lru_cache(maxsize=64)
+def _arguments(tags):
+    """Struct unpacking the arguments of a type tag string, or None if any aren't numeric"""
+    formats = []
+    for tag in tags[1:]:
+        code = _TAG_FORMATS.get(tag)
+        if code is None:
+            return None
+        formats.append(code)
+    return struct.Struct('>' + ''.join(formats))
+
+
+def _pattern_regex(pattern):
+    """Compile an OSC address pattern into a regular expression over address bytes"""
+    out = []
+    i = 0
+    while i < len(pattern):
+        char = pattern[i:i + 1]
+        if char == b'?':
+            out.append(b'[^/]')
+        elif char == b'*':
+            out.append(b'[^/]*')
+        elif char == b'[':
+            end = pattern.find(b']', i)
+            if end < 0:
+                raise ValueError(f"Unclosed [ in OSC address pattern: {pattern!r}")
+            body = pattern[i + 1:end]
+            negate = body.startswith(b'!')
+            body = re.escape(body[1:] if negate else body).replace(b'\\-', b'-')
+            out.append(b'[' + (b'^' if negate else b'') + body + b']')
+            i = end
+        elif char == b'{':
+            end = pattern.find(b'}', i)
+            if end < 0:
+                raise ValueError(f"Unclosed {{ in OSC address pattern: {pattern!r}")
+            out.append(b'(?:' + b'|'.join(re.escape(part) for part in pattern[i + 1:end].split(b',')) + b')')
+            i = end
+        else:
+            out.append(re.escape(char))
+        i += 1
+    return re.compile(b''.join(out) + b'\\Z')
+
+
+def parse_routes(text):
+    """Parse "address=FIELD FIELD; ..." into a list of (address, fields) pairs"""
+    routes = []
+    for entry in text.split(';'):
+        if not entry.strip():
+            continue
+        address, sep, fields = entry.partition('=')
+        address, fields = address.strip(), tuple(fields.split())
+        if not sep or not address.startswith('/') or not fields:
+            raise ValueError(f"OSC route must look like /address=FIELD ...: {entry.strip()!r}")
+        if _PATTERN_CHARS.intersection(address.encode('ascii', 'replace')):
+            raise ValueError(f"OSC route address can't contain wildcards: {address}")
+        routes.append((address, fields))
+    return routes
+
+
+def time_tag_to_unix(tag):
+    """Wall-clock seconds of an OSC time tag, or None for "immediately\""""
+    if tag == IMMEDIATE:
+        return None
+    return (tag >> 32) - NTP_TO_UNIX + (tag & 0xFFFFFFFF) / 4294967296.0
+
+
+def unix_to_time_tag(seconds):
+    seconds += NTP_TO_UNIX
+    whole = int(seconds)
+    return (whole << 32) | int((seconds - whole) * 4294967296.0)
+
+
+def encode_message(address, *values):
+    """Build an OSC message of float arguments"""
+    address = address.encode('ascii')
+    tags = b',' + b'f' * len(values)
+    return b''.join((
+        address, b'\0' * (_padded(len(address)) - len(address)),
+        tags, b'\0' * (_padded(len(tags)) - len(tags)),
+        struct.pack(f'>{len(values)}f', *values),
+    ))
+
+
+def encode_bundle(messages, seconds=None):
+    """Build an OSC bundle of encoded messages, timed at wall-clock seconds or immediately"""
+    tag = IMMEDIATE if seconds is None else unix_to_time_tag(seconds)
+    parts = [BUNDLE_TAG, _TIME_TAG.pack(tag)]
+    for message in messages:
+        parts.append(_LENGTH.pack(len(message)))
+        parts.append(message)
+    return b''.join(parts)
+
+
+class WallClock:
+    """Places wall-clock time tags on the receiver clock, as ClockSync does for TS
+
+    OSC assumes sender and receiver clocks agree, as they do on one machine or
+    with NTP, so a time tag is taken as our own wall-clock time.
+    """
+
+    synced = True
+
+    @staticmethod
+    def to_local(stamp, now):
+        return now + (stamp - time.time())
+
+
+class OscReceiver:
+    """Turns OSC datagrams into poses through compiled routes
+
+    Counts:
+
+        messages     messages parsed
+        unrouted     messages whose address no route matches
+        unsupported  routed messages with non-numeric arguments
+        errors       malformed datagrams and non-finite arguments
+    """
+
+    def __init__(self, routes=None, schema=None):
+        routes = parse_routes(DEFAULT_ROUTES) if routes is None else list(routes)
+        self.routes = routes
+        # The default routes drive LENS, so the standard channels are always there
+        self.schema = schema if schema is not None else ChannelSchema()
+        channel_fields = self.schema.fields
+        slots = {field: index for index, field in enumerate(_STATE_FIELDS)}
+        slots.update((field, len(_STATE_FIELDS) + column) for column, field in enumerate(channel_fields))
+
+        # Address bytes -> state slots taking the message's arguments in order
+        self._table = {}
+        for address, fields in routes:
+            for field in fields:
+                if field not in slots:
+                    raise ValueError(f"Unknown pose field or channel in OSC route: {field}")
+            self._table[address.encode('ascii')] = tuple(slots[field] for field in fields)
+        routed = {slot for route_slots in self._table.values() for slot in route_slots}
+        self._quaternion = any(_QUATERNION_START <= slot < len(_STATE_FIELDS) for slot in routed)
+        self._channels = any(slot >= len(_STATE_FIELDS) for slot in routed)
+        self._headers = {}
+
+        # Euler poses start level and looking along +Y, quaternion poses at identity
+        self._state = [0.0, 0.0, 0.0, math.pi / 2, 0.0, 0.0, 1.0, 0.0, 0.0, 0.0] + [None] * len(channel_fields)
+        self.messages = 0
+        self.unrouted = 0
+        self.unsupported = 0
+        self.errors = 0
+
+    def _compile_header(self, address, tags):
+        """(state slots or None if unrouted, argument Struct or None if unsupported) of a message header"""
+        slots = self._table.get(address)
+        if slots is None and _PATTERN_CHARS.intersection(address):
+            # A pattern addresses every route it matches; each takes the arguments in order
+            regex = _pattern_regex(address)
+            slots = tuple(slot for route, route_slots in self._table.items() if regex.match(route)
+                          for slot in route_slots) or None
+        # Type tags are optional in old OSC; without them there is nothing to read
+        arguments = _arguments(tags) if tags[:1] == b',' else None
+        return slots, arguments
+
+    def feed(self, data):
+        """Parse one datagram; returns (poses, stamps) with a wall-clock stamp or None per pose"""
+        # One copy of the datagram; everything after reads it in place
+        data = bytes(data)
+        poses = []
+        stamps = []
+        try:
+            if data.startswith(BUNDLE_TAG):
+                self._bundle(data, 0, len(data), poses, stamps)
+            elif self._message(data, 0, len(data)):
+                pose = self.pose()
+                if pose is not None:
+                    poses.append(pose)
+                    stamps.append(None)
+        except (ValueError, struct.error) as e:
+            self.errors += 1
+            metrics.parse_errors.inc()
+            print(f"Invalid OSC packet: {e}")
+        return poses, stamps
+
+    def _bundle(self, data, offset, end, poses, stamps):
+        if end - offset < 16:
+            raise ValueError("OSC bundle too short")
+        tag = _TIME_TAG.unpack_from(data, offset + 8)[0]
+        offset += 16
+        changed = False
+        while offset < end:
+            size = _LENGTH.unpack_from(data, offset)[0]
+            offset += 4
+            if size <= 0 or size % 4 or offset + size > end:
+                raise ValueError(f"Bad OSC bundle element size: {size}")
+            if data.startswith(BUNDLE_TAG, offset):
+                self._bundle(data, offset, offset + size, poses, stamps)
+            else:
+                changed = self._message(data, offset, offset + size) or changed
+            offset += size
+        if changed:
+            pose = self.pose()
+            if pose is not None:
+                poses.append(pose)
+                stamps.append(time_tag_to_unix(tag))
+
+    def _message(self, data, offset, end):
+        """Apply one message to the state; True if it changed a routed field"""
+        self.messages += 1
+        address_end = data.find(b'\0', offset, end)
+        if address_end < 0:
+            raise ValueError("Unterminated OSC address")
+        tags_start = offset + _padded(address_end - offset)
+        tags_end = data.find(b'\0', tags_start, end)
+        header_end = tags_start + _padded(tags_end - tags_start) if tags_end >= 0 else tags_start
+
+        # Senders repeat the same few address and type tag headers, so each is compiled once
+        header = data[offset:header_end]
+        compiled = self._headers.get(header)
+        if compiled is None:
+            tags = data[tags_start:tags_end] if tags_end >= 0 else b''
+            compiled = self._compile_header(data[offset:address_end], tags)
+            if len(self._headers) >= HEADER_CACHE_SIZE:
+                self._headers.clear()
+            self._headers[header] = compiled
+        slots, arguments = compiled
+
+        if slots is None:
+            self.unrouted += 1
+            return False
+        if arguments is None or header_end + arguments.size > end:
+            self.unsupported += 1
+            return False
+        values = arguments.unpack_from(data, header_end)
+        # NaN and infinities carry through a sum, so one check covers every argument
+        if not math.isfinite(sum(values)):
+            self.errors += 1
+            metrics.parse_errors.inc()
+            return False
+        state = self._state
+        for slot, value in zip(slots, values):
+            state[slot] = value
+        return True
+
+    def pose(self):
+        """Current pose of the routed fields, or None while the quaternion has zero length"""
+        state = self._state
+        if self._quaternion:
+            qw, qx, qy, qz = state[6:10]
+            norm = math.sqrt(qw * qw + qx * qx + qy * qy + qz * qz)
+            if not norm:
+                return None
+            pose = {'X': state[0], 'Y': state[1], 'Z': state[2],
+                    'QUAT_W': qw / norm, 'QUAT_X': qx / norm, 'QUAT_Y': qy / norm, 'QUAT_Z': qz / norm}
+        else:
+            pose = dict(zip(EULER_FIELDS, state[:6]))
+        if self._channels:
+            pose[CHANNELS_FIELD] = tuple(state[len(_STATE_FIELDS):])
+        return pose
+
+
+class OscListener(UdpListener):
+    """Receives OSC on a UDP port and hands the poses to a callback
+
+    on_poses is called from the listener thread as on_poses(poses, stamps)
+    for each datagram that changed a routed field.
+    """
+
+    def __init__(self, on_poses, host='0.0.0.0', port=OSC_PORT, receiver=None):
+        super().__init__(host, port)
+        self.on_poses = on_poses
+        self.receiver = receiver or OscReceiver()
+
+    def handle(self, datagram):
+        poses, stamps = self.receiver.feed(datagram)
+        if poses:
+            self.on_poses(poses, stamps)
@@ -11,30 +11,100 @@ import threading
 import webbrowser
 import os
 import json
+import select
 from pathlib import Path
 
+from flow_control import encode_frame, split_frames, is_control_message
+from session import is_ack, is_welcome, make_hello
+from sequencing import STREAM_FIELD
+
 # Import our standalone WebSocket server
 from standalone_websocket_server import start_websocket_server, stop_websocket_server
 
+class BlenderLink:
+    """Persistent length-prefixed connection to Blender's server on port 8765
+    
+    Also collects the control frames and session acknowledgements Blender sends
+    back so they can be passed on to the phone in the HTTP response.
+    """
+    
+    def __init__(self, host='localhost', port=8765):
+        self.host = host
+        self.port = port
+        self.socket = None
+        self.lock = threading.Lock()
+        self.buffer = b''
+        self.control = None
+        
+        # Phone session announced on this connection, and Blender's latest ack
+        self.session = None
+        self.ack = None
+    
+    def send(self, data):
+        """Send one message; returns Blender's latest control advice and session ack"""
+        with self.lock:
+            try:
+                if self.socket is None:
+                    self.socket = socket.create_connection((self.host, self.port), timeout=1.0)
+                    self.buffer = b''
+                    self.session = None
+                
+                # Announce the phone's session so Blender resumes its sequencing
+                last = data[-1] if isinstance(data, list) and data else data
+                session = last.get(STREAM_FIELD) if isinstance(last, dict) else None
+                if session and session != self.session:
+                    self.socket.sendall(encode_frame(make_hello(session)))
+                    self.session = session
+                    self.ack = None
+                
+                self.socket.sendall(encode_frame(data))
+                self.read_control()
+            except OSError:
+                self.close()
+                raise
+            return self.control, self.ack
+    
+    def read_control(self):
+        """Read any pending control frames without blocking"""
+        while select.select([self.socket], [], [], 0)[0]:
+            chunk = self.socket.recv(4096)
+            if not chunk:
+                raise ConnectionError("Blender closed the connection")
+            self.buffer += chunk
+        
+        frames, self.buffer = split_frames(self.buffer)
+        for frame in frames:
+            try:
+                message = json.loads(frame.decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            if is_control_message(message):
+                self.control = message
+            elif is_welcome(message) or is_ack(message):
+                self.ack = {'ack': message.get('ack'), 'recording': message.get('recording')}
+    
+    def close(self):
+        """Drop the connection so the next send reconnects"""
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+        self.socket = None
+
+blender_link = BlenderLink()
+
 class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
     def forward_to_blender(self, data):
         """Forward camera data to Blender's server on port 8765"""
         try:
-            # Create a socket connection to Blender's server
-            client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            client_socket.settimeout(1.0)  # 1 second timeout
-            client_socket.connect(('localhost', 8765))
-            
-            # Send the JSON data to Blender
-            json_data = json.dumps(data)
-            client_socket.send(json_data.encode('utf-8'))
-            
-            # Close the connection
-            client_socket.close()
+            control, ack = blender_link.send(data)
             print(f"✅ Forwarded data to Blender: {data}")
+            return control, ack
             
         except Exception as e:
             print(f"⚠️  Could not forward to Blender: {e}")
+            return None, None
     
     def do_POST(self):
         """Handle POST requests for camera data"""
@@ -51,7 +121,7 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 print(f"📱 Received camera data via HTTP: {data}")
                 
                 # Forward the data to Blender's server
-                self.forward_to_blender(data)
+                control, ack = self.forward_to_blender(data)
                 
                 # Send success response
                 self.send_response(200)
@@ -61,7 +131,8 @@ class CustomHTTPRequestHandler(http.server.SimpleHTTPRequestHandler):
                 self.send_header('Access-Control-Allow-Headers', 'Content-Type')
                 self.end_headers()
                 
-                response = {'status': 'success', 'message': 'Data received'}
+                # Pass Blender's rate advice and session ack on so the phone can adapt
+                response = {'status': 'success', 'message': 'Data received', 'control': control, 'ack': ack}
                 self.wfile.write(json.dumps(response).encode())
                 
             except Exception as e:
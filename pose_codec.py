@@ -0,0 +1,287 @@
+"""
+Compact binary pose codec for constrained links
+
+Poses are quantised to fixed point and sent as a keyframe followed by small
+deltas against the previous quantised pose. Encoder and decoder track the same
+integer state, so there is no drift. Every frame carries a 16-bit sequence
+number; after a gap the decoder ignores deltas until the next keyframe and asks
+the sender for one with a {"type": "resync"} message.
+
+Frames travel in the usual length-prefixed framing next to JSON messages and
+are recognised by their first byte:
+
+    keyframe:  magic, KEYFRAME, seq:u16, layout:u8, pos_step:f64, rot_step:f64, [mask:u32], N x i32
+    delta16:   magic, DELTA16,  seq:u16, N x i16
+    delta8:    magic, DELTA8,   seq:u16, N x i8
+
+Layouts are the Euler (6 channel) and quaternion (7 channel) pose forms of
+pose_protocol; matrix poses are sent as quaternion poses. Poses with extra
+channels set LAYOUT_CHANNELS in the layout and follow it with a mask of the
+ChannelSchema columns they carry; those values come after the pose's, quantised
+with each channel's step. Encoder and decoder need the same schema.
+"""
+
+import functools
+import struct
+
+try:
+    from .pose_math import matrix_to_location_quaternion, normalize_quaternion
+    from .pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+except ImportError:
+    from pose_math import matrix_to_location_quaternion, normalize_quaternion
+    from pose_protocol import EULER_FIELDS, QUATERNION_FIELDS, MATRIX_FIELD, CHANNELS_FIELD
+
+CODEC_MAGIC = 0xC7
+
+KEYFRAME = 0x01
+DELTA16 = 0x02
+DELTA8 = 0x03
+
+LAYOUT_EULER = 0
+LAYOUT_QUATERNION = 1
+LAYOUT_FIELDS = {
+    LAYOUT_EULER: EULER_FIELDS,
+    LAYOUT_QUATERNION: QUATERNION_FIELDS,
+}
+# Layout flag for keyframes followed by a channel mask
+LAYOUT_CHANNELS = 0x80
+
+RESYNC_TYPE = 'resync'
+
+# While waiting for a keyframe, repeat the resync request every this many dropped frames
+RESYNC_REPEAT = 30
+
+_HEADER = struct.Struct('!BBH')
+_KEYFRAME_INFO = struct.Struct('!Bdd')
+_CHANNEL_MASK = struct.Struct('!I')
+
+_INT32_LIMIT = 2 ** 31 - 1
+
+
+def is_codec_frame(message):
+    """Check whether a received message is a binary codec frame rather than JSON"""
+    return isinstance(message, (bytes, bytearray)) and len(message) > 0 and message[0] == CODEC_MAGIC
+
+
+def is_resync_message(data):
+    """Check whether a decoded control message asks the sender for a keyframe"""
+    return isinstance(data, dict) and data.get('type') == RESYNC_TYPE
+
+
+def resync_message():
+    """Build the message a receiver sends to ask for a new keyframe"""
+    return {'type': RESYNC_TYPE}
+
+
+def _pose_layout(pose):
+    """Return (layout, channel values) for a pose dict in any pose_protocol form"""
+    if MATRIX_FIELD in pose:
+        location, quat = matrix_to_location_quaternion(pose[MATRIX_FIELD])
+        return LAYOUT_QUATERNION, location + quat
+    if 'QUAT_W' in pose:
+        return LAYOUT_QUATERNION, [pose[field] for field in QUATERNION_FIELDS]
+    return LAYOUT_EULER, [pose[field] for field in EULER_FIELDS]
+
+
+def _channel_steps(layout, position_step, rotation_step):
+    return [position_step] * 3 + [rotation_step] * (len(LAYOUT_FIELDS[layout]) - 3)
+
+
+@functools.lru_cache(maxsize=None)
+def _body(code, count):
+    """Struct for count values of the given struct code"""
+    return struct.Struct(f'!{count}{code}')
+
+
+class PoseEncoder:
+    """Encodes a stream of poses into keyframes and quantised deltas"""
+
+    def __init__(self, position_precision=1e-4, rotation_precision=1e-4, keyframe_interval=60, schema=None):
+        # Quantisation steps in Blender units and radians (or quaternion units)
+        self.position_precision = float(position_precision)
+        self.rotation_precision = float(rotation_precision)
+        self.keyframe_interval = keyframe_interval
+        # ChannelSchema of the poses' CHANNELS; without one, channels are not sent
+        self.schema = schema
+
+        self.sequence = 0
+        self._layout = None
+        self._mask = 0
+        self._keyframe_steps = None
+        self._state = None
+        self._since_keyframe = 0
+        self._force_keyframe = True
+
+    def request_keyframe(self):
+        """Make the next frame a keyframe, e.g. after the receiver asked to resync"""
+        self._force_keyframe = True
+
+    def encode(self, pose):
+        """Encode one pose dict and return the frame bytes"""
+        layout, values = _pose_layout(pose)
+        position_step, rotation_step = self.position_precision, self.rotation_precision
+        steps = _channel_steps(layout, position_step, rotation_step)
+
+        # Channels the pose carries follow its transform, in schema column order
+        mask = 0
+        channels = pose.get(CHANNELS_FIELD)
+        if channels is not None and self.schema is not None:
+            values = list(values)
+            for column, value in enumerate(channels):
+                if value is not None:
+                    mask |= 1 << column
+                    values.append(value)
+                    steps.append(self.schema.steps[column])
+        quantised = [round(value / step) for value, step in zip(values, steps)]
+
+        self.sequence = (self.sequence + 1) & 0xFFFF
+
+        if (self._force_keyframe or layout != self._layout or mask != self._mask
+                or (position_step, rotation_step) != self._keyframe_steps
+                or self._since_keyframe >= self.keyframe_interval):
+            return self._keyframe(layout, mask, position_step, rotation_step, quantised)
+
+        deltas = [new - old for new, old in zip(quantised, self._state)]
+        low, high = min(deltas), max(deltas)
+        if -128 <= low and high <= 127:
+            body = _body('b', len(deltas)).pack(*deltas)
+            frame_type = DELTA8
+        elif -32768 <= low and high <= 32767:
+            body = _body('h', len(deltas)).pack(*deltas)
+            frame_type = DELTA16
+        else:
+            # Jump too large for a delta
+            return self._keyframe(layout, mask, position_step, rotation_step, quantised)
+
+        self._state = quantised
+        self._since_keyframe += 1
+        return _HEADER.pack(CODEC_MAGIC, frame_type, self.sequence) + body
+
+    def _keyframe(self, layout, mask, position_step, rotation_step, quantised):
+        if any(abs(value) > _INT32_LIMIT for value in quantised):
+            raise ValueError("Pose value out of range for the configured precision")
+        self._layout = layout
+        self._mask = mask
+        self._keyframe_steps = (position_step, rotation_step)
+        self._state = quantised
+        self._since_keyframe = 0
+        self._force_keyframe = False
+        header = _HEADER.pack(CODEC_MAGIC, KEYFRAME, self.sequence)
+        if mask:
+            header += (_KEYFRAME_INFO.pack(layout | LAYOUT_CHANNELS, position_step, rotation_step)
+                       + _CHANNEL_MASK.pack(mask))
+        else:
+            header += _KEYFRAME_INFO.pack(layout, position_step, rotation_step)
+        return header + _body('i', len(quantised)).pack(*quantised)
+
+
+class PoseDecoder:
+    """Decodes codec frames from one sender back into pose dicts"""
+
+    def __init__(self, schema=None):
+        # ChannelSchema naming the channels of keyframes that carry any
+        self.schema = schema
+        self._layout = None
+        self._fields = None
+        self._columns = ()
+        self._steps = None
+        self._state = None
+        self._sequence = None
+        self._resync_pending = False
+        self._waiting_drops = 0
+
+        self.keyframes = 0
+        self.deltas = 0
+        self.dropped = 0
+
+    def decode(self, frame):
+        """Decode one frame; returns a pose dict, or None while waiting for a keyframe
+
+        Raises ValueError for malformed frames.
+        """
+        if len(frame) < _HEADER.size:
+            raise ValueError("Truncated codec frame")
+        magic, frame_type, sequence = _HEADER.unpack_from(frame)
+        if magic != CODEC_MAGIC:
+            raise ValueError("Not a codec frame")
+
+        if frame_type == KEYFRAME:
+            return self._decode_keyframe(frame, sequence)
+        if frame_type in (DELTA16, DELTA8):
+            return self._decode_delta(frame, frame_type, sequence)
+        raise ValueError(f"Unknown codec frame type: {frame_type}")
+
+    def take_resync_request(self):
+        """Return True once after a gap, when the sender should be asked for a keyframe"""
+        pending, self._resync_pending = self._resync_pending, False
+        return pending
+
+    def _decode_keyframe(self, frame, sequence):
+        offset = _HEADER.size + _KEYFRAME_INFO.size
+        mask = 0
+        try:
+            layout, position_step, rotation_step = _KEYFRAME_INFO.unpack_from(frame, _HEADER.size)
+            if layout & LAYOUT_CHANNELS:
+                layout &= ~LAYOUT_CHANNELS
+                (mask,) = _CHANNEL_MASK.unpack_from(frame, offset)
+                offset += _CHANNEL_MASK.size
+            fields = LAYOUT_FIELDS[layout]
+        except (struct.error, KeyError):
+            raise ValueError("Malformed codec keyframe")
+        columns = [column for column in range(mask.bit_length()) if mask >> column & 1]
+        if columns and (self.schema is None or columns[-1] >= len(self.schema)):
+            raise ValueError("Codec keyframe carries channels the schema does not declare")
+        body = _body('i', len(fields) + len(columns))
+        if len(frame) != offset + body.size:
+            raise ValueError("Malformed codec keyframe")
+        if not (position_step > 0.0 and rotation_step > 0.0):
+            raise ValueError("Codec keyframe has an invalid precision")
+
+        self._layout = layout
+        self._fields = fields
+        self._columns = columns
+        self._steps = (_channel_steps(layout, position_step, rotation_step)
+                       + [self.schema.steps[column] for column in columns])
+        self._state = list(body.unpack_from(frame, offset))
+        self._sequence = sequence
+        self._resync_pending = False
+        self._waiting_drops = 0
+        self.keyframes += 1
+        return self._pose()
+
+    def _decode_delta(self, frame, frame_type, sequence):
+        expected = None if self._sequence is None else (self._sequence + 1) & 0xFFFF
+        if sequence != expected:
+            # Lost or reordered frame: deltas are useless until the next keyframe
+            if self._state is not None or self._waiting_drops % RESYNC_REPEAT == 0:
+                self._resync_pending = True
+            self._state = None
+            self._sequence = None
+            self._waiting_drops += 1
+            self.dropped += 1
+            return None
+
+        body = _body('b' if frame_type == DELTA8 else 'h', len(self._state))
+        if len(frame) != _HEADER.size + body.size:
+            raise ValueError("Malformed codec delta frame")
+
+        self._state = [value + delta for value, delta in
+                       zip(self._state, body.unpack_from(frame, _HEADER.size))]
+        self._sequence = sequence
+        self.deltas += 1
+        return self._pose()
+
+    def _pose(self):
+        values = [value * step for value, step in zip(self._state, self._steps)]
+        if self._layout == LAYOUT_QUATERNION:
+            try:
+                values[3:7] = normalize_quaternion(*values[3:7])
+            except ValueError:
+                raise ValueError("Codec frame carries a zero quaternion")
+        pose = dict(zip(self._fields, values))
+        if self._columns:
+            channels = list(self.schema.empty)
+            for column, value in zip(self._columns, values[len(self._fields):]):
+                channels[column] = value
+            pose[CHANNELS_FIELD] = tuple(channels)
+        return pose
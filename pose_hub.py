@@ -0,0 +1,330 @@
+"""
+Pub-sub hub re-broadcasting received poses to many consumers
+
+One phone stream can drive several Blender receivers (previs, lighting,
+editorial) and a logger at once. The hub is handed each batch of decoded poses
+once, encodes it once into a length-prefixed JSON frame, and queues the same
+bytes object for every subscriber, so the encode cost does not grow with the
+number of subscribers; publishing only appends a reference per subscriber.
+
+Subscribers are plain TCP connections that receive the frames any receiver
+understands. They either connect to the hub's port, e.g. a logger, or the hub
+dials them, e.g. a Blender receiver listening on 8765, and redials if the
+connection drops; dialling is non-blocking, so an unreachable target never
+stalls the writer. Each subscriber has a bounded queue: a consumer that falls
+behind loses its oldest frames, never the newest, and never holds up the
+others. One writer thread sends to every subscriber with non-blocking sockets,
+finishing partly sent frames before starting the next. Whatever subscribers
+send back, such as a receiver's rate advice or clock pings, is read and ignored.
+"""
+
+import errno
+import selectors
+import socket
+import threading
+import time
+from collections import deque
+
+try:
+    from . import metrics
+    from .channel_schema import ChannelSchema
+    from .flow_control import encode_frame
+    from .pose_protocol import CHANNELS_FIELD
+except ImportError:
+    import metrics
+    from channel_schema import ChannelSchema
+    from flow_control import encode_frame
+    from pose_protocol import CHANNELS_FIELD
+
+HUB_PORT = 8766
+
+# Frames a subscriber may fall behind by before its oldest are dropped; about
+# a second of poses at 60 Hz
+QUEUE_SIZE = 64
+
+# Seconds between attempts to redial a subscriber the hub connects to, and
+# the longest one attempt may take
+RETRY_INTERVAL = 1.0
+CONNECT_TIMEOUT = 1.0
+
+frames_published = metrics.registry.counter('hub_frames_published_total', 'Frames encoded for hub subscribers')
+frames_dropped = metrics.registry.counter('hub_frames_dropped_total', 'Hub frames dropped for slow subscribers')
+
+
+def wire_pose(pose, schema):
+    """A decoded pose in message form, with its channels back under their field names"""
+    channels = pose.get(CHANNELS_FIELD)
+    if channels is None:
+        return pose
+    message = {field: value for field, value in pose.items() if field != CHANNELS_FIELD}
+    message.update(schema.named(channels))
+    return message
+
+
+class Subscriber:
+    """One consumer's connection and the frames queued for it"""
+
+    __slots__ = ('name', 'address', 'sock', 'connecting', 'queue', 'current', 'writing', 'sent', 'dropped',
+                 'retry_at')
+
+    def __init__(self, name, queue_size, address=None):
+        self.name = name
+        # (family, sockaddr) of subscribers the hub dials, which are redialled when lost
+        self.address = address
+        self.sock = None
+        # Dialled and waiting for the connection to complete
+        self.connecting = False
+        self.queue = deque(maxlen=queue_size)
+        # Unsent rest of the frame being written, and whether we wait for the socket to drain
+        self.current = None
+        self.writing = False
+        self.sent = 0
+        self.dropped = 0
+        self.retry_at = 0.0
+
+
+class PoseHub:
+    """Encodes published poses once and writes them to every subscriber"""
+
+    def __init__(self, port=HUB_PORT, host='0.0.0.0', targets=(), queue_size=QUEUE_SIZE, schema=None):
+        self.port = port
+        self.host = host
+        self.queue_size = queue_size
+        # Names the channels of published poses
+        self.schema = schema if schema is not None else ChannelSchema()
+        self.published = 0
+        self._targets = list(targets)
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._selector = None
+        self._listener = None
+        self._wake_reader, self._wake_writer = socket.socketpair()
+        self._wake_reader.setblocking(False)
+        self._wake_writer.setblocking(False)
+        self._woken = False
+        self._thread = None
+        self._running = False
+
+    @property
+    def subscribers(self):
+        with self._lock:
+            return list(self._subscribers)
+
+    def start(self):
+        """Listen for subscribers (unless port is None) and start the writer thread
+
+        Target names are resolved here, so a bad name raises OSError now rather
+        than blocking the writer later.
+        """
+        for host, port in self._targets:
+            family, _, _, _, sockaddr = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)[0]
+            self._subscribers.append(Subscriber(f"{host}:{port}", self.queue_size, (family, sockaddr)))
+        self._selector = selectors.DefaultSelector()
+        self._selector.register(self._wake_reader, selectors.EVENT_READ, None)
+        if self.port is not None:
+            listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+            listener.bind((self.host, self.port))
+            listener.listen(16)
+            listener.setblocking(False)
+            self._selector.register(listener, selectors.EVENT_READ, None)
+            self._listener = listener
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake()
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        with self._lock:
+            for subscriber in self._subscribers:
+                self._close(subscriber)
+        if self._listener:
+            self._listener.close()
+            self._listener = None
+        if self._selector:
+            self._selector.close()
+            self._selector = None
+
+    def publish_poses(self, poses):
+        """Publish a batch of decoded poses as one frame"""
+        if not poses:
+            return
+        messages = [wire_pose(pose, self.schema) for pose in poses]
+        self.publish(encode_frame(messages if len(messages) > 1 else messages[0]))
+
+    def publish(self, frame):
+        """Queue an encoded frame for every subscriber, dropping the oldest of any that are full"""
+        dropped = 0
+        with self._lock:
+            for subscriber in self._subscribers:
+                if subscriber.connecting or (subscriber.sock is None and subscriber.address is not None):
+                    continue
+                queue = subscriber.queue
+                if len(queue) == queue.maxlen:
+                    subscriber.dropped += 1
+                    dropped += 1
+                queue.append(frame)
+            self.published += 1
+            woken, self._woken = self._woken, True
+        frames_published.inc()
+        if dropped:
+            frames_dropped.inc(dropped)
+        if not woken:
+            self._wake()
+
+    def _wake(self):
+        try:
+            self._wake_writer.send(b'\0')
+        except (BlockingIOError, OSError):
+            pass
+
+    def _run(self):
+        while self._running:
+            self._redial()
+            for key, events in self._selector.select(timeout=RETRY_INTERVAL / 2):
+                if key.fileobj is self._wake_reader:
+                    try:
+                        while self._wake_reader.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                elif key.fileobj is self._listener:
+                    self._accept()
+                elif key.data.connecting:
+                    self._connected(key.data)
+                elif events & selectors.EVENT_READ:
+                    self._drain(key.data)
+            with self._lock:
+                self._woken = False
+                subscribers = list(self._subscribers)
+            for subscriber in subscribers:
+                if subscriber.sock is not None and not subscriber.connecting:
+                    self._flush(subscriber)
+
+    def _accept(self):
+        try:
+            sock, address = self._listener.accept()
+        except (BlockingIOError, OSError):
+            return
+        subscriber = Subscriber(f"{address[0]}:{address[1]}", self.queue_size)
+        self._attach(subscriber, sock)
+        with self._lock:
+            self._subscribers.append(subscriber)
+        print(f"📡 Subscriber connected from {subscriber.name}")
+
+    def _redial(self):
+        """Start non-blocking connects to lost targets and give up on ones taking too long"""
+        now = time.monotonic()
+        for subscriber in self.subscribers:
+            if subscriber.address is None:
+                continue
+            if subscriber.connecting:
+                if now >= subscriber.retry_at:
+                    self._dial_failed(subscriber, "timed out")
+                continue
+            if subscriber.sock is not None or now < subscriber.retry_at:
+                continue
+            family, sockaddr = subscriber.address
+            sock = socket.socket(family, socket.SOCK_STREAM)
+            sock.setblocking(False)
+            error = sock.connect_ex(sockaddr)
+            if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+                sock.close()
+                print(f"⚠️  Could not connect to subscriber {subscriber.name}: {errno.errorcode.get(error, error)}")
+                subscriber.retry_at = time.monotonic() + RETRY_INTERVAL
+                continue
+            subscriber.sock = sock
+            subscriber.connecting = True
+            subscriber.retry_at = now + CONNECT_TIMEOUT
+            self._selector.register(sock, selectors.EVENT_WRITE, subscriber)
+
+    def _connected(self, subscriber):
+        """Finish a dial once the socket is writable"""
+        error = subscriber.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR)
+        if error:
+            self._dial_failed(subscriber, errno.errorcode.get(error, error))
+            return
+        self._selector.unregister(subscriber.sock)
+        subscriber.connecting = False
+        self._attach(subscriber, subscriber.sock)
+        print(f"📡 Connected to subscriber {subscriber.name}")
+
+    def _dial_failed(self, subscriber, reason):
+        print(f"⚠️  Could not connect to subscriber {subscriber.name}: {reason}")
+        with self._lock:
+            self._close(subscriber)
+        subscriber.connecting = False
+        subscriber.retry_at = time.monotonic() + RETRY_INTERVAL
+
+    def _attach(self, subscriber, sock):
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        subscriber.sock = sock
+        subscriber.current = None
+        subscriber.writing = False
+        self._selector.register(sock, selectors.EVENT_READ, subscriber)
+
+    def _drain(self, subscriber):
+        """Read and discard what a subscriber sent; False if it disconnected"""
+        try:
+            if subscriber.sock.recv(65536):
+                return True
+        except BlockingIOError:
+            return True
+        except OSError:
+            pass
+        self._lost(subscriber)
+        return False
+
+    def _flush(self, subscriber):
+        """Send queued frames until the socket would block"""
+        sock = subscriber.sock
+        while True:
+            if subscriber.current is None:
+                with self._lock:
+                    if not subscriber.queue:
+                        break
+                    subscriber.current = memoryview(subscriber.queue.popleft())
+            try:
+                count = sock.send(subscriber.current)
+            except BlockingIOError:
+                count = 0
+            except OSError:
+                self._lost(subscriber)
+                return
+            if count < len(subscriber.current):
+                subscriber.current = subscriber.current[count:]
+                break
+            subscriber.current = None
+            subscriber.sent += 1
+        writing = subscriber.current is not None
+        if writing != subscriber.writing:
+            subscriber.writing = writing
+            events = selectors.EVENT_READ | (selectors.EVENT_WRITE if writing else 0)
+            self._selector.modify(sock, events, subscriber)
+
+    def _lost(self, subscriber):
+        print(f"📡 Subscriber {subscriber.name} disconnected")
+        with self._lock:
+            self._close(subscriber)
+            if subscriber.address is None:
+                self._subscribers.remove(subscriber)
+            else:
+                subscriber.retry_at = time.monotonic() + RETRY_INTERVAL
+
+    def _close(self, subscriber):
+        if subscriber.sock is None:
+            return
+        try:
+            self._selector.unregister(subscriber.sock)
+        except (KeyError, ValueError):
+            pass
+        subscriber.sock.close()
+        subscriber.sock = None
+        subscriber.connecting = False
+        subscriber.current = None
+        subscriber.queue.clear()
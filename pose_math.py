@@ -0,0 +1,213 @@
+"""
+Rotation conversions for camera poses
+
+Scalar helpers only use the standard library so the standalone server and
+clients can use them. Batch helpers work on whole NumPy arrays at once and are
+available wherever NumPy is (it ships with Blender).
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("NumPy is required for batch pose conversion")
+
+
+# Scalar conversions
+
+def normalize_quaternion(w, x, y, z):
+    """Return the unit quaternion (w, x, y, z)"""
+    length = math.sqrt(w * w + x * x + y * y + z * z)
+    if length < 1e-12 or not math.isfinite(length):
+        raise ValueError("Quaternion has zero or non-finite length")
+    return (w / length, x / length, y / length, z / length)
+
+
+def euler_to_quaternion(rot_x, rot_y, rot_z):
+    """Convert an XYZ Euler rotation in radians to a quaternion (w, x, y, z)"""
+    cx, sx = math.cos(rot_x * 0.5), math.sin(rot_x * 0.5)
+    cy, sy = math.cos(rot_y * 0.5), math.sin(rot_y * 0.5)
+    cz, sz = math.cos(rot_z * 0.5), math.sin(rot_z * 0.5)
+    return (
+        cx * cy * cz + sx * sy * sz,
+        sx * cy * cz - cx * sy * sz,
+        cx * sy * cz + sx * cy * sz,
+        cx * cy * sz - sx * sy * cz,
+    )
+
+
+def quaternion_to_euler(w, x, y, z):
+    """Convert a unit quaternion (w, x, y, z) to an XYZ Euler rotation in radians"""
+    r00 = 1.0 - 2.0 * (y * y + z * z)
+    r10 = 2.0 * (x * y + w * z)
+    r20 = 2.0 * (x * z - w * y)
+    r21 = 2.0 * (y * z + w * x)
+    r22 = 1.0 - 2.0 * (x * x + y * y)
+
+    cos_y = math.hypot(r00, r10)
+    if cos_y > 1e-6:
+        return (math.atan2(r21, r22), math.atan2(-r20, cos_y), math.atan2(r10, r00))
+
+    # Gimbal lock: roll and yaw share an axis, put it all on X
+    r01 = 2.0 * (x * y - w * z)
+    r11 = 1.0 - 2.0 * (x * x + z * z)
+    return (math.atan2(-r01, r11) if r20 > 0 else math.atan2(r01, r11), math.atan2(-r20, cos_y), 0.0)
+
+
+def location_quaternion_to_matrix(location, quat):
+    """Build 16 row-major 4x4 matrix values from a location and a unit quaternion (w, x, y, z)"""
+    w, x, y, z = quat
+    return [
+        1.0 - 2.0 * (y * y + z * z), 2.0 * (x * y - w * z), 2.0 * (x * z + w * y), location[0],
+        2.0 * (x * y + w * z), 1.0 - 2.0 * (x * x + z * z), 2.0 * (y * z - w * x), location[1],
+        2.0 * (x * z - w * y), 2.0 * (y * z + w * x), 1.0 - 2.0 * (x * x + y * y), location[2],
+        0.0, 0.0, 0.0, 1.0,
+    ]
+
+
+def matrix_to_location_quaternion(values):
+    """Split 16 row-major 4x4 matrix values into a location and a unit quaternion"""
+    m = values
+    r00, r01, r02 = m[0], m[1], m[2]
+    r10, r11, r12 = m[4], m[5], m[6]
+    r20, r21, r22 = m[8], m[9], m[10]
+
+    trace = r00 + r11 + r22
+    if trace > 0.0:
+        s = 2.0 * math.sqrt(trace + 1.0)
+        quat = (0.25 * s, (r21 - r12) / s, (r02 - r20) / s, (r10 - r01) / s)
+    elif r00 > r11 and r00 > r22:
+        s = 2.0 * math.sqrt(1.0 + r00 - r11 - r22)
+        quat = ((r21 - r12) / s, 0.25 * s, (r01 + r10) / s, (r02 + r20) / s)
+    elif r11 > r22:
+        s = 2.0 * math.sqrt(1.0 + r11 - r00 - r22)
+        quat = ((r02 - r20) / s, (r01 + r10) / s, 0.25 * s, (r12 + r21) / s)
+    else:
+        s = 2.0 * math.sqrt(1.0 + r22 - r00 - r11)
+        quat = ((r10 - r01) / s, (r02 + r20) / s, (r12 + r21) / s, 0.25 * s)
+
+    return (m[3], m[7], m[11]), normalize_quaternion(*quat)
+
+
+# Batch conversions
+
+def eulers_to_matrices(poses):
+    """Build (N, 4, 4) matrices from (N, 6) rows of X, Y, Z, ROT_X, ROT_Y, ROT_Z"""
+    _require_numpy()
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 6)
+
+    cx, cy, cz = np.cos(poses[:, 3]), np.cos(poses[:, 4]), np.cos(poses[:, 5])
+    sx, sy, sz = np.sin(poses[:, 3]), np.sin(poses[:, 4]), np.sin(poses[:, 5])
+
+    # XYZ Euler order, matching rotation_euler's default mode (R = Rz * Ry * Rx)
+    matrices = np.zeros((len(poses), 4, 4))
+    matrices[:, 0, 0] = cy * cz
+    matrices[:, 0, 1] = sx * sy * cz - cx * sz
+    matrices[:, 0, 2] = cx * sy * cz + sx * sz
+    matrices[:, 1, 0] = cy * sz
+    matrices[:, 1, 1] = sx * sy * sz + cx * cz
+    matrices[:, 1, 2] = cx * sy * sz - sx * cz
+    matrices[:, 2, 0] = -sy
+    matrices[:, 2, 1] = sx * cy
+    matrices[:, 2, 2] = cx * cy
+    matrices[:, :3, 3] = poses[:, :3]
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def quaternions_to_matrices(poses):
+    """Build (N, 4, 4) matrices from (N, 7) rows of X, Y, Z, QUAT_W, QUAT_X, QUAT_Y, QUAT_Z"""
+    _require_numpy()
+    poses = np.asarray(poses, dtype=np.float64).reshape(-1, 7)
+
+    quats = poses[:, 3:7] / np.linalg.norm(poses[:, 3:7], axis=1, keepdims=True)
+    w, x, y, z = quats[:, 0], quats[:, 1], quats[:, 2], quats[:, 3]
+
+    matrices = np.zeros((len(poses), 4, 4))
+    matrices[:, 0, 0] = 1.0 - 2.0 * (y * y + z * z)
+    matrices[:, 0, 1] = 2.0 * (x * y - w * z)
+    matrices[:, 0, 2] = 2.0 * (x * z + w * y)
+    matrices[:, 1, 0] = 2.0 * (x * y + w * z)
+    matrices[:, 1, 1] = 1.0 - 2.0 * (x * x + z * z)
+    matrices[:, 1, 2] = 2.0 * (y * z - w * x)
+    matrices[:, 2, 0] = 2.0 * (x * z - w * y)
+    matrices[:, 2, 1] = 2.0 * (y * z + w * x)
+    matrices[:, 2, 2] = 1.0 - 2.0 * (x * x + y * y)
+    matrices[:, :3, 3] = poses[:, :3]
+    matrices[:, 3, 3] = 1.0
+    return matrices
+
+
+def matrices_to_quaternions(matrices):
+    """Split (N, 4, 4) matrices into (N, 7) rows of location and unit quaternion"""
+    _require_numpy()
+    m = np.asarray(matrices, dtype=np.float64).reshape(-1, 4, 4)
+    r00, r11, r22 = m[:, 0, 0], m[:, 1, 1], m[:, 2, 2]
+
+    # Shepperd's method: pick the numerically largest component for every row
+    candidates = np.stack([
+        1.0 + r00 + r11 + r22,
+        1.0 + r00 - r11 - r22,
+        1.0 - r00 + r11 - r22,
+        1.0 - r00 - r11 + r22,
+    ], axis=1)
+    best = np.argmax(candidates, axis=1)
+    s = 2.0 * np.sqrt(np.maximum(candidates[np.arange(len(m)), best], 1e-12))
+
+    d21 = m[:, 2, 1] - m[:, 1, 2]
+    d02 = m[:, 0, 2] - m[:, 2, 0]
+    d10 = m[:, 1, 0] - m[:, 0, 1]
+    s01 = m[:, 0, 1] + m[:, 1, 0]
+    s02 = m[:, 0, 2] + m[:, 2, 0]
+    s12 = m[:, 1, 2] + m[:, 2, 1]
+
+    quats = np.empty((len(m), 4))
+    quats[:] = np.select(
+        [best[:, None] == 0, best[:, None] == 1, best[:, None] == 2],
+        [
+            np.stack([0.25 * s, d21 / s, d02 / s, d10 / s], axis=1),
+            np.stack([d21 / s, 0.25 * s, s01 / s, s02 / s], axis=1),
+            np.stack([d02 / s, s01 / s, 0.25 * s, s12 / s], axis=1),
+        ],
+        np.stack([d10 / s, s02 / s, s12 / s, 0.25 * s], axis=1),
+    )
+    quats /= np.linalg.norm(quats, axis=1, keepdims=True)
+
+    poses = np.empty((len(m), 7))
+    poses[:, :3] = m[:, :3, 3]
+    poses[:, 3:] = quats
+    return poses
+
+
+def quaternions_to_eulers(quats):
+    """Convert (N, 4) unit quaternions to (N, 3) XYZ Euler rotations in radians"""
+    _require_numpy()
+    q = np.asarray(quats, dtype=np.float64).reshape(-1, 4)
+    w, x, y, z = q[:, 0], q[:, 1], q[:, 2], q[:, 3]
+
+    r00 = 1.0 - 2.0 * (y * y + z * z)
+    r10 = 2.0 * (x * y + w * z)
+    r20 = 2.0 * (x * z - w * y)
+    r21 = 2.0 * (y * z + w * x)
+    r22 = 1.0 - 2.0 * (x * x + y * y)
+    cos_y = np.hypot(r00, r10)
+
+    eulers = np.empty((len(q), 3))
+    eulers[:, 0] = np.arctan2(r21, r22)
+    eulers[:, 1] = np.arctan2(-r20, cos_y)
+    eulers[:, 2] = np.arctan2(r10, r00)
+
+    # Gimbal lock rows: fold yaw into roll like the scalar version
+    locked = cos_y <= 1e-6
+    if np.any(locked):
+        r01 = 2.0 * (x * y - w * z)
+        r11 = 1.0 - 2.0 * (x * x + z * z)
+        eulers[locked, 0] = np.where(r20 > 0, np.arctan2(-r01, r11), np.arctan2(r01, r11))[locked]
+        eulers[locked, 2] = 0.0
+    return eulers
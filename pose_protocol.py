@@ -0,0 +1,111 @@
+"""
+Camera pose message format shared by the add-on, the standalone server and clients
+
+A pose message is a JSON object in one of three forms:
+
+    Euler:       {"X", "Y", "Z", "ROT_X", "ROT_Y", "ROT_Z"}
+    Quaternion:  {"X", "Y", "Z", "QUAT_W", "QUAT_X", "QUAT_Y", "QUAT_Z"}
+    Matrix:      {"MATRIX": [16 row-major floats]}
+
+Rotations are in radians. Quaternions are normalised once while decoding so the
+receiver can assign them directly to rotation_quaternion.
+
+Any form may also carry the optional SEQ, TS and STREAM fields used to drop
+stale samples; see sequencing.py. Lens, focus and other extra channels are
+declared by a ChannelSchema and decoded into one CHANNELS tuple; see
+channel_schema.py.
+"""
+
+import math
+
+try:
+    from .pose_math import normalize_quaternion, quaternion_to_euler, matrix_to_location_quaternion
+except ImportError:
+    from pose_math import normalize_quaternion, quaternion_to_euler, matrix_to_location_quaternion
+
+EULER_FIELDS = ('X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z')
+QUATERNION_FIELDS = ('X', 'Y', 'Z', 'QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z')
+MATRIX_FIELD = 'MATRIX'
+
+# Decoded poses keep their extra channels here, in the schema's column order
+CHANNELS_FIELD = 'CHANNELS'
+
+MODE_EULER = 'EULER'
+MODE_QUATERNION = 'QUATERNION'
+MODE_MATRIX = 'MATRIX'
+
+
+def _read_fields(data, fields):
+    """Convert the given fields to floats, raising ValueError on missing or bad values"""
+    values = []
+    for field in fields:
+        if field not in data:
+            raise ValueError(f"Missing required field: {field}")
+        try:
+            value = float(data[field])
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid numeric value in field: {field}")
+        if not math.isfinite(value):
+            raise ValueError(f"Non-finite value in field: {field}")
+        values.append(value)
+    return values
+
+
+def decode_pose(data, schema=None):
+    """Turn a parsed pose message into a normalised pose dict
+
+    With a ChannelSchema, the channels it declares are kept under CHANNELS_FIELD
+    when the message carries any. Raises ValueError if the message is not a
+    valid pose.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("Pose message must be a JSON object")
+
+    pose = _decode_transform(data)
+    if schema is not None:
+        channels = schema.read(data)
+        if channels is not None:
+            pose[CHANNELS_FIELD] = channels
+    return pose
+
+
+def _decode_transform(data):
+    if MATRIX_FIELD in data:
+        matrix = data[MATRIX_FIELD]
+        if not isinstance(matrix, (list, tuple)) or len(matrix) != 16:
+            raise ValueError(f"{MATRIX_FIELD} must contain 16 values")
+        try:
+            values = tuple(float(value) for value in matrix)
+        except (ValueError, TypeError):
+            raise ValueError(f"Invalid numeric value in field: {MATRIX_FIELD}")
+        if not all(math.isfinite(value) for value in values):
+            raise ValueError(f"Non-finite value in field: {MATRIX_FIELD}")
+        return {MATRIX_FIELD: values}
+
+    if 'QUAT_W' in data:
+        x, y, z, qw, qx, qy, qz = _read_fields(data, QUATERNION_FIELDS)
+        qw, qx, qy, qz = normalize_quaternion(qw, qx, qy, qz)
+        return {'X': x, 'Y': y, 'Z': z, 'QUAT_W': qw, 'QUAT_X': qx, 'QUAT_Y': qy, 'QUAT_Z': qz}
+
+    return dict(zip(EULER_FIELDS, _read_fields(data, EULER_FIELDS)))
+
+
+def pose_mode(pose):
+    """Return which rotation form a decoded pose uses"""
+    if MATRIX_FIELD in pose:
+        return MODE_MATRIX
+    if 'QUAT_W' in pose:
+        return MODE_QUATERNION
+    return MODE_EULER
+
+
+def pose_location_euler(pose):
+    """Return (location, euler rotation) for any decoded pose, for display and logging"""
+    mode = pose_mode(pose)
+    if mode == MODE_MATRIX:
+        location, quat = matrix_to_location_quaternion(pose[MATRIX_FIELD])
+        return location, quaternion_to_euler(*quat)
+    location = (pose['X'], pose['Y'], pose['Z'])
+    if mode == MODE_QUATERNION:
+        return location, quaternion_to_euler(pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+    return location, (pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'])
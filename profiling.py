@@ -0,0 +1,159 @@
+"""
+Opt-in profiling of the pose pipeline
+
+Pipeline stages record perf_counter_ns spans into a fixed-size ring buffer that
+can be exported as Chrome trace-event JSON (open in chrome://tracing or
+https://ui.perfetto.dev).
+
+Sampling is decided once per message, where it enters the pipeline, and the
+flag travels with the message, so a sampled message records all of its stages
+and the others record none:
+
+    sampled = profiling.enabled and profiling.sample()
+    ...
+    if sampled:
+        span = profiling.start_span()
+    ...
+    if sampled:
+        profiling.end_span('decode', span)
+
+Disabled, a message costs the attribute check and a local flag test per span.
+Enabled, an unsampled message adds one C-level sample() call, and 1 in
+sample_every messages records its spans. With the default 1 in 100,
+benchmark.py profiling_overhead puts the cost of enabling profiling on the
+network thread's pipeline at about 0.X% (1 in 10 costs about Y%). Set
+CAMERA_MOTION_PROFILE=1 to enable at start-up and CAMERA_MOTION_PROFILE_SAMPLE=N
+to change the sampling interval.
+"""
+
+import collections
+import functools
+import itertools
+import json
+import os
+import random
+import threading
+import time
+
+DEFAULT_CAPACITY = 65536
+DEFAULT_SAMPLE_EVERY = 100
+MAX_SAMPLE_EVERY = 10000
+
+enabled = os.environ.get('CAMERA_MOTION_PROFILE', '') not in ('', '0')
+sample_every = min(max(1, int(os.environ.get('CAMERA_MOTION_PROFILE_SAMPLE', DEFAULT_SAMPLE_EVERY))),
+                   MAX_SAMPLE_EVERY)
+
+# Ring buffer of (name, start_ns, end_ns, thread_id) spans; deque appends are
+# atomic, so threads recording at once need no lock
+_spans = collections.deque(maxlen=DEFAULT_CAPACITY)
+_append = _spans.append
+
+# Messages in one period of the sampling pattern, at least
+_PATTERN_LENGTH = 4096
+
+_perf_counter_ns = time.perf_counter_ns
+_get_ident = threading.get_ident
+
+
+def _sampler(every):
+    """Endless shuffled pattern with exactly one True per every messages
+
+    Shuffled so messages of several threads and input paths interleaving can't
+    lock the samples onto one of them. It runs for every message, so the draw
+    is a partial of the builtin next(), which is cheaper to call than the
+    cycle's own __next__.
+    """
+    blocks = max(1, _PATTERN_LENGTH // every)
+    pattern = [True] * blocks + [False] * (blocks * (every - 1))
+    random.Random().shuffle(pattern)
+    return functools.partial(next, itertools.cycle(pattern))
+
+
+# Call once per message: True if its spans are to be recorded
+sample = _sampler(sample_every)
+
+_randint = random.Random().randint
+
+
+def sample_interval():
+    """Messages until the next sampled one: sample_every on average, jittered
+
+    For a receive loop to count down itself, which costs less per message than
+    calling sample(); the jitter keeps its samples from locking onto a period
+    in the traffic.
+    """
+    return _randint(1, 2 * sample_every - 1)
+
+# Return a start timestamp for a span of a sampled message
+start_span = time.perf_counter_ns
+
+
+def enable(every=None):
+    """Turn profiling on, optionally changing the sampling interval"""
+    global enabled, sample_every, sample
+    if every is not None:
+        sample_every = min(max(1, int(every)), MAX_SAMPLE_EVERY)
+        sample = _sampler(sample_every)
+    enabled = True
+
+
+def disable():
+    """Turn profiling off; recorded spans are kept for export"""
+    global enabled
+    enabled = False
+
+
+def clear():
+    """Forget all recorded spans"""
+    _spans.clear()
+
+
+def end_span(name, start_ns):
+    """Record a span started with start_span"""
+    _append((name, start_ns, _perf_counter_ns(), _get_ident()))
+
+
+def span_count():
+    """Number of spans currently held in the ring buffer"""
+    return len(_spans)
+
+
+def spans():
+    """Return the recorded spans as (name, start_ns, duration_ns, thread_id), oldest first"""
+    # list() copies the deque in one step, even while other threads append
+    result = [(name, start, end - start, thread) for name, start, end, thread in list(_spans)]
+    result.sort(key=lambda span: span[1])
+    return result
+
+
+def summary():
+    """Return {stage: (count, average_us, max_us)} over the recorded spans"""
+    totals = {}
+    for name, _, duration, _ in spans():
+        count, total, longest = totals.get(name, (0, 0, 0))
+        totals[name] = (count + 1, total + duration, max(longest, duration))
+    return {name: (count, total / count / 1e3, longest / 1e3)
+            for name, (count, total, longest) in totals.items()}
+
+
+def chrome_trace():
+    """Build the recorded spans as a Chrome trace-event document"""
+    pid = os.getpid()
+    events = [{
+        'name': name,
+        'cat': 'pipeline',
+        'ph': 'X',
+        'ts': start / 1e3,
+        'dur': duration / 1e3,
+        'pid': pid,
+        'tid': thread,
+    } for name, start, duration, thread in spans()]
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+
+def export_chrome_trace(path):
+    """Write the recorded spans to path as Chrome trace-event JSON; returns the span count"""
+    trace = chrome_trace()
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trace, f)
+    return len(trace['traceEvents'])
@@ -0,0 +1,148 @@
+"""
+Instant replay of the most recent live poses
+
+The receiver keeps every incoming pose of the last few seconds in a ring buffer,
+whether or not a take is being recorded, so a move made with recording off can
+still be saved afterwards. The buffer is a set of NumPy arrays allocated once
+from the window length and the highest expected pose rate. Adding a pose writes
+one row in place, and memory stays the same however long the server runs.
+
+Rows hold the location and the rotation in the pose's own form, Euler or
+quaternion; matrix poses are split into location and quaternion on the way in.
+The ChannelSchema's extra channels get columns of their own, NaN where a pose
+did not carry them. take() returns the newest seconds of the buffer in the
+(frames, values, channels) form TakeRecorder.stop() uses.
+"""
+
+import threading
+
+import numpy as np
+
+try:
+    from . import pose_math
+    from .pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MATRIX_FIELD, CHANNELS_FIELD
+    from .take_processing import make_quaternions_continuous
+    from .take_recorder import EULER_CHANNELS, QUATERNION_CHANNELS
+except ImportError:
+    import pose_math
+    from pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MATRIX_FIELD, CHANNELS_FIELD
+    from take_processing import make_quaternions_continuous
+    from take_recorder import EULER_CHANNELS, QUATERNION_CHANNELS
+
+# Seconds kept by default, and the pose rate the buffer is sized for; faster
+# senders get a proportionally shorter window
+DEFAULT_SECONDS = 30.0
+MAX_RATE = 120.0
+
+_EULER = 0
+_QUATERNION = 1
+
+
+class ReplayBuffer:
+    """Fixed-size ring buffer of timed poses"""
+
+    def __init__(self, seconds=DEFAULT_SECONDS, rate=MAX_RATE, schema=None):
+        self._lock = threading.Lock()
+        self.schema = schema
+        self.rate = rate
+        self.resize(seconds)
+
+    def resize(self, seconds, schema=None):
+        """Reallocate for a new window length or ChannelSchema; drops what the buffer held"""
+        schema = self.schema if schema is None else schema
+        capacity = max(1, int(seconds * self.rate))
+        width = len(schema) if schema is not None else 0
+        with self._lock:
+            self.seconds = seconds
+            self.schema = schema
+            self.capacity = capacity
+            self._times = np.zeros(capacity)
+            self._values = np.zeros((capacity, 7))
+            self._modes = np.zeros(capacity, dtype=np.uint8)
+            self._channels = np.full((capacity, width), np.nan)
+            self._next = 0
+            self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def clear(self):
+        with self._lock:
+            self._next = 0
+            self._count = 0
+
+    def add(self, local_time, pose):
+        """Store a pose captured at local_time on the receiver clock, overwriting the oldest"""
+        mode = pose_mode(pose)
+        if mode == MODE_EULER:
+            row = (pose['X'], pose['Y'], pose['Z'], pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'], 0.0)
+            code = _EULER
+        elif mode == MODE_QUATERNION:
+            row = (pose['X'], pose['Y'], pose['Z'], pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+            code = _QUATERNION
+        else:
+            location, quaternion = pose_math.matrix_to_location_quaternion(pose[MATRIX_FIELD])
+            row = tuple(location) + tuple(quaternion)
+            code = _QUATERNION
+        channels = pose.get(CHANNELS_FIELD)
+
+        with self._lock:
+            index = self._next
+            self._times[index] = local_time
+            self._values[index] = row
+            self._modes[index] = code
+            if self._channels.shape[1]:
+                # Poses decoded before a schema change don't fit the columns
+                if channels is not None and len(channels) == self._channels.shape[1]:
+                    self._channels[index] = channels
+                else:
+                    self._channels[index] = np.nan
+            self._next = (index + 1) % self.capacity
+            if self._count < self.capacity:
+                self._count += 1
+
+    def snapshot(self, seconds=None, now=None):
+        """Return (times, values, modes, channels) copies of the newest seconds, oldest first"""
+        with self._lock:
+            count = self._count
+            start = (self._next - count) % self.capacity
+            order = (start + np.arange(count)) % self.capacity
+            times = self._times[order]
+            values = self._values[order]
+            modes = self._modes[order]
+            channels = self._channels[order]
+
+        if seconds is not None and count:
+            end = times.max() if now is None else now
+            keep = times >= end - seconds
+            times, values, modes, channels = times[keep], values[keep], modes[keep], channels[keep]
+        # Stamped poses from several senders may interleave slightly out of order
+        order = np.argsort(times, kind='stable')
+        return times[order], values[order], modes[order], channels[order]
+
+    def take(self, seconds, start_frame, fps, now=None):
+        """Newest seconds as (frames, values, channels) starting at start_frame, or None if empty
+
+        Windows with only Euler poses keep Euler channels; anything else is
+        stored as location plus quaternion. Schema channels any pose carried
+        follow as further columns.
+        """
+        times, values, modes, channels = self.snapshot(seconds, now)
+        if not len(times):
+            return None
+
+        frames = start_frame + (times - times[0]) * fps
+        if not modes.any():
+            values, keys = values[:, :6], EULER_CHANNELS
+        else:
+            euler = modes == _EULER
+            if euler.any():
+                values[euler] = pose_math.matrices_to_quaternions(pose_math.eulers_to_matrices(values[euler, :6]))
+            values[:, 3:] = make_quaternions_continuous(values[:, 3:])
+            keys = QUATERNION_CHANNELS
+
+        sent = ~np.isnan(channels).all(axis=0)
+        if sent.any():
+            values = np.column_stack((values, channels[:, sent]))
+            keys = keys + [key for key, keep in zip(self.schema.keys, sent) if keep]
+        return frames, values, keys
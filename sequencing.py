@@ -0,0 +1,177 @@
+"""
+Per-stream ordering of pose samples
+
+Pose messages may carry a sequence number, a send timestamp and a stream name:
+
+    {"SEQ": 1042, "TS": 1718040000.123, "STREAM": "phone-1", ...pose fields}
+
+SEQ increases by one per sample and TS is the sender's clock in seconds.
+STREAM names the sender, so samples that arrive over several relays or after a
+reconnect are ordered together. Without STREAM each connection is its own
+stream. All three fields are optional and messages without them pass through
+untouched.
+
+The filter runs on parsed messages before they are validated, so stale
+samples cost no decode or apply work. It drops samples that are not newer than
+the last one delivered for their stream. With a reorder window it holds up to
+window samples while a sequence gap is open, so a late sample can still be
+delivered in order. Timestamp-only streams are stale-dropped but never
+reordered, since their gaps cannot be detected. A sample behind the last one
+delivered is stale however far behind it is; only a new session (see
+session.py) or a jump far ahead starts a stream's numbering over.
+"""
+
+import threading
+
+try:
+    from . import metrics
+except ImportError:
+    import metrics
+
+SEQUENCE_FIELD = 'SEQ'
+TIMESTAMP_FIELD = 'TS'
+STREAM_FIELD = 'STREAM'
+
+# A jump ahead of more than this many sequence numbers starts the stream over
+# rather than opening a gap to wait on. Jumps back are stale however far they
+# go, since a replay after a reconnect can reach far back; a sender that
+# restarts its numbering starts a new session instead
+RESET_GAP = 1000
+
+# Streams tracked at once; STREAM comes from the sender, so without a limit a
+# misbehaving one could grow the state without bound
+MAX_STREAMS = 1024
+
+
+class _StreamState:
+    __slots__ = ('last_sequence', 'last_timestamp', 'held')
+
+    def __init__(self):
+        self.last_sequence = None
+        self.last_timestamp = None
+        # Samples waiting for a gap to close, keyed by sequence number
+        self.held = {}
+
+
+class SequenceFilter:
+    """Drops stale samples and restores order within a small window, per stream"""
+
+    def __init__(self, window=0, reset_gap=RESET_GAP, max_streams=MAX_STREAMS):
+        self.window = window
+        self.reset_gap = reset_gap
+        self.max_streams = max_streams
+        self.streams = {}
+        self._lock = threading.Lock()
+
+        self.stale = 0
+        self.gaps = 0
+        self.reordered = 0
+        self.resets = 0
+
+    def filter(self, items, stream=None):
+        """Return the parsed messages of items to deliver, in order
+
+        stream identifies the connection for messages without a STREAM field.
+        Raises ValueError for a non-integer SEQ or non-numeric TS.
+        """
+        released = []
+        with self._lock:
+            for item in items:
+                if not isinstance(item, dict):
+                    # Left for decode_pose to reject
+                    released.append(item)
+                    continue
+
+                sequence = item.get(SEQUENCE_FIELD)
+                timestamp = item.get(TIMESTAMP_FIELD)
+                if sequence is None and timestamp is None:
+                    released.append(item)
+                    continue
+
+                key = item.get(STREAM_FIELD, stream)
+                state = self.streams.get(key)
+                if state is None:
+                    if len(self.streams) >= self.max_streams:
+                        # Forget the oldest stream; it starts over if it returns
+                        del self.streams[next(iter(self.streams))]
+                    state = self.streams[key] = _StreamState()
+
+                if sequence is not None:
+                    if not isinstance(sequence, int) or isinstance(sequence, bool):
+                        raise ValueError(f"{SEQUENCE_FIELD} must be an integer")
+                    self._push_sequenced(state, sequence, item, released)
+                else:
+                    if not isinstance(timestamp, (int, float)) or isinstance(timestamp, bool):
+                        raise ValueError(f"{TIMESTAMP_FIELD} must be a number")
+                    self._push_timestamped(state, timestamp, item, released)
+        return released
+
+    def last_sequence(self, stream):
+        """Newest SEQ delivered in order for a stream, or None"""
+        state = self.streams.get(stream)
+        return state.last_sequence if state is not None else None
+
+    def remove(self, stream):
+        """Forget a stream, e.g. once its connection closes"""
+        with self._lock:
+            self.streams.pop(stream, None)
+
+    def _push_timestamped(self, state, timestamp, item, released):
+        if state.last_timestamp is not None and timestamp <= state.last_timestamp:
+            self._count_stale()
+            return
+        state.last_timestamp = timestamp
+        released.append(item)
+
+    def _push_sequenced(self, state, sequence, item, released):
+        last = state.last_sequence
+        if last is None or sequence - last > self.reset_gap:
+            # First sample of the stream, or too far ahead to wait for the gap
+            if last is not None:
+                self.resets += 1
+            state.held.clear()
+            state.last_sequence = sequence
+            released.append(item)
+            return
+
+        if sequence <= last or sequence in state.held:
+            self._count_stale()
+            return
+
+        if sequence == last + 1:
+            if state.held:
+                # Late sample that closes a gap
+                self.reordered += 1
+                metrics.poses_reordered.inc()
+            state.last_sequence = sequence
+            released.append(item)
+            self._release_held(state, released)
+            return
+
+        if not self.window:
+            self._count_gap(sequence - last - 1)
+            state.last_sequence = sequence
+            released.append(item)
+            return
+
+        # Hold the sample until the gap closes or the window overflows
+        state.held[sequence] = item
+        if len(state.held) > self.window:
+            first = min(state.held)
+            self._count_gap(first - last - 1)
+            state.last_sequence = first - 1
+            self._release_held(state, released)
+
+    def _release_held(self, state, released):
+        held = state.held
+        while state.last_sequence + 1 in held:
+            state.last_sequence += 1
+            released.append(held.pop(state.last_sequence))
+
+    def _count_stale(self):
+        self.stale += 1
+        metrics.poses_stale.inc()
+
+    def _count_gap(self, missing):
+        self.gaps += missing
+        metrics.sequence_gaps.inc(missing)
@@ -0,0 +1,233 @@
+"""
+Session resume for senders that lose their connection
+
+A sender picks a session id once and keeps numbering its poses with SEQ across
+reconnects. On every (re)connect it introduces itself on the pose connection:
+
+    sender -> receiver   {"type": "hello", "session": "a1b2c3d4e5f6"}
+    receiver -> sender   {"type": "welcome", "session": "a1b2c3d4e5f6", "ack": 1841,
+                          "resumed": true, "recording": true}
+
+and while connected the receiver acknowledges the newest SEQ it has delivered:
+
+    receiver -> sender   {"type": "ack", "ack": 1903, "recording": true}
+
+The sender keeps what it sent in an in-flight buffer until it is acknowledged.
+After a reconnect it replays the unacknowledged messages if the receiver is
+recording, since every sample of a take counts, and otherwise drops them as
+stale. The session id is also the connection's sequencing stream, so the
+receiver's stale-drop state carries over to the new connection and replayed
+duplicates are dropped. A new session starts its numbering afresh, while a sender
+that restarts under an id it used before resumes that session, so it carries on
+numbering after the welcome's ack.
+"""
+
+import collections
+import random
+import threading
+import time
+import uuid
+
+HELLO_TYPE = 'hello'
+WELCOME_TYPE = 'welcome'
+ACK_TYPE = 'ack'
+
+# Longest session id the receiver accepts
+MAX_SESSION_LENGTH = 64
+
+# Seconds between acknowledgements while poses keep arriving
+ACK_INTERVAL = 0.2
+
+# Seconds a disconnected session can still be resumed
+SESSION_TIMEOUT = 300.0
+
+# Sent messages kept for replay; about a minute of poses at 60 Hz
+IN_FLIGHT_CAPACITY = 4096
+
+# Reconnect delays: initial * factor ** attempt, capped, with ± jitter
+BACKOFF_INITIAL = 0.25
+BACKOFF_FACTOR = 2.0
+BACKOFF_MAX = 10.0
+BACKOFF_JITTER = 0.2
+
+
+def new_session_id():
+    """Random id for a new sender session"""
+    return uuid.uuid4().hex[:12]
+
+
+def make_hello(session):
+    return {'type': HELLO_TYPE, 'session': session}
+
+
+def is_hello(data):
+    """Check whether a decoded message is a sender's hello"""
+    return isinstance(data, dict) and data.get('type') == HELLO_TYPE
+
+
+def is_welcome(data):
+    """Check whether a decoded message is the receiver's answer to a hello"""
+    return isinstance(data, dict) and data.get('type') == WELCOME_TYPE
+
+
+def is_ack(data):
+    """Check whether a decoded message acknowledges delivered poses"""
+    return isinstance(data, dict) and data.get('type') == ACK_TYPE
+
+
+class Backoff:
+    """Exponential reconnect delays with jitter, so many senders don't retry in step"""
+
+    def __init__(self, initial=BACKOFF_INITIAL, factor=BACKOFF_FACTOR, maximum=BACKOFF_MAX,
+                 jitter=BACKOFF_JITTER, rng=None):
+        self.initial = initial
+        self.factor = factor
+        self.maximum = maximum
+        self.jitter = jitter
+        self.attempts = 0
+        self._random = rng or random.Random()
+
+    def next_delay(self):
+        """Seconds to wait before the next attempt"""
+        delay = min(self.maximum, self.initial * self.factor ** self.attempts)
+        self.attempts += 1
+        return delay * (1.0 + self._random.uniform(-self.jitter, self.jitter))
+
+    def reset(self):
+        """Start from the initial delay again, after a successful connect"""
+        self.attempts = 0
+
+
+class InFlightBuffer:
+    """Sent messages not yet acknowledged, oldest first
+
+    Each entry is (last SEQ in the message, message). When full, the oldest
+    entries are dropped, so memory stays bounded however long the receiver is gone.
+    """
+
+    def __init__(self, capacity=IN_FLIGHT_CAPACITY):
+        self._entries = collections.deque(maxlen=capacity)
+        self.dropped = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, sequence, message):
+        if len(self._entries) == self._entries.maxlen:
+            self.dropped += 1
+        self._entries.append((sequence, message))
+
+    def ack(self, sequence):
+        """Forget every message up to and including SEQ sequence"""
+        entries = self._entries
+        while entries and entries[0][0] <= sequence:
+            entries.popleft()
+
+    def pending(self):
+        """Messages still waiting for an acknowledgement"""
+        return [message for _, message in self._entries]
+
+    def clear(self):
+        self._entries.clear()
+
+
+class SessionLink:
+    """Receiver side of one connection: answers the hello and sends acknowledgements"""
+
+    def __init__(self):
+        self.session = None
+        self.resumed = False
+        self._welcome_due = False
+        self._acked = None
+        self._recording = None
+        self._last_ack = 0.0
+
+    def on_hello(self, data, table=None):
+        """Adopt the session named in a hello; raises ValueError for a bad id
+
+        table is the receiver's SessionTable, which tells whether the session
+        is being resumed.
+        """
+        session = data.get('session')
+        if not isinstance(session, str) or not session or len(session) > MAX_SESSION_LENGTH:
+            raise ValueError(f"Session id must be a string of 1 to {MAX_SESSION_LENGTH} characters")
+        if table is not None:
+            if self.session is not None:
+                table.detach(self.session)
+            self.resumed = table.attach(session)
+        self.session = session
+        self._welcome_due = True
+
+    def close(self, table=None):
+        """The connection closed; the session stays resumable until the table expires it"""
+        if table is not None and self.session is not None:
+            table.detach(self.session)
+        self.session = None
+
+    def poll(self, acked, recording, now=None):
+        """Return the welcome or acknowledgement to send, if one is due
+
+        acked is the newest SEQ delivered for the session, or None.
+        """
+        if self.session is None:
+            return None
+        now = time.monotonic() if now is None else now
+
+        if self._welcome_due:
+            self._welcome_due = False
+            message = {'type': WELCOME_TYPE, 'session': self.session, 'ack': acked,
+                       'resumed': self.resumed, 'recording': recording}
+        elif acked is not None and (recording != self._recording or
+                                    (acked != self._acked and now - self._last_ack >= ACK_INTERVAL)):
+            message = {'type': ACK_TYPE, 'ack': acked, 'recording': recording}
+        else:
+            return None
+
+        self._acked, self._recording, self._last_ack = acked, recording, now
+        return message
+
+
+class SessionTable:
+    """Receiver side record of sessions, so abandoned ones can be forgotten
+
+    on_expire(session) is called for sessions disconnected for longer than
+    timeout, e.g. to drop their sequencing state.
+    """
+
+    def __init__(self, timeout=SESSION_TIMEOUT, on_expire=None):
+        self.timeout = timeout
+        self.on_expire = on_expire
+        self._connected = collections.Counter()
+        self._disconnected = {}
+        self._lock = threading.Lock()
+
+    def attach(self, session, now=None):
+        """Record a connection for session; returns True if it resumes a known session"""
+        self.expire(now)
+        with self._lock:
+            resumed = session in self._disconnected or session in self._connected
+            self._disconnected.pop(session, None)
+            self._connected[session] += 1
+        return resumed
+
+    def detach(self, session, now=None):
+        """Record that a connection of session closed"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self._connected[session] -= 1
+            if self._connected[session] <= 0:
+                del self._connected[session]
+                self._disconnected[session] = now
+
+    def expire(self, now=None):
+        """Forget sessions that have been disconnected for longer than the timeout"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            expired = [session for session, since in self._disconnected.items()
+                       if now - since > self.timeout]
+            for session in expired:
+                del self._disconnected[session]
+        if self.on_expire:
+            for session in expired:
+                self.on_expire(session)
+        return expired
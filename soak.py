@@ -0,0 +1,516 @@
+#!/usr/bin/env python3
+"""
+Fuzz and soak harness for the Camera Motion Receiver socket server
+
+Drives a long stream through the full server pipeline (framing, codec,
+sequencing, session resume and pose decoding) with malformed frames mixed in,
+and checks that the server holds up: it keeps serving, Python memory stays
+flat, no threads leak and throughput doesn't sag.
+
+Streams are synthetic or replayed from a capture file. A capture holds the raw
+bytes senders wrote to the server with their timing, so a session that once
+upset the server can be replayed exactly, including its reconnects.
+
+Usage:
+    python soak.py run --duration 3600                  # synthetic stream, in-process server
+    python soak.py run --capture take.cap --duration 600
+    python soak.py generate fuzz.cap --duration 60      # write a synthetic capture
+    python soak.py capture take.cap --listen 8766 --forward 127.0.0.1:8765
+    python soak.py replay fuzz.cap --port 8765          # against a running receiver, e.g. Blender
+"""
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import select
+import socket
+import statistics
+import struct
+import sys
+import threading
+import time
+import tracemalloc
+
+from flow_control import MAX_FRAME_SIZE
+from pose_codec import CODEC_MAGIC, PoseEncoder
+from pose_math import euler_to_quaternion
+from session import make_hello, new_session_id
+
+# Capture file: magic, then records of (seconds from start, kind, payload length)
+# followed by the payload. KIND_CONNECT starts a new connection.
+CAPTURE_MAGIC = b'CAMCAP1\n'
+_RECORD = struct.Struct('!dBI')
+KIND_DATA = 0
+KIND_CONNECT = 1
+
+DEFAULT_PORT = 8775
+
+
+def frame(payload):
+    """Length-prefix a payload the way senders do"""
+    return struct.pack('!I', len(payload)) + payload
+
+
+def _json(data):
+    return json.dumps(data).encode('utf-8')
+
+
+def _euler_pose(rng):
+    return {'X': rng.uniform(-5, 5), 'Y': rng.uniform(-5, 5), 'Z': rng.uniform(0, 3),
+            'ROT_X': rng.uniform(-3, 3), 'ROT_Y': rng.uniform(-3, 3), 'ROT_Z': rng.uniform(-3, 3)}
+
+
+# Malformed frames: each returns the payload of one well-framed message
+FRAME_FAULTS = {
+    'garbage_json': lambda rng: b'{"X": 1.0, "Y": ' + rng.randbytes(rng.randint(0, 16)),
+    'wrong_types': lambda rng: _json({'X': 'left', 'Y': [1], 'Z': {}, 'ROT_X': None, 'ROT_Y': True, 'ROT_Z': 0}),
+    'missing_fields': lambda rng: _json({'X': 1.0, 'ROT_Z': 0.5}),
+    'huge_float': lambda rng: b'{"X": 1e400, "Y": 0, "Z": 0, "ROT_X": 0, "ROT_Y": -1e400, "ROT_Z": 0}',
+    'nan': lambda rng: b'{"X": NaN, "Y": 0, "Z": Infinity, "QUAT_W": NaN, "QUAT_X": 0, "QUAT_Y": 0, "QUAT_Z": 0}',
+    'huge_int': lambda rng: b'{"X": 1' + b'0' * 400 + b', "Y": 0, "Z": 0, "ROT_X": 0, "ROT_Y": 0, "ROT_Z": 0}',
+    'bad_matrix': lambda rng: _json({'MATRIX': rng.choice([[0.0] * 16, [1e308] * 16, [1.0] * 15, 'eye'])}),
+    'zero_quaternion': lambda rng: _json({'X': 0, 'Y': 0, 'Z': 0, 'QUAT_W': 0, 'QUAT_X': 0, 'QUAT_Y': 0, 'QUAT_Z': 0}),
+    'bad_sequence': lambda rng: _json(dict(_euler_pose(rng), SEQ=rng.choice(['7', -1, 2 ** 80, 1.5, None, True]))),
+    'bad_timestamp': lambda rng: _json(dict(_euler_pose(rng), TS=rng.choice(['now', [], True]))),
+    'foreign_stream': lambda rng: _json(dict(_euler_pose(rng), SEQ=1, STREAM=rng.randbytes(8).hex())),
+    'unhashable_stream': lambda rng: _json(dict(_euler_pose(rng), SEQ=1, STREAM=[1, 2])),
+    'bad_utf8': lambda rng: b'\xff\xfe{"X": \xc3\x28}',
+    'codec_garbage': lambda rng: bytes([CODEC_MAGIC]) + rng.randbytes(rng.randint(0, 40)),
+    'empty': lambda rng: b'',
+    'deep_nesting': lambda rng: b'[' * 50000 + b']' * 50000,
+    'not_a_pose': lambda rng: rng.choice([b'42', b'"pose"', b'null', b'[[]]', b'{}', b'[1, {"X": 1}]']),
+    'bad_hello': lambda rng: _json({'type': 'hello', 'session': rng.choice([5, '', 'x' * 1000, None])}),
+    'bad_channel': lambda rng: _json(dict(_euler_pose(rng), LENS=rng.choice(['wide', None, [35], 1e400]))),
+}
+
+# Faults that leave the byte stream unframeable; the sender has to reconnect
+STREAM_FAULTS = {
+    'truncated_prefix': lambda rng: struct.pack('!I', 64)[:rng.randint(1, 3)],
+    'giant_length': lambda rng: struct.pack('!I', rng.randint(MAX_FRAME_SIZE + 1, 0xFFFFFFFF)),
+    'truncated_frame': lambda rng: frame(_json(_euler_pose(rng)))[:rng.randint(5, 40)],
+}
+
+
+class SyntheticStream:
+    """Endless sender traffic with faults, as (kind, payload) events
+
+    Senders keep their session and SEQ numbering across reconnects like
+    test_client.py does, and now and then start over with a new session.
+    """
+
+    def __init__(self, seed=1, fault_rate=0.02, reconnect_rate=0.001):
+        self.rng = random.Random(seed)
+        self.fault_rate = fault_rate
+        self.reconnect_rate = reconnect_rate
+        self.faults = dict.fromkeys(list(FRAME_FAULTS) + list(STREAM_FAULTS), 0)
+        self.session = new_session_id()
+        self.sequence = 0
+        self.encoder = None
+
+    def _connect(self):
+        if self.rng.random() < 0.1:
+            self.session = new_session_id()
+            self.sequence = 0
+        self.encoder = PoseEncoder()
+        yield KIND_CONNECT, b''
+        yield KIND_DATA, frame(_json(make_hello(self.session)))
+
+    def _pose(self):
+        self.sequence += 1
+        t = self.sequence / 60.0
+        pose = {'X': math.sin(t), 'Y': math.cos(t * 0.7), 'Z': 1.5 + 0.2 * math.sin(t * 3.1),
+                'ROT_X': 1.2 + 0.1 * math.sin(t), 'ROT_Y': 0.05 * math.cos(t * 2.0), 'ROT_Z': t % (2 * math.pi)}
+        if self.sequence % 3 == 0:
+            quat = euler_to_quaternion(pose.pop('ROT_X'), pose.pop('ROT_Y'), pose.pop('ROT_Z'))
+            pose.update(zip(('QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z'), quat))
+        return pose
+
+    def events(self):
+        rng = self.rng
+        yield from self._connect()
+        while True:
+            roll = rng.random()
+            if roll < self.fault_rate:
+                name = rng.choice(list(self.faults))
+                self.faults[name] += 1
+                if name in STREAM_FAULTS:
+                    yield KIND_DATA, STREAM_FAULTS[name](rng)
+                    yield from self._connect()
+                else:
+                    yield KIND_DATA, frame(FRAME_FAULTS[name](rng))
+            elif roll < self.fault_rate + self.reconnect_rate:
+                yield from self._connect()
+            elif roll < 0.8:
+                # Codec frames carry no SEQ; they are sequenced by the codec itself
+                yield KIND_DATA, frame(self.encoder.encode(self._pose()))
+            elif roll < 0.9:
+                batch = []
+                for _ in range(rng.randint(2, 8)):
+                    pose = self._pose()
+                    batch.append(dict(pose, SEQ=self.sequence, TS=time.time()))
+                yield KIND_DATA, frame(_json(batch))
+            else:
+                pose = self._pose()
+                yield KIND_DATA, frame(_json(dict(pose, SEQ=self.sequence, TS=time.time())))
+
+
+def timed_events(events, rate):
+    """Give events times at rate messages per second; connects take no time"""
+    count = 0
+    for kind, payload in events:
+        yield count / rate, kind, payload
+        if kind == KIND_DATA:
+            count += 1
+
+
+def write_capture(path, events):
+    """Write (time, kind, payload) events to a capture file; returns the record count"""
+    count = 0
+    with open(path, 'wb') as file:
+        file.write(CAPTURE_MAGIC)
+        for t, kind, payload in events:
+            file.write(_RECORD.pack(t, kind, len(payload)))
+            file.write(payload)
+            count += 1
+    return count
+
+
+def read_capture(path):
+    """Yield the (time, kind, payload) records of a capture file"""
+    with open(path, 'rb') as file:
+        if file.read(len(CAPTURE_MAGIC)) != CAPTURE_MAGIC:
+            raise ValueError(f"{path} is not a capture file")
+        while True:
+            header = file.read(_RECORD.size)
+            if len(header) < _RECORD.size:
+                return
+            t, kind, length = _RECORD.unpack(header)
+            yield t, kind, file.read(length)
+
+
+class Driver:
+    """Plays events into a server, reconnecting where the events say
+
+    Replies (resync requests, acknowledgements) are read and discarded so the
+    server never blocks on a full socket buffer. If the server drops the
+    connection, data is skipped until the next connect event.
+    """
+
+    def __init__(self, host, port):
+        self.address = (host, port)
+        self.conn = None
+        self.frames = 0
+        self.bytes = 0
+        self.connects = 0
+        self.dropped = 0
+
+    def connect(self):
+        self.close()
+        self.conn = socket.create_connection(self.address)
+        self.conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.connects += 1
+
+    def send(self, payload):
+        if self.conn is None:
+            return
+        try:
+            self.conn.sendall(payload)
+            self.frames += 1
+            self.bytes += len(payload)
+            self.drain()
+        except OSError:
+            self.dropped += 1
+            self.close()
+
+    def drain(self):
+        while select.select([self.conn], [], [], 0)[0]:
+            if not self.conn.recv(65536):
+                raise ConnectionResetError("Server closed the connection")
+
+    def play(self, kind, payload):
+        if kind == KIND_CONNECT:
+            self.connect()
+        else:
+            self.send(payload)
+
+    def close(self):
+        if self.conn is not None:
+            self.conn.close()
+            self.conn = None
+
+
+def paced(events, speed):
+    """Sleep until each event's time, scaled by speed"""
+    start = time.perf_counter()
+    for t, kind, payload in events:
+        delay = start + t / speed - time.perf_counter()
+        if delay > 0:
+            time.sleep(delay)
+        yield t, kind, payload
+
+
+def looped_capture(path):
+    """Replay a capture over and over, shifting times so they keep increasing"""
+    offset = 0.0
+    while True:
+        t = 0.0
+        for t, kind, payload in read_capture(path):
+            yield offset + t, kind, payload
+        if t == 0.0 and offset == 0.0:
+            raise ValueError(f"{path} holds no timed records")
+        offset += t
+
+
+def run(args):
+    """Soak an in-process simple server; returns the exit status"""
+    import metrics
+    import standalone_websocket_server as server
+
+    console = sys.stdout
+    tracemalloc.start()
+    threads_before = threading.active_count()
+
+    # The server prints every pose; keep the report readable
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        server.start_simple_server(args.port)
+        time.sleep(0.2)
+        threads_running = threading.active_count()
+
+        if args.capture:
+            events = looped_capture(args.capture)
+            stream = None
+        else:
+            stream = SyntheticStream(args.seed, args.fault_rate, args.reconnect_rate)
+            events = timed_events(stream.events(), args.rate or 1.0)
+        if args.rate or (args.capture and not args.fast):
+            events = paced(events, 1.0)
+
+        def handled():
+            return (metrics.poses_received.value + metrics.poses_dropped.value
+                    + metrics.poses_stale.value + metrics.parse_errors.value)
+
+        print(f"🧪 Soaking the simple server on port {args.port} for {args.duration:.0f} s", file=console)
+        print(f"{'elapsed':>8} {'frames/s':>9} {'handled/s':>10} {'poses/s':>8} {'memory KiB':>11} "
+              f"{'threads':>8} {'errors':>8}", file=console)
+
+        driver = Driver('127.0.0.1', args.port)
+        start = last = time.perf_counter()
+        last_frames, last_handled, last_poses = 0, handled(), metrics.poses_received.value
+        samples = []
+        failures = []
+        for _, kind, payload in events:
+            driver.play(kind, payload)
+            now = time.perf_counter()
+            if now - last < args.interval:
+                continue
+
+            memory = tracemalloc.get_traced_memory()[0]
+            elapsed = now - start
+            rates = ((driver.frames - last_frames) / (now - last), (handled() - last_handled) / (now - last),
+                     (metrics.poses_received.value - last_poses) / (now - last))
+            samples.append((elapsed, memory) + rates)
+            print(f"{elapsed:>8.0f} {rates[0]:>9.0f} {rates[1]:>10.0f} {rates[2]:>8.0f} {memory / 1024:>11.0f} "
+                  f"{threading.active_count():>8} {metrics.parse_errors.value:>8}", file=console)
+            last, last_frames, last_handled, last_poses = now, driver.frames, handled(), metrics.poses_received.value
+
+            if not server.server_thread.is_alive():
+                failures.append(f"Server thread died after {elapsed:.0f} s")
+                break
+            if threading.active_count() > threads_running:
+                failures.append(f"{threading.active_count() - threads_running} threads leaked")
+                break
+            if elapsed >= args.duration:
+                break
+        driver.close()
+    finally:
+        server.server_running = False
+        # Wake the accept loop so the server thread can exit
+        try:
+            socket.create_connection(('127.0.0.1', args.port), timeout=1.0).close()
+        except OSError:
+            pass
+        if server.server_thread:
+            server.server_thread.join(timeout=5.0)
+        sys.stdout.close()
+        sys.stdout = console
+
+    # Memory and throughput are judged after a warm-up, once caches and
+    # session tables have filled
+    steady = [sample for sample in samples if sample[0] >= args.warmup]
+    if len(steady) >= 2:
+        baseline = steady[0][1]
+        growth = max(sample[1] for sample in steady) - baseline
+        if growth > args.memory_limit * 1024:
+            failures.append(f"Memory grew by {growth / 1024:.0f} KiB after the warm-up")
+        if not args.rate and not (args.capture and not args.fast):
+            typical = statistics.median(sample[3] for sample in steady)
+            slowest = min(sample[3] for sample in steady)
+            if slowest < typical * args.min_throughput:
+                failures.append(f"Throughput fell to {slowest:.0f}/s against a median of {typical:.0f}/s")
+    else:
+        failures.append("Too few samples after the warm-up; run longer or lower --warmup")
+    if server.server_thread.is_alive():
+        failures.append("Server thread did not stop")
+    if threading.active_count() > threads_before:
+        failures.append(f"{threading.active_count() - threads_before} threads left running after stop")
+
+    print(f"\n📊 {driver.frames} frames, {driver.bytes / 1e6:.1f} MB, {driver.connects} connections, "
+          f"{driver.dropped} sends to dropped connections")
+    print(f"   poses {metrics.poses_received.value}, stale {metrics.poses_stale.value}, "
+          f"dropped {metrics.poses_dropped.value}, parse errors {metrics.parse_errors.value}")
+    if stream is not None:
+        print("   faults " + ", ".join(f"{name} {count}" for name, count in stream.faults.items() if count))
+    for failure in failures:
+        print(f"❌ {failure}")
+    if failures:
+        return 1
+    print("✅ Server held up")
+    return 0
+
+
+def generate(args):
+    stream = SyntheticStream(args.seed, args.fault_rate, args.reconnect_rate)
+    events = timed_events(stream.events(), args.rate or 60.0)
+    count = write_capture(args.file, itertools.takewhile(lambda event: event[0] <= args.duration, events))
+    print(f"💾 Wrote {count} records to {args.file}")
+    return 0
+
+
+def capture(args):
+    """Record what senders write to a listening port, optionally passing it on"""
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind(('0.0.0.0', args.listen))
+    listener.listen(1)
+    print(f"🎙️  Recording senders on port {args.listen} to {args.file}")
+    if args.forward:
+        print(f"📡 Forwarding to {args.forward[0]}:{args.forward[1]}")
+    print("🛑 Press Ctrl+C to stop")
+
+    def pump_replies(upstream, conn):
+        try:
+            while True:
+                data = upstream.recv(65536)
+                if not data:
+                    break
+                conn.sendall(data)
+        except OSError:
+            pass
+
+    records = 0
+    start = time.perf_counter()
+    with open(args.file, 'wb') as file:
+        file.write(CAPTURE_MAGIC)
+
+        def record(kind, payload=b''):
+            file.write(_RECORD.pack(time.perf_counter() - start, kind, len(payload)))
+            file.write(payload)
+
+        try:
+            while True:
+                conn, addr = listener.accept()
+                print(f"📱 Sender connected from {addr}")
+                record(KIND_CONNECT)
+                records += 1
+                upstream = socket.create_connection(args.forward) if args.forward else None
+                if upstream:
+                    threading.Thread(target=pump_replies, args=(upstream, conn), daemon=True).start()
+                with conn:
+                    while True:
+                        data = conn.recv(65536)
+                        if not data:
+                            break
+                        record(KIND_DATA, data)
+                        records += 1
+                        if upstream:
+                            upstream.sendall(data)
+                if upstream:
+                    upstream.shutdown(socket.SHUT_RDWR)
+                    upstream.close()
+        except KeyboardInterrupt:
+            pass
+    listener.close()
+    print(f"\n💾 Wrote {records} records to {args.file}")
+    return 0
+
+
+def replay(args):
+    """Play a capture into a running receiver"""
+    events = looped_capture(args.file) if args.loop else read_capture(args.file)
+    if not args.fast:
+        events = paced(events, args.speed)
+    driver = Driver(args.host, args.port)
+    print(f"▶️  Replaying {args.file} to {args.host}:{args.port}")
+    try:
+        for _, kind, payload in events:
+            driver.play(kind, payload)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        driver.close()
+    print(f"📊 {driver.frames} writes, {driver.bytes / 1e6:.1f} MB, {driver.connects} connections, "
+          f"{driver.dropped} sends to dropped connections")
+    return 0
+
+
+def parse_address(value):
+    """Parse a host:port argument"""
+    host, _, port = value.rpartition(':')
+    return (host or '127.0.0.1', int(port))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fuzz and soak harness for the Camera Motion Receiver")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def stream_options(command):
+        command.add_argument('--seed', type=int, default=1)
+        command.add_argument('--fault-rate', type=float, default=0.02, help="share of messages that are malformed")
+        command.add_argument('--reconnect-rate', type=float, default=0.001, help="share of messages followed by a reconnect")
+
+    command = commands.add_parser('run', help="soak an in-process server")
+    stream_options(command)
+    command.add_argument('--capture', help="replay this capture instead of a synthetic stream")
+    command.add_argument('--duration', type=float, default=60.0, help="seconds to run")
+    command.add_argument('--rate', type=float, default=0.0, help="synthetic messages per second (0 = as fast as possible)")
+    command.add_argument('--fast', action='store_true', help="replay the capture as fast as possible")
+    command.add_argument('--port', type=int, default=DEFAULT_PORT)
+    command.add_argument('--interval', type=float, default=5.0, help="seconds between samples")
+    command.add_argument('--warmup', type=float, default=10.0, help="seconds before memory and throughput are judged")
+    command.add_argument('--memory-limit', type=float, default=4096.0, help="KiB memory may grow after the warm-up")
+    command.add_argument('--min-throughput', type=float, default=0.5,
+                         help="slowest interval as a share of the median before failing")
+    command.set_defaults(handler=run)
+
+    command = commands.add_parser('generate', help="write a synthetic capture file")
+    command.add_argument('file')
+    stream_options(command)
+    command.add_argument('--duration', type=float, default=60.0, help="seconds of traffic")
+    command.add_argument('--rate', type=float, default=60.0, help="messages per second")
+    command.set_defaults(handler=generate)
+
+    command = commands.add_parser('capture', help="record senders into a capture file")
+    command.add_argument('file')
+    command.add_argument('--listen', type=int, default=8766, help="port senders connect to")
+    command.add_argument('--forward', type=parse_address, metavar='HOST:PORT', help="receiver to pass the stream on to")
+    command.set_defaults(handler=capture)
+
+    command = commands.add_parser('replay', help="play a capture file into a running receiver")
+    command.add_argument('file')
+    command.add_argument('--host', default='127.0.0.1')
+    command.add_argument('--port', type=int, default=8765)
+    command.add_argument('--speed', type=float, default=1.0, help="playback speed")
+    command.add_argument('--fast', action='store_true', help="ignore the recorded timing")
+    command.add_argument('--loop', action='store_true', help="start over at the end of the capture")
+    command.set_defaults(handler=replay)
+
+    args = parser.parse_args()
+    return args.handler(args)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,50 +1,118 @@
+import argparse
 import json
 import threading
 import time
 import socket
-import struct
+
+import metrics
+from channel_schema import ChannelSchema
+from fanout_server import FanoutServer, PoseForwarder
+from pose_codec import PoseDecoder, is_codec_frame, resync_message
+from flow_control import encode_frame, recv_frame
+from imu_fusion import ImuFusion, decode_items
+from pose_hub import PoseHub
+from pose_protocol import pose_mode, pose_location_euler, CHANNELS_FIELD
+from sequencing import SequenceFilter
+from session import SessionLink, SessionTable, is_hello
 
 # WebSocket server variables
 server_thread = None
 server_running = False
 websocket_server = None
+metrics_server = None
+fanout_server = None
+
+# Re-broadcasts every decoded pose to subscribers when --publish-port or --publish is given
+pose_hub = None
+
+# Print every received pose; --quiet turns this off for high-rate hubs
+verbose = True
+
+# Drops stale sequenced poses and reorders within a few samples
+sequence_filter = SequenceFilter(window=4)
+
+# Lens, focus and custom channels decoded besides the pose; --channels adds custom ones
+channel_schema = ChannelSchema()
+
+# Orientation of each device sending raw IMU samples
+fusion = ImuFusion()
+
+# Sender sessions that can resume after a reconnect
+sessions = SessionTable(on_expire=sequence_filter.remove)
 
-def on_message(websocket, message):
-    """Handle incoming WebSocket messages with camera motion data"""
+def on_message(websocket, message, decoder=None, stream=None, link=None):
+    """Handle incoming WebSocket messages with camera motion data
+    
+    message is a JSON text message or, when the connection has a decoder, may be a
+    binary codec frame. stream identifies the connection for sequenced messages
+    without a STREAM field, and link is its SessionLink for hellos. Returns the
+    number of poses received, which is more than one for batch messages.
+    """
     try:
-        # Parse JSON data
-        data = json.loads(message)
-        
-        # Validate required fields
-        required_fields = ['X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z']
-        for field in required_fields:
-            if field not in data:
-                print(f"Missing required field: {field}")
-                return
+        if decoder is not None and is_codec_frame(message):
+            # Compact binary frame; None while waiting for a keyframe
+            pose = decoder.decode(message)
+            poses = [pose] if pose is not None else []
+            if pose is None:
+                metrics.poses_dropped.inc()
+        else:
+            # Parse JSON data
+            data = json.loads(message)
+            
+            # A sender (re)connecting names its session, which becomes the stream
+            if is_hello(data):
+                if link is not None:
+                    link.on_hello(data, sessions)
+                    if not link.resumed:
+                        # A new session numbers its poses afresh
+                        sequence_filter.remove(link.session)
+                    print(f"🔁 Session {link.session} {'resumed' if link.resumed else 'started'}")
+                return 0
+            if link is not None and link.session is not None:
+                stream = link.session
+            
+            # Drop stale samples, then validate and normalise into Euler,
+            # quaternion or matrix poses, fusing raw IMU batches
+            items = sequence_filter.filter(data if isinstance(data, list) else [data], stream)
+            poses, _ = decode_items(items, stream, fusion, channel_schema)
+        metrics.poses_received.inc(len(poses))
         
-        # Convert string values to float if needed
-        camera_data = {
-            'X': float(data['X']),
-            'Y': float(data['Y']),
-            'Z': float(data['Z']),
-            'ROT_X': float(data['ROT_X']),
-            'ROT_Y': float(data['ROT_Y']),
-            'ROT_Z': float(data['ROT_Z'])
-        }
+        # Encoded once however many subscribers there are
+        if pose_hub is not None:
+            pose_hub.publish_poses(poses)
         
-        # For standalone server, just print the received data
-        print(f"📱 Received camera motion: {camera_data}")
-        print(f"   Location: ({camera_data['X']:.2f}, {camera_data['Y']:.2f}, {camera_data['Z']:.2f})")
-        print(f"   Rotation: ({camera_data['ROT_X']:.2f}, {camera_data['ROT_Y']:.2f}, {camera_data['ROT_Z']:.2f})")
+        for camera_data in poses if verbose else ():
+            location, rotation = pose_location_euler(camera_data)
+            
+            # For standalone server, just print the received data
+            print(f"📱 Received camera motion ({pose_mode(camera_data).lower()}): {camera_data}")
+            print(f"   Location: ({location[0]:.2f}, {location[1]:.2f}, {location[2]:.2f})")
+            print(f"   Rotation: ({rotation[0]:.2f}, {rotation[1]:.2f}, {rotation[2]:.2f})")
+            channels = camera_data.get(CHANNELS_FIELD)
+            if channels is not None:
+                sent = ', '.join(f"{field}={value:g}" for field, value in zip(channel_schema.fields, channels)
+                                 if value is not None)
+                print(f"   Channels: {sent}")
+        return len(poses)
         
     except json.JSONDecodeError as e:
+        metrics.parse_errors.inc()
         print(f"❌ Invalid JSON data: {e}")
     except ValueError as e:
-        print(f"❌ Invalid numeric data: {e}")
+        metrics.parse_errors.inc()
+        print(f"❌ Invalid camera data: {e}")
     except Exception as e:
+        metrics.parse_errors.inc()
         print(f"❌ Error processing message: {e}")
+    return 0
+
+def poll_session(link):
+    """Welcome or acknowledgement due on a connection, if any; nothing is recorded here"""
+    if link.session is None:
+        return None
+    return link.poll(sequence_filter.last_sequence(link.session), False)
 
-def start_websocket_server():
+def start_websocket_server(port=8765):
     """Start the WebSocket server in a separate thread"""
     global server_thread, server_running, websocket_server
     
@@ -52,6 +120,8 @@ def start_websocket_server():
         print("WebSocket server is already running")
         return
     
+    start_metrics_endpoint()
+    
     try:
         # Try to import websocket library
         import websocket_server
@@ -60,22 +130,34 @@ def start_websocket_server():
         def server_handler(websocket, path):
             """Handle WebSocket connections"""
             print(f"📱 Client connected from {websocket.remote_address}")
+            decoder = PoseDecoder(channel_schema)
+            link = SessionLink()
+            client = metrics.registry.client(websocket.remote_address)
             try:
                 while True:
                     message = websocket.recv()
                     if message is None:
                         break
-                    on_message(websocket, message)
+                    client.add(on_message(websocket, message, decoder, websocket.remote_address, link))
+                    if decoder.take_resync_request():
+                        websocket.send(json.dumps(resync_message()))
+                    reply = poll_session(link)
+                    if reply:
+                        websocket.send(json.dumps(reply))
             except websocket_server.WebSocketConnectionClosedException:
                 print("📱 Client disconnected")
             except Exception as e:
                 print(f"❌ WebSocket error: {e}")
+            finally:
+                metrics.registry.remove_client(websocket.remote_address)
+                sequence_filter.remove(websocket.remote_address)
+                link.close(sessions)
         
         # Start server in a separate thread
         def run_server():
             global websocket_server
             try:
-                websocket_server = WebSocketServer("0.0.0.0", 8765)
+                websocket_server = WebSocketServer("0.0.0.0", port)
                 websocket_server.set_fn_new_client(server_handler)
                 websocket_server.run_forever()
             except Exception as e:
@@ -84,14 +166,14 @@ def start_websocket_server():
         server_thread = threading.Thread(target=run_server, daemon=True)
         server_thread.start()
         server_running = True
-        print("🔌 WebSocket server started on 0.0.0.0:8765")
+        print(f"🔌 WebSocket server started on 0.0.0.0:{port}")
         
     except ImportError:
         print("⚠️  WebSocket library not available. Using simple socket server.")
         # Fallback to a simple socket server
-        start_simple_server()
+        start_simple_server(port)
 
-def start_simple_server():
+def start_simple_server(port=8765):
     """Fallback to a simple socket server if WebSocket library is not available"""
     global server_thread, server_running
     
@@ -99,58 +181,140 @@ def start_simple_server():
         try:
             sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            sock.bind(('0.0.0.0', 8765))
+            sock.bind(('0.0.0.0', port))
             sock.listen(1)
-            print("🔌 Simple socket server started on 0.0.0.0:8765")
+            print(f"🔌 Simple socket server started on 0.0.0.0:{port}")
             print("📡 Accepting connections from any IP address")
             
             while server_running:
                 try:
                     conn, addr = sock.accept()
                     print(f"📱 Client connected from {addr}")
+                    decoder = PoseDecoder(channel_schema)
+                    link = SessionLink()
+                    client_id = f"{addr[0]}:{addr[1]}"
+                    client = metrics.registry.client(client_id)
                     
                     with conn:
                         while server_running:
                             try:
-                                # Receive data length (4 bytes)
-                                data_len = conn.recv(4)
-                                if not data_len:
+                                # Length-prefixed JSON data or binary codec frame
+                                data = recv_frame(conn)
+                                if data is None:
                                     break
+                            except ValueError as e:
+                                # Corrupt prefix: the rest of the stream can't be framed
+                                metrics.parse_errors.inc()
+                                print(f"❌ Dropping {client_id}: {e}")
+                                break
+                            except OSError as e:
+                                print(f"❌ Connection error: {e}")
+                                break
+                            
+                            try:
+                                client.add(on_message(None, data, decoder, client_id, link))
                                 
-                                length = struct.unpack('!I', data_len)[0]
-                                
-                                # Receive JSON data
-                                data = conn.recv(length)
-                                if not data:
-                                    break
+                                # Ask for a keyframe after lost codec frames
+                                if decoder.take_resync_request():
+                                    conn.sendall(encode_frame(resync_message()))
                                 
-                                message = data.decode('utf-8')
-                                on_message(None, message)
+                                # Welcome a resuming sender and acknowledge what was delivered
+                                reply = poll_session(link)
+                                if reply:
+                                    conn.sendall(encode_frame(reply))
                                 
-                            except Exception as e:
-                                print(f"❌ Error handling client: {e}")
+                            except OSError as e:
+                                print(f"❌ Connection error: {e}")
                                 break
-                                
+                            except Exception as e:
+                                # One bad frame must not cost the sender its connection
+                                metrics.parse_errors.inc()
+                                print(f"❌ Error handling frame: {e}")
+                    
+                    metrics.registry.remove_client(client_id)
+                    sequence_filter.remove(client_id)
+                    link.close(sessions)
+                    
+                except OSError as e:
+                    if not server_running:
+                        break
+                    # e.g. out of file descriptors; back off and keep serving
+                    print(f"❌ Server error: {e}")
+                    time.sleep(0.1)
                 except Exception as e:
-                    if server_running:
-                        print(f"❌ Server error: {e}")
-                    break
+                    print(f"❌ Server error: {e}")
             
             sock.close()
             
         except Exception as e:
             print(f"❌ Failed to start simple server: {e}")
     
+    # Set before the thread starts, whose accept loop runs while this is true
+    server_running = True
     server_thread = threading.Thread(target=simple_server, daemon=True)
     server_thread.start()
+
+def start_metrics_endpoint(port=metrics.METRICS_PORT):
+    """Serve Prometheus metrics over HTTP on the given port"""
+    global metrics_server
+    
+    if metrics_server:
+        return
+    
+    try:
+        metrics_server = metrics.start_metrics_server(port)
+        print(f"📊 Metrics available at http://0.0.0.0:{port}/metrics")
+    except OSError as e:
+        print(f"⚠️  Could not start metrics endpoint on port {port}: {e}")
+
+def start_fanout_server(workers, port=8765, forward=None):
+    """Ingest on a pool of worker processes, optionally forwarding to Blender
+    
+    forward is a (host, port) pair of the Blender receiver. Aggregated poses
+    also go to the pose hub when one is running; with neither they are only
+    counted.
+    """
+    global fanout_server, server_running
+    
+    if server_running:
+        print("WebSocket server is already running")
+        return
+    
+    # Pose counts reach the metrics endpoint from the aggregator
+    start_metrics_endpoint()
+    
+    # The hub and the forwarder each get the newest poses when both are set
+    sinks = []
+    if pose_hub is not None:
+        sinks.append(lambda poses: pose_hub.publish_poses([pose for _, pose in poses]))
+    if forward:
+        sinks.append(PoseForwarder(*forward, schema=channel_schema))
+    
+    def on_poses(poses):
+        for sink in sinks:
+            sink(poses)
+    
+    fanout_server = FanoutServer(workers=workers, port=port, on_poses=on_poses, schema=channel_schema)
+    fanout_server.start()
     server_running = True
+    print(f"🔌 Fan-out server started on 0.0.0.0:{port} with {fanout_server.workers} worker processes")
+    if forward:
+        print(f"📡 Forwarding newest poses to Blender at {forward[0]}:{forward[1]}")
 
 def stop_websocket_server():
     """Stop the WebSocket server"""
-    global server_running, websocket_server
+    global server_running, websocket_server, metrics_server, fanout_server, pose_hub
     
     server_running = False
     
+    if fanout_server:
+        fanout_server.stop()
+        fanout_server = None
+    
+    if pose_hub:
+        pose_hub.stop()
+        pose_hub = None
+    
     if websocket_server:
         try:
             websocket_server.close()
@@ -158,6 +322,11 @@ def stop_websocket_server():
             pass
         websocket_server = None
     
+    if metrics_server:
+        metrics_server.shutdown()
+        metrics_server.server_close()
+        metrics_server = None
+    
     if server_thread and server_thread.is_alive():
         server_thread.join(timeout=1.0)
     
@@ -172,12 +341,55 @@ def stop_server():
     """Stop the WebSocket server"""
     stop_websocket_server()
 
+def start_pose_hub(port=None, targets=()):
+    """Re-broadcast decoded poses to subscribers connecting on port and to the targets
+    
+    targets are (host, port) pairs the hub dials, such as Blender receivers.
+    """
+    global pose_hub
+    
+    pose_hub = PoseHub(port=port, targets=targets, schema=channel_schema)
+    pose_hub.start()
+    if port is not None:
+        print(f"📡 Publishing poses to subscribers on 0.0.0.0:{port}")
+    for host, target_port in targets:
+        print(f"📡 Publishing poses to {host}:{target_port}")
+
+def parse_forward(value):
+    """Parse a host:port argument"""
+    host, _, port = value.rpartition(':')
+    return (host or 'localhost', int(port))
+
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Standalone server for Camera Motion Receiver")
+    parser.add_argument('--workers', type=int, default=0,
+                        help="ingest on this many worker processes (0 = single-threaded server)")
+    parser.add_argument('--port', type=int, default=8765, help="port to listen on")
+    parser.add_argument('--forward', type=parse_forward, metavar='HOST:PORT',
+                        help="with --workers, forward the newest pose to a Blender receiver, e.g. localhost:8765")
+    parser.add_argument('--channels', default='', metavar='NAMES',
+                        help="comma-separated custom channels to decode besides LENS, FOCUS and APERTURE")
+    parser.add_argument('--publish-port', type=int, metavar='PORT',
+                        help="re-broadcast decoded poses to subscribers connecting on this port, e.g. 8766")
+    parser.add_argument('--publish', type=parse_forward, action='append', default=[], metavar='HOST:PORT',
+                        help="re-broadcast decoded poses to this receiver; may be given several times")
+    parser.add_argument('--quiet', action='store_true', help="don't print every received pose")
+    args = parser.parse_args()
+    if args.forward and not args.workers:
+        parser.error("--forward needs --workers; use --publish HOST:PORT to send poses on from a single process")
+    channel_schema = ChannelSchema.with_custom(args.channels)
+    verbose = not args.quiet
+    
     print("📱 Standalone WebSocket Server for Camera Motion Receiver")
     print("Starting server...")
     
     try:
-        start_websocket_server()
+        if args.publish_port is not None or args.publish:
+            start_pose_hub(args.publish_port, args.publish)
+        if args.workers:
+            start_fanout_server(args.workers, args.port, args.forward)
+        else:
+            start_websocket_server(args.port)
         print("✅ Server started successfully!")
         print("📱 Phone clients can now connect to this server")
         print("🛑 Press Ctrl+C to stop the server")
@@ -0,0 +1,263 @@
+"""
+Seekable take files for long captured sessions
+
+A take file stores timed samples in the (values, channels) columns of
+TakeRecorder.stop(), with times in seconds from the start of the take:
+
+    header   magic, version, samples per index block
+    records  one fixed-size row per sample: time, then every column as doubles
+    index    first time and byte offset of every block of samples
+    metadata JSON: columns, start frame and fps of the take
+    footer   offsets of the index and metadata, sample and block counts, magic
+
+Rows are written in time order and the sparse index gets one entry per block
+of BLOCK_SAMPLES rows, so it stays small (45 KB for an hour at 200 Hz) and the
+reader can find it from the fixed-size footer at the end of the file. Readers
+map the file with mmap and view the rows in place as a NumPy array: seeking
+bisects the index, then the times of one block, so it is O(log n) and only
+touches the pages of the index and that block. Extracting a range copies just
+the rows inside it. A file that was never closed has no footer and can't be
+opened.
+"""
+
+import json
+import math
+import mmap
+import struct
+
+import numpy as np
+
+try:
+    from .pose_protocol import CHANNELS_FIELD
+    from .take_recorder import EULER_CHANNELS
+except ImportError:
+    from pose_protocol import CHANNELS_FIELD
+    from take_recorder import EULER_CHANNELS
+
+MAGIC = b'CMRTAKE\0'
+FOOTER_MAGIC = b'CMRTAKE.'
+VERSION = 1
+
+# Samples per index block; a block of a 10-column take is about 22 KB
+BLOCK_SAMPLES = 256
+
+_HEADER = struct.Struct('<8sII')
+_FOOTER = struct.Struct('<QQQQ8s')
+_INDEX_DTYPE = np.dtype([('time', '<f8'), ('offset', '<u8')])
+
+_EULER_FIELDS = ('X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z')
+_QUATERNION_FIELDS = ('X', 'Y', 'Z', 'QUAT_W', 'QUAT_X', 'QUAT_Y', 'QUAT_Z')
+
+
+class TakeWriter:
+    """Appends time-ordered samples to a new take file; close() makes it seekable"""
+
+    def __init__(self, path, channels, start_frame=0.0, fps=24.0, block_samples=BLOCK_SAMPLES):
+        self.path = path
+        self.channels = [tuple(channel) for channel in channels]
+        self.start_frame = start_frame
+        self.fps = fps
+        self.block_samples = block_samples
+        self.sample_count = 0
+        self._row_size = 8 * (1 + len(self.channels))
+        self._index = []
+        self._last_time = -math.inf
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, block_samples))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def write(self, times, values):
+        """Append samples; times are seconds from the start of the take and must not go back"""
+        times = np.asarray(times, dtype=np.float64).reshape(-1)
+        values = np.asarray(values, dtype=np.float64).reshape(len(times), len(self.channels))
+        if not len(times):
+            return
+        if times[0] < self._last_time or np.any(np.diff(times) < 0.0):
+            raise ValueError("Take file samples must be written in time order")
+
+        # Index the rows that start a block
+        first = self.sample_count
+        starts = np.arange(-first % self.block_samples, len(times), self.block_samples)
+        for row in starts:
+            self._index.append((times[row], _HEADER.size + (first + row) * self._row_size))
+
+        self._file.write(np.column_stack((times, values)).astype('<f8', copy=False).tobytes())
+        self.sample_count += len(times)
+        self._last_time = times[-1]
+
+    def close(self):
+        """Write the index, metadata and footer"""
+        if self._file is None:
+            return
+        index_offset = self._file.tell()
+        self._file.write(np.array(self._index, dtype=_INDEX_DTYPE).tobytes())
+        metadata_offset = self._file.tell()
+        self._file.write(json.dumps({
+            'channels': self.channels,
+            'start_frame': self.start_frame,
+            'fps': self.fps,
+        }).encode('utf-8'))
+        self._file.write(_FOOTER.pack(index_offset, metadata_offset, self.sample_count, len(self._index),
+                                      FOOTER_MAGIC))
+        self._file.close()
+        self._file = None
+
+
+def write_take(path, take, start_frame, fps, block_samples=BLOCK_SAMPLES):
+    """Save a (frames, values, channels) take recorded from start_frame at fps; returns the sample count"""
+    frames, values, channels = take
+    with TakeWriter(path, channels, start_frame, fps, block_samples) as writer:
+        writer.write((np.asarray(frames, dtype=np.float64) - start_frame) / fps, values)
+    return writer.sample_count
+
+
+class TakeFile:
+    """Memory-mapped take file with O(log n) seeking"""
+
+    def __init__(self, path):
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            self._file.close()
+            raise ValueError(f"{path} is empty, not a take file")
+        try:
+            self._open()
+        except (ValueError, struct.error, UnicodeDecodeError, KeyError):
+            self.close()
+            raise
+
+    def _open(self):
+        data = self._map
+        if len(data) < _HEADER.size + _FOOTER.size:
+            raise ValueError(f"{self.path} is too short to be a take file")
+        magic, version, self.block_samples = _HEADER.unpack_from(data, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{self.path} is not a take file")
+        if version != VERSION:
+            raise ValueError(f"Unsupported take file version: {version}")
+        index_offset, metadata_offset, count, blocks, magic = _FOOTER.unpack_from(data, len(data) - _FOOTER.size)
+        if magic != FOOTER_MAGIC:
+            raise ValueError(f"{self.path} has no index; it was not closed after writing")
+
+        metadata = json.loads(data[metadata_offset:len(data) - _FOOTER.size].decode('utf-8'))
+        self.channels = [tuple(channel) for channel in metadata['channels']]
+        self.start_frame = metadata['start_frame']
+        self.fps = metadata['fps']
+        self._width = 1 + len(self.channels)
+        if (_HEADER.size + count * 8 * self._width > index_offset
+                or index_offset + blocks * _INDEX_DTYPE.itemsize > metadata_offset):
+            raise ValueError(f"{self.path} is truncated or corrupt")
+
+        # The index is small and read on every seek, so it is copied out of the map
+        index = np.frombuffer(data, dtype=_INDEX_DTYPE, count=blocks, offset=index_offset)
+        self._block_times = index['time'].copy()
+        self._block_rows = (index['offset'] - _HEADER.size) // (8 * self._width)
+        del index
+        # The rows stay in the map: pages are read only when a seek or range touches them
+        self._rows = np.frombuffer(data, dtype='<f8', count=count * self._width,
+                                   offset=_HEADER.size).reshape(count, self._width)
+        self._channel_map = (None, ())
+
+    def __len__(self):
+        return len(self._rows)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        # Views into the map have to go before it can close
+        self._rows = None
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        self._file.close()
+
+    @property
+    def start_time(self):
+        return float(self._rows[0, 0]) if len(self._rows) else 0.0
+
+    @property
+    def end_time(self):
+        return float(self._rows[-1, 0]) if len(self._rows) else 0.0
+
+    def index_at(self, seconds):
+        """Row of the last sample at or before seconds, or 0 before the first"""
+        if not len(self._rows):
+            raise ValueError("Take file has no samples")
+        block = int(np.searchsorted(self._block_times, seconds, side='right')) - 1
+        if block < 0:
+            return 0
+        start = int(self._block_rows[block])
+        end = min(start + self.block_samples, len(self._rows))
+        return max(start, start + int(np.searchsorted(self._rows[start:end, 0], seconds, side='right')) - 1)
+
+    def span(self, start, end):
+        """Row range [first, stop) of the samples from start to end seconds, inclusive"""
+        if not len(self._rows) or end < start:
+            return 0, 0
+        first = self.index_at(start)
+        if self._rows[first, 0] < start:
+            first += 1
+        stop = self.index_at(end) + 1
+        if stop and self._rows[stop - 1, 0] > end:
+            stop -= 1
+        return first, max(first, stop)
+
+    def sample_at(self, seconds):
+        """(time, values) of the sample in effect at seconds"""
+        row = self._rows[self.index_at(seconds)]
+        return float(row[0]), row[1:].copy()
+
+    def extract(self, start, end):
+        """(times, values) copies of the samples from start to end seconds"""
+        first, stop = self.span(start, end)
+        rows = np.array(self._rows[first:stop])
+        return rows[:, 0], rows[:, 1:]
+
+    def take(self, start=-math.inf, end=math.inf):
+        """The samples from start to end seconds as a (frames, values, channels) take"""
+        times, values = self.extract(start, end)
+        return self.start_frame + times * self.fps, values, list(self.channels)
+
+    def save_range(self, path, start, end, block_samples=None):
+        """Write the samples from start to end seconds to a new take file; returns the sample count"""
+        times, values = self.extract(start, end)
+        with TakeWriter(path, self.channels, self.start_frame, self.fps,
+                        block_samples or self.block_samples) as writer:
+            writer.write(times, values)
+        return writer.sample_count
+
+    def pose_at(self, seconds, schema=None):
+        """The sample in effect at seconds as a decoded pose for apply_camera_motion
+
+        Channel columns fill the CHANNELS of schema, the receiver's ChannelSchema,
+        by their path; channels the take has no value for are None.
+        """
+        values = self._rows[self.index_at(seconds)].tolist()
+        fields = _EULER_FIELDS if self.channels[:6] == EULER_CHANNELS else _QUATERNION_FIELDS
+        pose = dict(zip(fields, values[1:]))
+        if schema is not None and len(schema):
+            cached_schema, columns = self._channel_map
+            if cached_schema is not schema:
+                positions = {channel: column for column, channel in enumerate(self.channels)}
+                columns = [(column, positions[key] + 1) for column, key in enumerate(schema.keys)
+                           if key in positions]
+                self._channel_map = (schema, columns)
+            if columns:
+                channels = [None] * len(schema)
+                for column, row_column in columns:
+                    value = values[row_column]
+                    if not math.isnan(value):
+                        channels[column] = value
+                pose[CHANNELS_FIELD] = tuple(channels)
+        return pose
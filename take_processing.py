@@ -0,0 +1,243 @@
+"""
+Vectorised clean-up of recorded camera takes
+
+A take is a time column (seconds) plus a samples x channels value array. The
+steps run over whole NumPy arrays with no per-sample Python loop:
+
+    unwrap_angles        remove ±π flips from Euler channels
+    butterworth          zero-phase low-pass, applied in the frequency domain
+    savitzky_golay       polynomial smoothing that keeps peaks
+    resample             linear interpolation onto new times, e.g. scene frames
+    reduce_keyframes     Ramer-Douglas-Peucker keyframe reduction
+
+process_take chains them in that order. Quaternion channels are kept
+sign-continuous and renormalised after filtering.
+"""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Default smoothing settings
+DEFAULT_CUTOFF = 6.0
+DEFAULT_ORDER = 2
+DEFAULT_WINDOW = 9
+DEFAULT_POLYORDER = 2
+
+
+def _as_columns(values):
+    """View values as a 2-D samples x channels float array"""
+    values = np.asarray(values, dtype=np.float64)
+    return values.reshape(len(values), -1)
+
+
+def _pad_odd(values, pad):
+    """Pad along time with point-reflection, which keeps the signal and its slope continuous"""
+    return np.pad(values, ((pad, pad), (0, 0)), mode='reflect', reflect_type='odd')
+
+
+def _fast_fft_length(length):
+    """Smallest length >= length with no prime factor above 5, which FFTs quickly"""
+    best = 2 * length
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            size = power35
+            while size < length:
+                size *= 2
+            best = min(best, size)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+
+def unwrap_angles(angles):
+    """Remove jumps of more than π between successive angle samples"""
+    return np.unwrap(_as_columns(angles), axis=0)
+
+
+def make_quaternions_continuous(quats):
+    """Flip quaternion signs so consecutive samples lie in the same hemisphere"""
+    quats = _as_columns(quats).copy()
+    if len(quats) < 2:
+        return quats
+    dots = np.einsum('ij,ij->i', quats[1:], quats[:-1])
+    signs = np.cumprod(np.where(dots < 0.0, -1.0, 1.0))
+    quats[1:] *= signs[:, None]
+    return quats
+
+
+def normalize_quaternions(quats):
+    """Scale every quaternion row to unit length"""
+    quats = _as_columns(quats)
+    return quats / np.linalg.norm(quats, axis=1, keepdims=True)
+
+
+def butterworth(values, rate, cutoff=DEFAULT_CUTOFF, order=DEFAULT_ORDER):
+    """Zero-phase Butterworth low-pass of uniformly sampled values
+
+    The gain is the squared Butterworth magnitude, the same response as running the
+    filter forwards and backwards. The signal is padded by reflection and
+    detrended so the FFT's circular wrap adds no edge artefacts.
+    """
+    values = _as_columns(values)
+    count = len(values)
+    if count < 3 or cutoff <= 0.0 or cutoff >= rate / 2.0:
+        return values.copy()
+
+    pad = min(count - 1, int(np.ceil(3.0 * rate / cutoff)))
+    padded = _pad_odd(values, pad)
+    length = len(padded)
+
+    # A zero-phase filter passes straight lines, so remove the end-to-end line
+    # first. The rest starts and ends at zero, so zero-filling up to a fast FFT
+    # length adds no discontinuity.
+    trend = np.linspace(padded[0], padded[-1], length)
+    fft_length = _fast_fft_length(length)
+    spectrum = np.fft.rfft(padded - trend, n=fft_length, axis=0)
+    frequencies = np.fft.rfftfreq(fft_length, d=1.0 / rate)
+    gain = 1.0 / (1.0 + (frequencies / cutoff) ** (2 * order))
+    filtered = np.fft.irfft(spectrum * gain[:, None], n=fft_length, axis=0)[:length] + trend
+    return filtered[pad:pad + count]
+
+
+def savitzky_golay_coefficients(window, polyorder=DEFAULT_POLYORDER):
+    """Convolution weights that evaluate a least-squares polynomial fit at the window centre"""
+    if window % 2 == 0 or window <= polyorder:
+        raise ValueError("Savitzky-Golay window must be odd and larger than the polynomial order")
+    half = window // 2
+    vandermonde = np.vander(np.arange(-half, half + 1), polyorder + 1, increasing=True)
+    return np.linalg.pinv(vandermonde)[0]
+
+
+def savitzky_golay(values, window=DEFAULT_WINDOW, polyorder=DEFAULT_POLYORDER):
+    """Savitzky-Golay smoothing of uniformly sampled values"""
+    values = _as_columns(values)
+    if len(values) < window:
+        return values.copy()
+
+    coefficients = savitzky_golay_coefficients(window, polyorder)
+    padded = _pad_odd(values, window // 2)
+    # Weights are symmetric, so correlation over the sliding windows equals convolution
+    windows = np.lib.stride_tricks.sliding_window_view(padded, window, axis=0)
+    return windows @ coefficients
+
+
+def resample(times, values, new_times):
+    """Linearly interpolate every channel onto new_times"""
+    times = np.asarray(times, dtype=np.float64)
+    values = _as_columns(values)
+    new_times = np.asarray(new_times, dtype=np.float64)
+    return np.column_stack([np.interp(new_times, times, column) for column in values.T])
+
+
+def uniform_times(times):
+    """Evenly spaced times over the same span at the median sample interval"""
+    times = np.asarray(times, dtype=np.float64)
+    step = float(np.median(np.diff(times)))
+    count = int(round((times[-1] - times[0]) / step)) + 1
+    return times[0] + np.arange(count) * step
+
+
+def reduce_keyframes(times, values, tolerance):
+    """Indices of the samples to keep so linear interpolation stays within tolerance
+
+    Ramer-Douglas-Peucker on the value error of each channel, where tolerance is
+    a scalar or one value per channel. The endpoints are always kept. Every open
+    segment is split in the same pass, so each pass is a few array operations
+    over the undecided samples rather than a Python step per split.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = _as_columns(values)
+    count = len(times)
+    if count < 3:
+        return np.arange(count)
+
+    # One contiguous row per channel in units of its tolerance, so a sample is
+    # out of tolerance when its error exceeds 1
+    tolerance = np.broadcast_to(np.asarray(tolerance, dtype=np.float64), values.shape[1:])
+    channels = np.ascontiguousarray((values / tolerance).T)
+    keep = np.zeros(count, dtype=bool)
+    keep[[0, -1]] = True
+    # Samples whose segment may still need splitting
+    open_samples = ~keep
+
+    while True:
+        samples = np.flatnonzero(open_samples)
+        if not len(samples):
+            break
+
+        # Error of each sample against the line between its segment's kept ends,
+        # worked out channel by channel on 1-D arrays, which gathers much faster
+        kept = np.flatnonzero(keep)
+        segment = np.cumsum(keep)[samples] - 1
+        first = kept[segment]
+        elapsed = times[samples] - times[first]
+        durations = np.diff(times[kept])
+        error = np.zeros(len(samples))
+        for channel in channels:
+            slopes = np.diff(channel[kept]) / durations
+            deviation = channel[first] + elapsed * slopes[segment] - channel[samples]
+            np.maximum(error, np.abs(deviation), out=error)
+
+        # Worst sample of each segment; samples are grouped by segment already
+        new_segment = np.r_[True, segment[1:] != segment[:-1]]
+        group = np.cumsum(new_segment) - 1
+        worst_error = np.maximum.reduceat(error, np.flatnonzero(new_segment))
+        candidates = np.flatnonzero(error == worst_error[group])
+        worst = candidates[np.r_[True, group[candidates[1:]] != group[candidates[:-1]]]]
+
+        # Split segments that are out of tolerance; the others are finished
+        split = worst_error > 1.0
+        keep[samples[worst[split]]] = True
+        open_samples[samples[~split[group]]] = False
+        open_samples[samples[worst[split]]] = False
+    return np.flatnonzero(keep)
+
+
+def process_take(times, values, euler_columns=(), quaternion_columns=None, smoothing=None,
+                 cutoff=DEFAULT_CUTOFF, window=DEFAULT_WINDOW, new_times=None, tolerance=None):
+    """Clean up a take; returns the new (times, values)
+
+    euler_columns are unwrapped and quaternion_columns (a slice or index list of
+    four columns) kept continuous and unit length. smoothing is None,
+    'BUTTERWORTH' or 'SAVGOL'. new_times resamples the result, and tolerance
+    reduces it to the keyframes needed to stay within that error.
+    """
+    times = np.asarray(times, dtype=np.float64)
+    values = _as_columns(values).copy()
+
+    # Make rotations continuous before anything averages across samples
+    if len(euler_columns):
+        values[:, euler_columns] = unwrap_angles(values[:, euler_columns])
+    if quaternion_columns is not None:
+        values[:, quaternion_columns] = make_quaternions_continuous(values[:, quaternion_columns])
+
+    if smoothing:
+        # Filters need evenly spaced samples
+        grid = uniform_times(times)
+        if len(grid) != len(times) or not np.allclose(grid, times):
+            values = resample(times, values, grid)
+            times = grid
+        rate = 1.0 / (times[1] - times[0])
+        if smoothing == 'BUTTERWORTH':
+            values = butterworth(values, rate, cutoff)
+        elif smoothing == 'SAVGOL':
+            values = savitzky_golay(values, window)
+        else:
+            raise ValueError(f"Unknown smoothing: {smoothing}")
+
+    if new_times is not None:
+        values = resample(times, values, new_times)
+        times = np.asarray(new_times, dtype=np.float64)
+
+    if quaternion_columns is not None:
+        values[:, quaternion_columns] = normalize_quaternions(values[:, quaternion_columns])
+
+    if tolerance:
+        kept = reduce_keyframes(times, values, tolerance)
+        times, values = times[kept], values[kept]
+
+    return times, values
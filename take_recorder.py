@@ -0,0 +1,120 @@
+"""
+Recording of incoming poses on the scene timeline
+
+While recording, every received pose (not just the newest per main-thread tick)
+is stored with its time on the receiver clock. Senders that stamp TS and answer
+clock pings are placed at the time the pose was captured, otherwise at its
+arrival time. Sample times map linearly onto scene frames from the frame and
+time at which recording started, so keys land on the frame the motion happened,
+not the frame the timer fired on.
+
+Extra channels of the receiver's ChannelSchema, such as the lens, are recorded
+as further columns after the transform.
+"""
+
+import threading
+import time
+
+import numpy as np
+
+try:
+    from .pose_math import euler_to_quaternion, matrix_to_location_quaternion
+    from .pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MATRIX_FIELD, CHANNELS_FIELD
+except ImportError:
+    from pose_math import euler_to_quaternion, matrix_to_location_quaternion
+    from pose_protocol import pose_mode, MODE_EULER, MODE_QUATERNION, MATRIX_FIELD, CHANNELS_FIELD
+
+EULER_CHANNELS = [('location', i) for i in range(3)] + [('rotation_euler', i) for i in range(3)]
+QUATERNION_CHANNELS = [('location', i) for i in range(3)] + [('rotation_quaternion', i) for i in range(4)]
+
+
+def channel_columns(rows, schema):
+    """Stack poses' CHANNELS tuples into (values, keys), leaving out channels no pose carried
+
+    rows holds each pose's tuple, or None for poses without channels; values a
+    pose did not carry are NaN.
+    """
+    width = len(schema)
+    values = np.array([row if row is not None and len(row) == width else schema.empty for row in rows],
+                      dtype=np.float64).reshape(len(rows), width)
+    sent = ~np.isnan(values).all(axis=0)
+    return values[:, sent], [key for key, keep in zip(schema.keys, sent) if keep]
+
+
+class TakeRecorder:
+    """Collects timed poses between start and stop"""
+
+    def __init__(self, schema=None):
+        # ChannelSchema whose channels are recorded along with the transform
+        self.schema = schema
+        self.recording = False
+        self.start_time = None
+        self.start_frame = 0
+        self.fps = 24.0
+        self._samples = []
+        self._lock = threading.Lock()
+
+    @property
+    def sample_count(self):
+        return len(self._samples)
+
+    def start(self, start_frame, fps, now=None):
+        """Begin a take at start_frame of a scene running at fps"""
+        with self._lock:
+            self.start_time = time.perf_counter() if now is None else now
+            self.start_frame = start_frame
+            self.fps = fps
+            self._samples = []
+            self.recording = True
+
+    def frame_at(self, local_time):
+        """Scene frame (fractional) of a time on the receiver clock"""
+        return self.start_frame + (local_time - self.start_time) * self.fps
+
+    def add(self, local_time, pose):
+        """Store a pose captured at local_time on the receiver clock"""
+        if self.recording:
+            self._samples.append((local_time, pose))
+
+    def stop(self):
+        """End the take; returns (frames, values, channels) or None if nothing was recorded
+
+        Takes with only Euler poses keep Euler channels; anything else is stored
+        as location plus quaternion. Schema channels any pose carried follow as
+        further columns, NaN where a pose did not carry them.
+        """
+        with self._lock:
+            self.recording = False
+            samples, self._samples = self._samples, []
+        if not samples:
+            return None
+
+        samples.sort(key=lambda sample: sample[0])
+        times = np.array([local_time for local_time, _ in samples])
+        poses = [pose for _, pose in samples]
+
+        if all(pose_mode(pose) == MODE_EULER for pose in poses):
+            channels = EULER_CHANNELS
+            values = np.array([(p['X'], p['Y'], p['Z'], p['ROT_X'], p['ROT_Y'], p['ROT_Z']) for p in poses])
+        else:
+            channels = QUATERNION_CHANNELS
+            values = np.array([_location_quaternion(pose) for pose in poses])
+
+        if self.schema is not None and len(self.schema):
+            rows = [pose.get(CHANNELS_FIELD) for pose in poses]
+            if any(row is not None for row in rows):
+                extra, keys = channel_columns(rows, self.schema)
+                values = np.column_stack((values, extra))
+                channels = channels + keys
+
+        return self.frame_at(times), values, channels
+
+
+def _location_quaternion(pose):
+    mode = pose_mode(pose)
+    if mode == MODE_QUATERNION:
+        return (pose['X'], pose['Y'], pose['Z'], pose['QUAT_W'], pose['QUAT_X'], pose['QUAT_Y'], pose['QUAT_Z'])
+    if mode == MODE_EULER:
+        return (pose['X'], pose['Y'], pose['Z']) + euler_to_quaternion(pose['ROT_X'], pose['ROT_Y'], pose['ROT_Z'])
+    location, quaternion = matrix_to_location_quaternion(pose[MATRIX_FIELD])
+    return tuple(location) + tuple(quaternion)
@@ -4,76 +4,306 @@ Test client for the Camera Motion Receiver add-on
 This script sends camera motion data to the WebSocket server running in Blender
 """
 
+import argparse
 import json
+import random
 import time
+import select
 import socket
 import struct
 import threading
 import math
 
+from clock_sync import is_ping, make_pong
+from flow_control import encode_frame, split_frames, is_control_message
+from pose_codec import is_resync_message
+from session import Backoff, InFlightBuffer, is_ack, is_welcome, make_hello, new_session_id
+
+# Seconds to wait for the server's welcome after connecting
+WELCOME_TIMEOUT = 1.0
+
+# Reconnect attempts before giving up on a lost connection
+RECONNECT_ATTEMPTS = 8
+
 class CameraMotionTestClient:
-    def __init__(self, host='localhost', port=8765):
+    def __init__(self, host='localhost', port=8765, encoder=None, stream=None, loss=0.0, reorder=0.0,
+                 reconnect=True, zoom=False):
         self.host = host
         self.port = port
         self.socket = None
         self.connected = False
         
+        # Optional pose_codec.PoseEncoder for compact binary frames. They carry
+        # no SEQ, so the server can't acknowledge them and they are not
+        # replayed after a reconnect; session resume needs JSON framing
+        self.encoder = encoder
+        
+        # JSON poses are stamped with SEQ and TS, and STREAM when given
+        self.stream = stream
+        self.sequence = 0
+        
+        # Session kept across reconnects; sent poses wait in the in-flight
+        # buffer until the server acknowledges them
+        self.session = stream or new_session_id()
+        self.reconnect_enabled = reconnect
+        self.backoff = Backoff()
+        self.in_flight = InFlightBuffer()
+        self.server_recording = False
+        self.replayed_count = 0
+        self._welcomed = False
+        self._reconnecting = False
+        
+        # Simulated network impairment: fraction of messages lost, and of
+        # messages held back and sent after the next one
+        self.loss = loss
+        self.reorder = reorder
+        self.lost_count = 0
+        self.reordered_count = 0
+        self._held_message = None
+        self._random = random.Random()
+        
+        # Animated motion also sweeps the LENS channel
+        self.zoom = zoom
+        
+        # Latest advice from the server's control channel
+        self.max_rate = None
+        self.batch_size = 1
+        self._control_buffer = b''
+        
     def connect(self):
         """Connect to the WebSocket server"""
         try:
             self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
             self.socket.connect((self.host, self.port))
             self.connected = True
+            self.max_rate = None
+            self.batch_size = 1
+            self._control_buffer = b''
+            if self.encoder:
+                self.encoder.request_keyframe()
             print(f"Connected to server at {self.host}:{self.port}")
-            return True
+            
+            # Name our session and resume it before sending anything new, so a
+            # replay isn't overtaken by fresher poses
+            self._welcomed = False
+            self.socket.sendall(encode_frame(make_hello(self.session)))
+            deadline = time.monotonic() + WELCOME_TIMEOUT
+            while self.connected and not self._welcomed and time.monotonic() < deadline:
+                self.poll_control(deadline - time.monotonic())
+            return self.connected
         except Exception as e:
             print(f"Failed to connect: {e}")
             return False
     
+    def reconnect(self):
+        """Reconnect with exponential backoff after the connection was lost"""
+        if self._reconnecting:
+            return False
+        self._reconnecting = True
+        try:
+            self.backoff.reset()
+            for _ in range(RECONNECT_ATTEMPTS):
+                delay = self.backoff.next_delay()
+                print(f"Reconnecting in {delay:.2f}s...")
+                time.sleep(delay)
+                if self.connect():
+                    return True
+            print(f"Giving up after {RECONNECT_ATTEMPTS} attempts")
+            return False
+        finally:
+            self._reconnecting = False
+    
+    def connection_lost(self, error):
+        """Drop the broken socket, then reconnect if enabled"""
+        print(f"Connection lost: {error}")
+        if self.socket:
+            try:
+                self.socket.close()
+            except OSError:
+                pass
+            self.socket = None
+        self.connected = False
+        if self.reconnect_enabled:
+            self.reconnect()
+    
     def disconnect(self):
         """Disconnect from the server"""
         if self.socket:
             self.socket.close()
             self.socket = None
         self.connected = False
+        self._control_buffer = b''
         print("Disconnected from server")
     
+    def poll_control(self, timeout=0):
+        """Read any control frames the server has sent, waiting at most timeout seconds"""
+        if not self.connected:
+            return
+        
+        try:
+            while select.select([self.socket], [], [], max(0, timeout))[0]:
+                chunk = self.socket.recv(4096)
+                if not chunk:
+                    raise ConnectionError("Server closed the connection")
+                self._control_buffer += chunk
+                timeout = 0
+        except OSError as e:
+            self.connection_lost(e)
+            return
+        received = time.time()
+        
+        frames, self._control_buffer = split_frames(self._control_buffer)
+        for frame in frames:
+            try:
+                data = json.loads(frame.decode('utf-8'))
+            except (UnicodeDecodeError, json.JSONDecodeError):
+                continue
+            if is_control_message(data):
+                self.apply_control(data)
+            elif is_resync_message(data) and self.encoder:
+                self.encoder.request_keyframe()
+            elif is_welcome(data):
+                self.on_welcome(data)
+            elif is_ack(data):
+                if data.get('ack') is not None:
+                    self.in_flight.ack(data['ack'])
+                self.server_recording = bool(data.get('recording'))
+            elif is_ping(data):
+                # Answer clock pings so the server can place our TS stamps on its clock
+                try:
+                    self.socket.sendall(encode_frame(make_pong(data, received)))
+                except OSError as e:
+                    print(f"Failed to answer clock ping: {e}")
+    
+    def on_welcome(self, welcome):
+        """Replay unacknowledged poses if the server is recording, otherwise drop them"""
+        self._welcomed = True
+        if welcome.get('ack') is not None:
+            self.in_flight.ack(welcome['ack'])
+            # Restarted under a resumed session: the server drops anything not
+            # newer than what it already has, so carry on from there
+            self.sequence = max(self.sequence, welcome['ack'] + 1)
+        self.server_recording = bool(welcome.get('recording'))
+        
+        pending = self.in_flight.pending()
+        if not pending:
+            return
+        if not self.server_recording:
+            self.in_flight.clear()
+            return
+        try:
+            for message in pending:
+                self.socket.sendall(struct.pack('!I', len(message)) + message)
+        except OSError as e:
+            print(f"Failed to replay poses: {e}")
+            return
+        self.replayed_count += len(pending)
+        print(f"Session {self.session} resumed: replayed {len(pending)} unacknowledged messages")
+    
+    def apply_control(self, advice):
+        """Adapt the send rate and batch size to the server's advice"""
+        self.max_rate = advice.get('max_rate')
+        self.batch_size = max(1, int(advice.get('batch') or 1))
+        print(f"Server applies at {advice.get('apply_rate')} Hz: "
+              f"max rate {self.max_rate or 'unlimited'}, batch {self.batch_size}")
+    
     def send_camera_data(self, x, y, z, rot_x, rot_y, rot_z):
         """Send camera motion data to the server"""
+        return self.send_pose({
+            "X": x,
+            "Y": y,
+            "Z": z,
+            "ROT_X": rot_x,
+            "ROT_Y": rot_y,
+            "ROT_Z": rot_z
+        })
+    
+    def send_camera_quaternion(self, x, y, z, quat_w, quat_x, quat_y, quat_z):
+        """Send a camera pose with its rotation as a quaternion"""
+        return self.send_pose({
+            "X": x,
+            "Y": y,
+            "Z": z,
+            "QUAT_W": quat_w,
+            "QUAT_X": quat_x,
+            "QUAT_Y": quat_y,
+            "QUAT_Z": quat_z
+        })
+    
+    def send_camera_matrix(self, matrix):
+        """Send a camera pose as 16 row-major 4x4 matrix values"""
+        return self.send_pose({"MATRIX": [float(value) for value in matrix]})
+    
+    def send_pose(self, data):
+        """Send one pose message, or a list of poses as a batch, to the server"""
         if not self.connected:
             print("Not connected to server")
             return False
         
         try:
-            # Create JSON data
-            data = {
-                "X": x,
-                "Y": y,
-                "Z": z,
-                "ROT_X": rot_x,
-                "ROT_Y": rot_y,
-                "ROT_Z": rot_z
-            }
-            
-            # Convert to JSON string
-            json_data = json.dumps(data)
-            message = json_data.encode('utf-8')
-            
-            # Send data length first (4 bytes)
-            length = struct.pack('!I', len(message))
-            self.socket.send(length)
-            
-            # Send the actual data
-            self.socket.send(message)
+            if self.encoder:
+                # One binary frame per pose, batches included; never buffered for replay
+                poses = data if isinstance(data, list) else [data]
+                messages = [self.encoder.encode(pose) for pose in poses]
+            else:
+                # Stamp and convert to JSON string
+                if isinstance(data, list):
+                    data = [self.stamp(pose) for pose in data]
+                else:
+                    data = self.stamp(data)
+                json_data = json.dumps(data)
+                messages = [json_data.encode('utf-8')]
+                
+                # Keep it until the server acknowledges its last SEQ
+                self.in_flight.add(self.sequence - 1, messages[0])
+            
+            for message in self.impair(messages):
+                # Send data length first (4 bytes)
+                length = struct.pack('!I', len(message))
+                self.socket.send(length)
+                
+                # Send the actual data
+                self.socket.send(message)
             
             print(f"Sent camera data: {data}")
             return True
             
+        except OSError as e:
+            print(f"Failed to send data: {e}")
+            self.connection_lost(e)
+            return False
         except Exception as e:
             print(f"Failed to send data: {e}")
-            self.connected = False
             return False
     
+    def stamp(self, pose):
+        """Return a copy of pose with the next sequence number and a send timestamp"""
+        stamped = dict(pose, SEQ=self.sequence, TS=time.time())
+        if self.stream:
+            stamped['STREAM'] = self.stream
+        self.sequence += 1
+        return stamped
+    
+    def impair(self, messages):
+        """Drop and reorder messages according to the loss and reorder settings"""
+        if not (self.loss or self.reorder):
+            return messages
+        
+        sent = []
+        for message in messages:
+            if self._random.random() < self.loss:
+                self.lost_count += 1
+                continue
+            if self._held_message is None and self._random.random() < self.reorder:
+                self._held_message = message
+                continue
+            sent.append(message)
+            if self._held_message is not None:
+                sent.append(self._held_message)
+                self._held_message = None
+                self.reordered_count += 1
+        return sent
+    
     def send_animated_motion(self, duration=10, fps=30):
         """Send animated camera motion for testing"""
         if not self.connect():
@@ -84,6 +314,9 @@ class CameraMotionTestClient:
             
             start_time = time.time()
             frame_count = 0
+            message_count = 0
+            pending = []
+            next_send = start_time
             
             while time.time() - start_time < duration:
                 # Calculate time-based animation
@@ -100,13 +333,64 @@ class CameraMotionTestClient:
                 rot_y = 0.0
                 rot_z = t * 2 * math.pi
                 
-                # Send the data
-                self.send_camera_data(x, y, z, rot_x, rot_y, rot_z)
-                
+                pose = {"X": x, "Y": y, "Z": z, "ROT_X": rot_x, "ROT_Y": rot_y, "ROT_Z": rot_z}
+                if self.zoom:
+                    # Zoom from 24 mm to 70 mm and back
+                    pose["LENS"] = 47.0 - 23.0 * math.cos(t * 2 * math.pi)
                 frame_count += 1
+                
+                # Downsample by keeping only the newest pose, or batch when asked to
+                if self.batch_size > 1:
+                    pending.append(pose)
+                else:
+                    pending = [pose]
+                
+                now = time.time()
+                if now >= next_send and len(pending) >= self.batch_size:
+                    self.send_pose(pending if len(pending) > 1 else pending[0])
+                    message_count += 1
+                    pending = []
+                    next_send = now + 1.0 / self.max_rate if self.max_rate else now
+                
+                self.poll_control()
                 time.sleep(1.0 / fps)
             
-            print(f"Animation complete. Sent {frame_count} frames")
+            print(f"Animation complete. Generated {frame_count} frames in {message_count} messages")
+            if self.loss or self.reorder:
+                print(f"Simulated {self.lost_count} lost and {self.reordered_count} reordered messages")
+            
+        finally:
+            self.disconnect()
+    
+    def send_imu_motion(self, duration=10, rate=200, batch=10):
+        """Send raw IMU batches of a device lying flat and panning 90 degrees and back"""
+        if not self.connect():
+            return
+        
+        try:
+            print(f"Sending IMU samples for {duration} seconds at {rate} Hz, {batch} per message")
+            
+            start_time = time.time()
+            sample_count = 0
+            rows = []
+            
+            while time.time() - start_time < duration:
+                now = time.time()
+                t = (now - start_time) / duration
+                
+                # Heading (pi/4)(1 - cos 2 pi t) turns as this rate in rad/s
+                yaw_rate = math.pi / 4 * 2 * math.pi / duration * math.sin(t * 2 * math.pi)
+                rows.append([now, 0.0, 0.0, 9.80665, 0.0, 0.0, yaw_rate])
+                sample_count += 1
+                
+                if len(rows) >= batch:
+                    self.send_pose({"IMU": rows})
+                    rows = []
+                
+                self.poll_control()
+                time.sleep(1.0 / rate)
+            
+            print(f"IMU motion complete. Sent {sample_count} samples")
             
         finally:
             self.disconnect()
@@ -141,7 +425,21 @@ class CameraMotionTestClient:
 
 def main():
     """Main function to run the test client"""
-    client = CameraMotionTestClient()
+    parser = argparse.ArgumentParser(description="Camera Motion Test Client")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--stream', help="STREAM name sent with every pose")
+    parser.add_argument('--loss', type=float, default=0.0, help="fraction of messages to drop, e.g. 0.05")
+    parser.add_argument('--reorder', type=float, default=0.0,
+                        help="fraction of messages to send after the following one")
+    parser.add_argument('--no-reconnect', action='store_true', help="stop when the connection is lost")
+    parser.add_argument('--zoom', action='store_true', help="animate the LENS channel too")
+    parser.add_argument('--imu', action='store_true', help="animate with raw IMU samples instead of poses")
+    args = parser.parse_args()
+    
+    client = CameraMotionTestClient(args.host, args.port, stream=args.stream,
+                                    loss=args.loss, reorder=args.reorder,
+                                    reconnect=not args.no_reconnect, zoom=args.zoom)
     
     print("Camera Motion Test Client")
     print("1. Send animated motion")
@@ -155,7 +453,10 @@ def main():
             
             if choice == '1':
                 duration = float(input("Enter animation duration (seconds): "))
-                client.send_animated_motion(duration=duration)
+                if args.imu:
+                    client.send_imu_motion(duration=duration)
+                else:
+                    client.send_animated_motion(duration=duration)
                 
             elif choice == '2':
                 client.send_test_sequence()
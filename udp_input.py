@@ -0,0 +1,70 @@
+"""
+UDP listeners for the pose inputs that arrive as datagrams, FreeD and OSC
+
+A UdpListener binds a port and receives on a daemon thread of its own into one
+preallocated buffer, handing each datagram to handle() as a memoryview into it.
+Subclasses decode the datagram there before the next one overwrites the buffer.
+"""
+
+import abc
+import socket
+import threading
+
+# Largest datagram received whole; longer ones are truncated by the socket
+MAX_DATAGRAM = 65536
+
+# Seconds a receive waits before checking whether the listener was stopped
+POLL_INTERVAL = 0.2
+
+
+class UdpListener(abc.ABC):
+    """Receives datagrams on a UDP port and passes each to handle()"""
+
+    def __init__(self, host, port):
+        self.host = host
+        self.port = port
+        self._socket = None
+        self._thread = None
+        self._running = False
+
+    def start(self):
+        """Bind the port and start receiving; raises OSError if the port is taken"""
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((self.host, self.port))
+        sock.settimeout(POLL_INTERVAL)
+        self._socket = sock
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._running = False
+        if self._thread:
+            self._thread.join(timeout=1.0)
+            self._thread = None
+        if self._socket:
+            self._socket.close()
+            self._socket = None
+
+    def _run(self):
+        sock = self._socket
+        buffer = bytearray(MAX_DATAGRAM)
+        view = memoryview(buffer)
+        while self._running:
+            try:
+                size = sock.recv_into(buffer)
+            except socket.timeout:
+                continue
+            except OSError:
+                if not self._running:
+                    break
+                continue
+            try:
+                self.handle(view[:size])
+            except Exception as e:
+                print(f"Error handling {type(self).__name__} datagram: {e}")
+
+    @abc.abstractmethod
+    def handle(self, datagram):
+        """Decode one datagram, a memoryview only valid until this returns"""
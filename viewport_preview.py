@@ -0,0 +1,103 @@
+"""
+Depsgraph-free viewport preview of incoming poses
+
+Writing a pose to the scene camera tags it for a depsgraph evaluation, which in
+heavy scenes caps how often the camera can move. In preview mode each pose
+drives the RegionView3D.view_matrix of viewports looking through the camera
+instead, which costs only a redraw. The scene camera itself is committed at a
+lower rate, on demand, or when preview mode ends.
+"""
+
+import time
+import bpy
+from mathutils import Matrix
+
+from .camera_controller import CameraController
+
+# Blender's perspective viewports behave like a camera with a 72 mm sensor
+VIEWPORT_SENSOR_WIDTH = 72.0
+
+# Viewports taken out of camera view for the preview, by area pointer
+_switched_areas = set()
+
+# Newest previewed pose not yet written to the scene camera
+uncommitted_pose = None
+last_commit = 0.0
+
+
+def view_matrix_for_pose(camera, pose):
+    """World-to-view matrix the camera would have with pose as its local transform"""
+    order = camera.rotation_mode if len(camera.rotation_mode) == 3 else 'XYZ'
+    basis = CameraController.pose_matrix(pose, order)
+
+    # Parent transform from the last evaluation, without the camera's own scale
+    parent = camera.matrix_world @ camera.matrix_basis.inverted_safe()
+    location, rotation, _ = (parent @ basis).decompose()
+    return Matrix.LocRotScale(location, rotation, None).inverted()
+
+
+def _preview_spaces():
+    """Yield (area, space) for 3D viewports that show the camera"""
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.type != 'VIEW_3D':
+                continue
+            space = area.spaces.active
+            rv3d = space.region_3d
+            if rv3d is None:
+                continue
+            if rv3d.view_perspective == 'CAMERA':
+                # Camera view would ignore view_matrix, so switch to a free perspective
+                rv3d.view_perspective = 'PERSP'
+                _switched_areas.add(area.as_pointer())
+            if area.as_pointer() in _switched_areas:
+                yield area, space
+
+
+def show_pose(camera, pose):
+    """Show pose in every viewport looking through camera; returns how many were updated"""
+    global uncommitted_pose
+    uncommitted_pose = pose
+
+    view_matrix = view_matrix_for_pose(camera, pose)
+    lens = None
+    if camera.type == 'CAMERA' and camera.data.type == 'PERSP':
+        lens = camera.data.lens * VIEWPORT_SENSOR_WIDTH / camera.data.sensor_width
+
+    count = 0
+    for area, space in _preview_spaces():
+        space.region_3d.view_matrix = view_matrix
+        if lens is not None and space.lens != lens:
+            space.lens = lens
+        area.tag_redraw()
+        count += 1
+    return count
+
+
+def commit_due(rate):
+    """True when the scene camera should be committed at rate Hz (0 means never)"""
+    return rate > 0 and time.perf_counter() - last_commit >= 1.0 / rate
+
+
+def commit(camera):
+    """Write the newest previewed pose to the scene camera"""
+    global uncommitted_pose, last_commit
+    last_commit = time.perf_counter()
+    if uncommitted_pose is None or camera is None:
+        return False
+    CameraController.set_camera_pose(camera, uncommitted_pose)
+    uncommitted_pose = None
+    return True
+
+
+def stop_preview(camera=None):
+    """Commit any previewed pose and put switched viewports back into camera view"""
+    if camera is not None:
+        commit(camera)
+
+    for window in bpy.context.window_manager.windows:
+        for area in window.screen.areas:
+            if area.as_pointer() in _switched_areas:
+                area.spaces.active.region_3d.view_perspective = 'CAMERA'
+                area.tag_redraw()
+    _switched_areas.clear()
@@ -4,68 +4,407 @@ import time
 import bpy
 from bpy.app.handlers import persistent
 
+from . import metrics
+from . import profiling
+from . import viewport_preview
+from .camera_controller import CameraController
+from .change_detection import ChangeDetector
+from .channel_schema import ChannelSchema, apply_channels
+from .clock_sync import ClockSync, is_pong
+from .coordinate_mapping import CoordinateMapper
+from .jitter_buffer import JitterBuffer
+from .freed import FreedDecoder, FreedListener, FREED_PORT, ANY_CAMERA
+from .flow_control import FlowController, RateMeter, TickMeter, encode_frame, recv_exact, MAX_FRAME_SIZE
+from .imu_fusion import ImuFusion, decode_items
+from .osc_input import OscListener, OscReceiver, WallClock, OSC_PORT
+from .pose_codec import PoseDecoder, is_codec_frame, resync_message
+from .pose_protocol import CHANNELS_FIELD
+from .replay_buffer import ReplayBuffer
+from .sequencing import SequenceFilter
+from .session import SessionLink, SessionTable, is_hello
+from .take_recorder import TakeRecorder
+
 # WebSocket server variables
 server_thread = None
 server_running = False
 websocket_server = None
 
-def on_message(websocket, message):
-    """Handle incoming WebSocket messages with camera motion data"""
+# Seconds between main-thread apply ticks
+APPLY_INTERVAL = 1.0 / 60.0
+
+# Newest received pose waiting for the main thread; older ones are coalesced away
+pending_pose = None
+pending_lock = threading.Lock()
+
+# Main-thread tick and apply rates, advertised to senders as our capacity
+tick_meter = RateMeter()
+apply_meter = RateMeter()
+
+# What drives the apply loop: 'TIMER' for bpy.app.timers, or 'MODAL' while the
+# camera_motion.apply_loop operator owns it with a window-manager event timer
+apply_loop = 'TIMER'
+
+# Tick interval and jitter of each kind of apply loop, to compare them
+timer_ticks = TickMeter()
+modal_ticks = TickMeter()
+
+# Samples held back to restore order across a sequence gap; 0 only drops stale ones
+REORDER_WINDOW = 0
+
+# Stale-drop and reordering of sequenced poses, shared by all connections so
+# a STREAM arriving over several relays is ordered as one
+sequence_filter = SequenceFilter(window=REORDER_WINDOW)
+
+# Sender sessions that can resume after a reconnect; their sequencing state is
+# kept until they have been gone for session.SESSION_TIMEOUT
+sessions = SessionTable(on_expire=sequence_filter.remove)
+
+# Lens, focus and custom property channels understood besides the pose, from the
+# panel's channel settings; see set_channel_schema
+channel_schema = ChannelSchema()
+
+# Setters of the channels compiled for the current camera, with what they were compiled for
+channel_setters = (None, [])
+
+# Orientation (and optionally position) of each device sending raw IMU samples,
+# configured from the panel's fusion settings
+fusion = ImuFusion()
+
+# FreeD D1 tracking input on its own UDP port, while enabled in the panel
+freed_listener = None
+
+# OSC input from control surfaces on its own UDP port, while enabled in the panel;
+# bundle time tags are wall-clock times
+osc_listener = None
+osc_clock = WallClock()
+
+# Sender-to-Blender coordinate mapping, compiled from the panel's mapping settings
+mapper = CoordinateMapper()
+
+# Every received pose, placed on the scene timeline, while a take is recorded
+recorder = TakeRecorder(channel_schema)
+
+# The last few seconds of received poses, kept at all times for saving after the fact
+replay = ReplayBuffer(schema=channel_schema)
+
+# Holds poses for a steady playout delay when the panel's jitter buffer is on;
+# otherwise the newest pose waits in the pending_pose mailbox
+jitter = JitterBuffer()
+
+# Last pose written to each camera, to skip writes and redraws while the sender holds still
+change_detector = ChangeDetector()
+
+def on_message(websocket, message, decoder=None, stream=None, clock=None, link=None, sampled=False):
+    """Handle incoming WebSocket messages with camera motion data
+    
+    message is a JSON text message or, when the connection has a decoder, may be a
+    binary codec frame. stream identifies the connection for sequenced messages
+    without a STREAM field, clock is its ClockSync for pongs and TS stamps, and
+    link its SessionLink for hellos. sampled says whether the message's stages
+    are profiled. Returns the number of poses received, which is more than one
+    for batch messages.
+    """
     try:
-        # Parse JSON data
-        data = json.loads(message)
-        
-        # Validate required fields
-        required_fields = ['X', 'Y', 'Z', 'ROT_X', 'ROT_Y', 'ROT_Z']
-        for field in required_fields:
-            if field not in data:
-                print(f"Missing required field: {field}")
-                return
-        
-        # Convert string values to float if needed
-        camera_data = {
-            'X': float(data['X']),
-            'Y': float(data['Y']),
-            'Z': float(data['Z']),
-            'ROT_X': float(data['ROT_X']),
-            'ROT_Y': float(data['ROT_Y']),
-            'ROT_Z': float(data['ROT_Z'])
-        }
-        
-        # Apply camera motion in Blender's main thread
-        bpy.app.timers.register(lambda: apply_camera_motion(camera_data))
+        stamps = None
+        if decoder is not None and is_codec_frame(message):
+            # Compact binary frame, already validated; None while waiting for a keyframe
+            if sampled:
+                span = profiling.start_span()
+                pose = decoder.decode(message)
+                profiling.end_span('decode', span)
+            else:
+                pose = decoder.decode(message)
+            poses = [pose] if pose is not None else []
+            if pose is None:
+                metrics.poses_dropped.inc()
+        else:
+            # Parse JSON data
+            if sampled:
+                span = profiling.start_span()
+                data = json.loads(message)
+                profiling.end_span('decode', span)
+            else:
+                data = json.loads(message)
+            
+            # Clock pongs answer our pings and carry no pose
+            if is_pong(data):
+                if clock is not None and clock.on_pong(data):
+                    metrics.clock_round_trip.set(clock.delay)
+                    metrics.clock_drift.set(clock.drift * 1e6)
+                return 0
+            
+            # A sender (re)connecting names its session, which becomes the stream
+            if is_hello(data):
+                if link is not None:
+                    link.on_hello(data, sessions)
+                    if not link.resumed:
+                        # A new session numbers its poses afresh
+                        sequence_filter.remove(link.session)
+                    print(f"Session {link.session} {'resumed' if link.resumed else 'started'}")
+                return 0
+            if link is not None and link.session is not None:
+                stream = link.session
+            
+            # Drop stale samples before spending any work on them
+            items = data if isinstance(data, list) else [data]
+            if sampled:
+                span = profiling.start_span()
+                items = sequence_filter.filter(items, stream)
+                profiling.end_span('filter', span)
+            else:
+                items = sequence_filter.filter(items, stream)
+            
+            # Validate and normalise into Euler, quaternion or matrix poses, fusing raw IMU batches
+            if sampled:
+                span = profiling.start_span()
+                poses, stamps = decode_items(items, stream, fusion, channel_schema)
+                profiling.end_span('validate', span)
+            else:
+                poses, stamps = decode_items(items, stream, fusion, channel_schema)
+        if not poses:
+            return 0
         
-        print(f"Received camera motion: {camera_data}")
+        poses = receive_poses(poses, stamps, clock, sampled)
+        print(f"Received camera motion: {poses[-1]}")
+        return len(poses)
         
     except json.JSONDecodeError as e:
+        metrics.parse_errors.inc()
         print(f"Invalid JSON data: {e}")
     except ValueError as e:
-        print(f"Invalid numeric data: {e}")
+        metrics.parse_errors.inc()
+        print(f"Invalid camera data: {e}")
     except Exception as e:
+        metrics.parse_errors.inc()
         print(f"Error processing message: {e}")
+    return 0
+
+def receive_poses(poses, stamps=None, clock=None, sampled=False):
+    """Map decoded poses, keep them for replay and recording, and hand them to the main thread
+    
+    stamps holds each pose's TS on the sender clock measured by clock, or is None.
+    sampled says whether the stages are profiled. Returns the mapped poses.
+    """
+    # Bring the whole batch into Blender's axes with one stacked matrix multiply
+    if not mapper.identity:
+        if sampled:
+            span = profiling.start_span()
+            poses = mapper.map_poses(poses)
+            profiling.end_span('map', span)
+        else:
+            poses = mapper.map_poses(poses)
+    
+    # Place the poses on our clock; the replay buffer keeps them whether or not a take is recorded
+    now = time.perf_counter()
+    times = capture_times(stamps, clock, now)
+    store_poses(replay, poses, times, now)
+    if recorder.recording:
+        store_poses(recorder, poses, times, now)
+    
+    # Hand the poses to Blender's main thread
+    metrics.poses_received.inc(len(poses))
+    if sampled:
+        span = profiling.start_span()
+    if jitter.enabled:
+        jitter.push(poses, times, now)
+    else:
+        # Only the newest is applied; the rest of a batch is superseded
+        metrics.poses_dropped.inc(len(poses) - 1)
+        queue_pose(poses[-1])
+    if sampled:
+        profiling.end_span('queue', span)
+    return poses
+
+def store_poses(store, poses, times, now):
+    """Add received poses to the take recorder or replay buffer at their capture time
+    
+    times comes from capture_times(); TS stamps are used once the sender's clock is
+    synchronised, and until then, and for unstamped poses, the arrival time now is
+    the best estimate.
+    """
+    for i, pose in enumerate(poses):
+        local_time = times[i] if times is not None else None
+        store.add(local_time if local_time is not None else now, pose)
+
+def capture_times(stamps, clock, now=None):
+    """Our clock's time for each TS stamp, None where a pose has none
+    
+    Returns None until the sender's clock is synchronised.
+    """
+    if stamps is None or clock is None or not clock.synced:
+        return None
+    now = time.perf_counter() if now is None else now
+    return [clock.to_local(stamp, now) if stamp is not None else None for stamp in stamps]
+
+def queue_pose(pose):
+    """Store a pose for the next main-thread tick, replacing any unapplied one"""
+    global pending_pose
+    with pending_lock:
+        if pending_pose is not None:
+            metrics.poses_dropped.inc()
+        pending_pose = pose
+    metrics.queue_depth.set(1)
+
+def apply_pending_pose():
+    """Timer callback that applies the newest pending pose once per tick"""
+    if not server_running:
+        return None
+    
+    apply_tick(timer_ticks)
+    return APPLY_INTERVAL
+
+def apply_tick(ticks, context=None):
+    """Apply whatever is due on one tick of the apply loop; returns True if a pose was applied"""
+    global pending_pose
+    tick_meter.add()
+    ticks.add()
+    metrics.tick_jitter.set(ticks.jitter)
+    if jitter.enabled:
+        # Release on this steady tick whatever the playout delay has made due
+        pose = jitter.pop()
+        metrics.queue_depth.set(len(jitter))
+        metrics.jitter_delay.set(jitter.delay)
+    else:
+        with pending_lock:
+            pose, pending_pose = pending_pose, None
+        if pose is not None:
+            metrics.queue_depth.set(0)
+    
+    if pose is None:
+        return False
+    start = time.perf_counter_ns()
+    apply_camera_motion(pose, context)
+    metrics.apply_time.observe(time.perf_counter_ns() - start)
+    metrics.poses_applied.inc()
+    apply_meter.add()
+    return True
 
-def apply_camera_motion(data):
+def start_apply_timer():
+    """Start the main-thread timer that drains the pose mailbox"""
+    if not bpy.app.timers.is_registered(apply_pending_pose):
+        timer_ticks.restart()
+        bpy.app.timers.register(apply_pending_pose, first_interval=APPLY_INTERVAL)
+
+def set_apply_loop(loop):
+    """Hand the apply loop to the modal operator ('MODAL') or back to the timer ('TIMER')
+    
+    The modal operator ends itself once the loop is no longer 'MODAL'.
+    """
+    global apply_loop
+    apply_loop = loop
+    if loop == 'MODAL':
+        modal_ticks.restart()
+        if bpy.app.timers.is_registered(apply_pending_pose):
+            bpy.app.timers.unregister(apply_pending_pose)
+    elif server_running:
+        start_apply_timer()
+
+def set_channel_schema(schema):
+    """Decode, record and replay the channels of a new ChannelSchema
+    
+    Poses in flight keep the old layout; the replay buffer starts over.
+    """
+    global channel_schema
+    if schema == channel_schema:
+        return
+    channel_schema = schema
+    recorder.schema = schema
+    replay.resize(replay.seconds, schema)
+    if freed_listener:
+        decoder = freed_listener.decoder
+        freed_listener.decoder = FreedDecoder(schema, decoder.zoom, decoder.focus)
+    if osc_listener:
+        try:
+            osc_listener.receiver = OscReceiver(osc_listener.receiver.routes, schema)
+        except ValueError as e:
+            # A route to a channel that is no longer declared
+            print(f"OSC routes no longer fit the channels: {e}")
+
+def apply_pose_channels(camera, channels):
+    """Write a pose's channels to the camera with setters compiled once per camera and schema"""
+    global channel_setters
+    key = (camera.as_pointer(), camera.data.as_pointer() if camera.data else 0, channel_schema)
+    if channel_setters[0] != key:
+        channel_setters = (key, channel_schema.compile_setters(camera))
+    if len(channels) == len(channel_schema):
+        apply_channels(channel_setters[1], channels)
+
+def poll_session(link):
+    """Welcome or acknowledgement due on a connection, if any"""
+    if link.session is None:
+        return None
+    return link.poll(sequence_filter.last_sequence(link.session), recorder.recording)
+
+def new_flow_controller():
+    """Create the rate negotiation state for one sender connection"""
+    return FlowController(tick_meter, preserve_samples=lambda: recorder.recording)
+
+def apply_camera_motion(data, context=None):
     """Apply camera motion data to the active camera"""
     try:
-        scene = bpy.context.scene
+        context = context or bpy.context
+        scene = context.scene
         if not scene.camera:
             print("No active camera in scene")
             return
         
         camera = scene.camera
+        sampled = profiling.enabled and profiling.sample()
         
-        # Set location
-        camera.location = (data['X'], data['Y'], data['Z'])
+        # Follow the mapping's anchor object; the mapping only recompiles when it moved
+        settings = getattr(scene, 'camera_motion', None)
+        if settings is not None:
+            anchor = settings.mapping_anchor
+            mapper.set_anchor(anchor.matrix_world if anchor else None)
         
-        # Set rotation (in radians)
-        camera.rotation_euler = (data['ROT_X'], data['ROT_Y'], data['ROT_Z'])
+        # Within the dead-band of the last written pose: no RNA write, no redraw
+        if not change_detector.changed(camera.name, data):
+            metrics.writes_skipped.inc()
+            if (settings is not None and settings.viewport_preview
+                    and viewport_preview.commit_due(settings.commit_rate)):
+                viewport_preview.commit(camera)
+            return
+        
+        # Lens, focus and custom channels go straight to their properties
+        channels = data.get(CHANNELS_FIELD)
+        if channels is not None:
+            apply_pose_channels(camera, channels)
+        
+        # Preview mode moves the viewports only and commits the camera less often
+        if settings is not None and settings.viewport_preview:
+            if sampled:
+                span = profiling.start_span()
+                viewport_preview.show_pose(camera, data)
+                profiling.end_span('preview_viewport', span)
+            else:
+                viewport_preview.show_pose(camera, data)
+            
+            if viewport_preview.commit_due(settings.commit_rate):
+                if sampled:
+                    span = profiling.start_span()
+                    viewport_preview.commit(camera)
+                    profiling.end_span('apply_camera_motion', span)
+                else:
+                    viewport_preview.commit(camera)
+            return
+        
+        # Set location and rotation in the pose's own rotation form
+        if sampled:
+            span = profiling.start_span()
+            CameraController.set_camera_pose(camera, data)
+            profiling.end_span('apply_camera_motion', span)
+        else:
+            CameraController.set_camera_pose(camera, data)
         
         # Update the viewport
-        for area in bpy.context.screen.areas:
-            if area.type == 'VIEW_3D':
-                area.tag_redraw()
+        if sampled:
+            span = profiling.start_span()
+            CameraController.update_viewport(context)
+            profiling.end_span('update_viewport', span)
+        else:
+            CameraController.update_viewport(context)
         
-        print(f"Applied camera motion: Location={camera.location}, Rotation={camera.rotation_euler}")
+        print(f"Applied camera motion: {data}")
         
     except Exception as e:
         print(f"Error applying camera motion: {e}")
@@ -86,16 +425,46 @@ def start_websocket_server():
         def server_handler(websocket, path):
             """Handle WebSocket connections"""
             print(f"Client connected from {websocket.remote_address}")
+            flow = new_flow_controller()
+            decoder = PoseDecoder(channel_schema)
+            clock = ClockSync()
+            link = SessionLink()
+            client = metrics.registry.client(websocket.remote_address)
+            countdown = profiling.sample_interval()
             try:
                 while True:
                     message = websocket.recv()
                     if message is None:
                         break
-                    on_message(websocket, message)
+                    # Profile one message in sample_every, counting down here
+                    countdown -= 1
+                    if countdown:
+                        sampled = False
+                    else:
+                        countdown = profiling.sample_interval()
+                        sampled = profiling.enabled
+                    count = on_message(websocket, message, decoder, websocket.remote_address, clock, link,
+                                       sampled)
+                    client.add(count)
+                    advice = flow.on_receive(count)
+                    if advice:
+                        websocket.send(json.dumps(advice))
+                    if decoder.take_resync_request():
+                        websocket.send(json.dumps(resync_message()))
+                    ping = clock.poll()
+                    if ping:
+                        websocket.send(json.dumps(ping))
+                    reply = poll_session(link)
+                    if reply:
+                        websocket.send(json.dumps(reply))
             except websocket.WebSocketConnectionClosedException:
                 print("Client disconnected")
             except Exception as e:
                 print(f"WebSocket error: {e}")
+            finally:
+                metrics.registry.remove_client(websocket.remote_address)
+                sequence_filter.remove(websocket.remote_address)
+                link.close(sessions)
         
         # Start server in a separate thread
         def run_server():
@@ -136,42 +505,158 @@ def start_simple_server():
                 try:
                     conn, addr = sock.accept()
                     print(f"Client connected from {addr}")
+                    flow = new_flow_controller()
+                    decoder = PoseDecoder(channel_schema)
+                    clock = ClockSync()
+                    link = SessionLink()
+                    client_id = f"{addr[0]}:{addr[1]}"
+                    client = metrics.registry.client(client_id)
+                    countdown = profiling.sample_interval()
                     
                     with conn:
                         while server_running:
                             try:
                                 # Receive data length (4 bytes)
-                                data_len = conn.recv(4)
-                                if not data_len:
+                                data_len = recv_exact(conn, 4)
+                                if data_len is None:
                                     break
                                 
+                                # Profile one frame in sample_every, counting down here
+                                countdown -= 1
+                                if countdown:
+                                    sampled = False
+                                else:
+                                    countdown = profiling.sample_interval()
+                                    sampled = profiling.enabled
+                                
+                                # Time from a complete length prefix to the full frame
+                                if sampled:
+                                    span = profiling.start_span()
                                 length = struct.unpack('!I', data_len)[0]
+                                if length > MAX_FRAME_SIZE:
+                                    # Corrupt prefix: the rest of the stream can't be framed
+                                    metrics.parse_errors.inc()
+                                    print(f"Dropping {client_id}: frame length {length} is over the limit")
+                                    break
                                 
-                                # Receive JSON data
-                                data = conn.recv(length)
-                                if not data:
+                                # Receive JSON data or a binary codec frame
+                                data = recv_exact(conn, length)
+                                if data is None:
                                     break
+                                if sampled:
+                                    profiling.end_span('receive', span)
+                            except OSError as e:
+                                print(f"Connection error: {e}")
+                                break
+                            
+                            try:
+                                count = on_message(None, data, decoder, client_id, clock, link, sampled)
+                                client.add(count)
+                                advice = flow.on_receive(count)
                                 
-                                message = data.decode('utf-8')
-                                on_message(None, message)
+                                # Tell the sender how fast we are really applying poses
+                                if advice:
+                                    conn.sendall(encode_frame(advice))
                                 
-                            except Exception as e:
-                                print(f"Error handling client: {e}")
-                                break
+                                # Ask for a keyframe after lost codec frames
+                                if decoder.take_resync_request():
+                                    conn.sendall(encode_frame(resync_message()))
+                                
+                                # Measure the sender's clock for frame-accurate recording
+                                ping = clock.poll()
+                                if ping:
+                                    conn.sendall(encode_frame(ping))
                                 
+                                # Welcome a resuming sender and acknowledge what was delivered
+                                reply = poll_session(link)
+                                if reply:
+                                    conn.sendall(encode_frame(reply))
+                                
+                            except OSError as e:
+                                print(f"Connection error: {e}")
+                                break
+                            except Exception as e:
+                                # One bad frame must not cost the sender its connection
+                                metrics.parse_errors.inc()
+                                print(f"Error handling frame: {e}")
+                    
+                    metrics.registry.remove_client(client_id)
+                    sequence_filter.remove(client_id)
+                    link.close(sessions)
+                    
+                except OSError as e:
+                    if not server_running:
+                        break
+                    # e.g. out of file descriptors; back off and keep serving
+                    print(f"Server error: {e}")
+                    time.sleep(0.1)
                 except Exception as e:
-                    if server_running:
-                        print(f"Server error: {e}")
-                    break
+                    print(f"Server error: {e}")
             
             sock.close()
             
         except Exception as e:
             print(f"Failed to start simple server: {e}")
     
+    # Set before the thread starts, whose accept loop runs while this is true
+    server_running = True
     server_thread = threading.Thread(target=simple_server, daemon=True)
     server_thread.start()
-    server_running = True
+
+def start_freed_listener(port=FREED_PORT, camera_id=ANY_CAMERA, zoom=None, focus=None):
+    """Receive FreeD D1 packets into the same pipeline as WebSocket poses
+    
+    zoom and focus are freed.Calibrations for the LENS and FOCUS channels.
+    Raises OSError if the port can't be bound.
+    """
+    global freed_listener
+    stop_freed_listener()
+    decoder = FreedDecoder(channel_schema, zoom, focus)
+    listener = FreedListener(on_freed_poses, port=port, camera_id=camera_id, decoder=decoder)
+    listener.start()
+    freed_listener = listener
+    print(f"FreeD listener started on UDP port {port}")
+
+def stop_freed_listener():
+    """Stop receiving FreeD packets"""
+    global freed_listener
+    if freed_listener:
+        freed_listener.stop()
+        freed_listener = None
+        print("FreeD listener stopped")
+
+def on_freed_poses(camera_id, poses):
+    """Feed the poses of one FreeD datagram into the pipeline; runs on the listener thread"""
+    metrics.registry.client(f"FreeD camera {camera_id}").add(len(poses))
+    receive_poses(poses, sampled=profiling.enabled and profiling.sample())
+
+def start_osc_listener(port=OSC_PORT, routes=None):
+    """Receive OSC into the same pipeline as WebSocket poses
+    
+    routes is a list of (address, fields) pairs from osc_input.parse_routes.
+    Raises ValueError for routes to unknown fields and OSError if the port
+    can't be bound.
+    """
+    global osc_listener
+    receiver = OscReceiver(routes, channel_schema)
+    stop_osc_listener()
+    listener = OscListener(on_osc_poses, port=port, receiver=receiver)
+    listener.start()
+    osc_listener = listener
+    print(f"OSC listener started on UDP port {port}")
+
+def stop_osc_listener():
+    """Stop receiving OSC"""
+    global osc_listener
+    if osc_listener:
+        osc_listener.stop()
+        osc_listener = None
+        print("OSC listener stopped")
+
+def on_osc_poses(poses, stamps):
+    """Feed the poses of one OSC datagram into the pipeline; runs on the listener thread"""
+    metrics.registry.client("OSC").add(len(poses))
+    receive_poses(poses, stamps, osc_clock, profiling.enabled and profiling.sample())
 
 def stop_websocket_server():
     """Stop the WebSocket server"""
@@ -179,6 +664,13 @@ def stop_websocket_server():
     
     server_running = False
     
+    if bpy.app.timers.is_registered(apply_pending_pose):
+        bpy.app.timers.unregister(apply_pending_pose)
+    stop_freed_listener()
+    stop_osc_listener()
+    jitter.reset()
+    fusion.reset()
+    
     if websocket_server:
         try:
             websocket_server.close()
@@ -195,6 +687,7 @@ def stop_websocket_server():
 def start_server():
     """Start the WebSocket server"""
     start_websocket_server()
+    start_apply_timer()
 
 def stop_server():
     """Stop the WebSocket server"""